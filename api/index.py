@@ -1,18 +1,37 @@
 import os
 import json
-from typing import List
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
-from pydantic import BaseModel
-from dotenv import load_dotenv
-from fastapi import FastAPI, Query, UploadFile, File, Form
-from fastapi.responses import StreamingResponse
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import TYPE_CHECKING, List, Optional
+from pydantic import BaseModel, Field, ValidationError
+from fastapi import FastAPI, Query, UploadFile, File, Form, Header, WebSocket, WebSocketDisconnect
+from fastapi import Request as HTTPRequest
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
-from .utils.prompt import ClientMessage, convert_to_openai_messages, ensure_allowed_model
-from .utils.tools import get_current_weather, evaluate_rizz, generate_rizz_image, transcribe_audio, simulate_date, generate_speech
+# Loads .env.local, so it has to come before the modules that read their settings from the environment
+from .utils.clients import openai_client
+from .utils.prompt import ClientMessage, convert_to_openai_messages
+from .utils.router import get_router, model_route, router_snapshot
+from .utils.registry import ToolRegistry
+from .utils.admission import AdmissionRejected, admission_snapshot, get_limiter, hold_slot
+from .utils.bulkheads import bulkhead_snapshot, get_bulkhead, tool_bulkhead
+from .utils.resilience import breaker_snapshot, call_upstream
+from .utils.deadline import DEADLINE_HEADER, Deadline, DeadlineExceeded, current_deadline, route_deadline, stage_timeout, use_deadline
+from .utils.event_loop import submit_coroutine
+from .utils.cache import get_cache
+from .utils.partial_json import PartialJSONParser
+from .utils.jobs import SLOW_TOOLS, get_job_runner, job_reference
+from .utils.fallback_images import get_fallback_image, prewarm_fallback_images, rendered_fallback_image
+from .utils.image_cache import DEFAULT_WIDTH, get_derivative, negotiate_format
+from .utils.profiling import ProfilingMiddleware, profiling_enabled
 
+if TYPE_CHECKING:
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
-load_dotenv(".env.local")
 
 app = FastAPI()
 
@@ -24,22 +43,53 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+# Only installed when PROFILE_TOKEN or PROFILE_SAMPLE_RATE is set, so unprofiled
+# deployments don't pay for it at all
+if profiling_enabled():
+    app.add_middleware(ProfilingMiddleware)
+
+# Tools with a coroutine version in utils/async_tools.py run that on a shared event loop
+# instead, so calls waiting on upstream APIs don't each hold a thread
+ASYNC_TOOLS = os.environ.get("ASYNC_TOOLS", "1").lower() in ("1", "true", "yes")
+
+# Completions per /api/chat request: above 1 the server feeds tool results back to the
+# model and streams its follow-up itself (override per request with ?max_steps=)
+CHAT_MAX_STEPS = int(os.environ.get("CHAT_MAX_STEPS", "1"))
+CHAT_MAX_STEPS_LIMIT = 8
+# Longer strings in tool results are left out of what is sent back to the model
+MAX_TOOL_RESULT_STRING = 2000
+
+# How often a cancellable stream waiting on a tool result checks whether it was cancelled
+CANCEL_POLL_INTERVAL = 0.1
+
+# Run slow tools as background jobs by default instead of inline in the stream
+TOOL_JOB_MODE = os.environ.get("TOOL_JOB_MODE", "").lower() in ("1", "true", "yes")
+JOB_POLL_INTERVAL = 0.5
+
+
+# Conversations one WebSocket connection may stream at the same time
+WS_MAX_CONVERSATIONS = int(os.environ.get("WS_MAX_CONVERSATIONS", "8"))
 
 
 class Request(BaseModel):
     messages: List[ClientMessage]
 
 
-available_tools = {
-    "get_current_weather": get_current_weather,
-    "evaluate_rizz": evaluate_rizz,
-    "generate_rizz_image": generate_rizz_image,
-    "transcribe_audio": transcribe_audio,
-    "simulate_date": simulate_date,
-}
+class WebSocketChat(BaseModel):
+    conversationId: str
+    messages: List[ClientMessage]
+    maxSteps: int = Field(CHAT_MAX_STEPS, ge=1, le=CHAT_MAX_STEPS_LIMIT)
+    jobs: bool = TOOL_JOB_MODE
+
+
+# Tools are imported on first use so the cold start doesn't pay for them
+available_tools = ToolRegistry({
+    "get_current_weather": ".tools:get_current_weather",
+    "evaluate_rizz": ".tools:evaluate_rizz",
+    "generate_rizz_image": ".tools:generate_rizz_image",
+    "transcribe_audio": ".tools:transcribe_audio",
+    "simulate_date": ".tools:simulate_date",
+}, async_module=".async_tools" if ASYNC_TOOLS else None)
 
 # Shared tool definitions to avoid duplication
 tool_definitions = [
@@ -146,20 +196,177 @@ tool_definitions = [
     }
 ]
 
-def do_stream(messages: List[ChatCompletionMessageParam]):
-    stream = client.chat.completions.create(
-        messages=messages,
-        model=ensure_allowed_model("gpt-3.5-turbo"),
-        max_tokens=500,
-        stream=True,
-        tools=tool_definitions
-    )
+def run_tool(name, arguments):
+    """Runs a registered tool under its concurrency limit and the current deadline"""
+    if available_tools.async_variant(name):
+        # Only this thread waits, the tool itself runs on the shared event loop
+        return submit_coroutine(run_tool_async(name, arguments, current_deadline())).result()
+    with get_limiter(f"tool:{name}").slot():
+        return available_tools[name](**arguments)
+
+async def run_tool_async(name, arguments, deadline):
+    """Runs the async variant of a tool under its concurrency limit and the given deadline"""
+    limiter = get_limiter(f"tool:{name}")
+    with use_deadline(deadline):
+        await limiter.acquire_async()
+        started = time.monotonic()
+        try:
+            return await available_tools.async_variant(name)(**arguments)
+        finally:
+            limiter.release(time.monotonic() - started)
 
-    return stream
+def submit_tool_call(name, arguments, deadline, use_jobs=False):
+    """
+    Starts one tool call from the model
 
-def stream_text(messages: List[ChatCompletionMessageParam], protocol: str = 'data'):
+    Tools with an async variant run it on the shared event loop; the rest (and
+    slow tools started as jobs) go through call_tool on the tool's bulkhead, so
+    they can start while the model is still streaming.
+
+    Returns:
+        concurrent.futures.Future: The result of the call, which fails with
+        AdmissionRejected if the bulkhead is full
+    """
+    if name in available_tools and not (use_jobs and name in SLOW_TOOLS) and available_tools.async_variant(name):
+        return submit_coroutine(call_tool_async(name, arguments, deadline))
+    try:
+        return tool_bulkhead(name).submit(call_tool, name, arguments, deadline, use_jobs)
+    except AdmissionRejected as e:
+        # Reported as this call's result rather than failing the whole stream
+        future = Future()
+        future.set_exception(e)
+        return future
+
+async def call_tool_async(name, arguments, deadline):
+    # Parsed here so that bad arguments fail the call, like in call_tool, rather than the stream
+    return await run_tool_async(name, json.loads(arguments), deadline)
+
+def call_tool(name, arguments, deadline, use_jobs=False):
+    """
+    Runs one tool call from the model, on the tool's bulkhead
+
+    Args:
+        name (str): Tool name
+        arguments (str): The JSON arguments as streamed by the model
+        deadline (Deadline): Deadline of the chat request
+        use_jobs (bool): Start slow tools as background jobs instead
+
+    Returns:
+        dict: The tool result, or a reference to the job to poll for it
+    """
+    if name not in available_tools:
+        return {"error": f"Tool {name} not found"}
+    arguments = json.loads(arguments)
+    if use_jobs and name in SLOW_TOOLS:
+        # Hand slow tools to the job pool and let the client poll for the result
+        job_id = get_job_runner().submit(name, lambda: run_tool(name, arguments))
+        return job_reference(job_id)
+    with use_deadline(deadline):
+        return run_tool(name, arguments)
+
+def compact_tool_result(result):
+    """A tool result with long strings (base64 audio, data URLs) cut out, for sending back to the model"""
+    if isinstance(result, dict):
+        return {key: compact_tool_result(value) for key, value in result.items()}
+    if isinstance(result, list):
+        return [compact_tool_result(value) for value in result]
+    if isinstance(result, str) and len(result) > MAX_TOOL_RESULT_STRING:
+        return f"[{len(result)} characters omitted]"
+    return result
+
+def tool_step_messages(text, tool_calls):
+    """The assistant message with its tool calls, followed by their results, for the model's next step"""
+    return [
+        {
+            "role": "assistant",
+            "content": text or None,
+            "tool_calls": [
+                {
+                    "id": tool_call["id"],
+                    "type": "function",
+                    "function": {"name": tool_call["name"], "arguments": tool_call["arguments"]},
+                }
+                for tool_call in tool_calls
+            ],
+        },
+        *(
+            {
+                "role": "tool",
+                "tool_call_id": tool_call["id"],
+                "content": json.dumps(compact_tool_result(tool_call["result"])),
+            }
+            for tool_call in tool_calls
+        ),
+    ]
+
+class StreamCancelled(Exception):
+    """Raised inside stream_text once its cancel event is set"""
+
+def wait_for_tool(future, deadline, cancel=None):
+    """The result of a tool call's future, waiting until the deadline or until the stream is cancelled"""
+    if cancel is None:
+        return future.result(timeout=max(deadline.remaining(), 0))
+    while True:
+        try:
+            return future.result(timeout=min(CANCEL_POLL_INTERVAL, max(deadline.remaining(), 0)))
+        except FutureTimeoutError:
+            if cancel.is_set():
+                raise StreamCancelled()
+            if deadline.expired():
+                raise
+
+def tool_call_delta_frame(tool_call):
+    """Frame carrying the arguments text of a streaming tool call that the client hasn't seen yet"""
+    frame = 'c:{{"toolCallId":"{id}","argsTextDelta":{delta}}}\n'.format(
+        id=tool_call["id"],
+        delta=json.dumps(tool_call["unsent"]))
+    tool_call["unsent"] = ""
+    tool_call["sent_changes"] = tool_call["parser"].changes
+    return frame
+
+def stream_text(
+    messages: List["ChatCompletionMessageParam"],
+    protocol: str = 'data',
+    deadline: Optional[Deadline] = None,
+    use_jobs: bool = False,
+    max_steps: int = 1,
+    cancel: Optional[threading.Event] = None,
+):
+    """
+    Streams a chat completion as data stream frames, running any requested tools
+
+    The deadline bounds the whole turn: the completion and every tool get the
+    remaining budget as their timeout. Generator resumes may run on different
+    threads, so it is installed around each blocking section rather than once.
+    With use_jobs, slow tools are started as background jobs and their result
+    frame carries the job ID to poll instead of the tool output.
+    Tool call arguments are streamed as partial-call frames while the model
+    writes them, so the client can render them before the call is complete.
+    Each tool starts as soon as its arguments are complete (the JSON closed or
+    the next call began), overlapping with the rest of the model's output, and
+    the results are sent in call order once the model is done.
+    With max_steps above 1, tool results are fed back to the model and its
+    follow-up streams on the same response, up to max_steps completions, so
+    the client doesn't have to send the whole history again to get it.
+    Setting cancel stops the stream at the next chunk: the upstream response
+    is closed so the model stops generating, and queued tool calls are dropped.
+    """
+    deadline = deadline or route_deadline("chat")
     draft_tool_calls = []
-    draft_tool_calls_index = -1
+    finish_reason = "stop"
+    total_prompt_tokens = 0
+    total_completion_tokens = 0
+
+    def start_tool_call(tool_call):
+        """Sends the rest of a call's arguments and its call frame, and starts running it"""
+        if tool_call["unsent"]:
+            yield tool_call_delta_frame(tool_call)
+        tool_call["future"] = submit_tool_call(
+            tool_call["name"], tool_call["arguments"], deadline, use_jobs)
+        yield '9:{{"toolCallId":"{id}","toolName":"{name}","args":{args}}}\n'.format(
+            id=tool_call["id"],
+            name=tool_call["name"],
+            args=tool_call["arguments"])
 
     try:
         print(f"[DEBUG] Creating OpenAI stream with {len(messages)} messages")
@@ -168,83 +375,152 @@ def stream_text(messages: List[ChatCompletionMessageParam], protocol: str = 'dat
         api_key = os.environ.get("OPENAI_API_KEY", "")
         print(f"[DEBUG] Using OpenAI API key of length: {len(api_key)}")
         print(f"[DEBUG] API key starts with: {api_key[:4]}...")
-        
-        stream = client.chat.completions.create(
-            messages=messages,
-            model=ensure_allowed_model("gpt-3.5-turbo"),
-            max_tokens=300,  # Further limit token output
-            stream=True,
-            tools=tool_definitions
-        )
-        
-        print("[DEBUG] Stream created successfully")
-
-        for chunk in stream:
-            # Debug chunk info
-            if hasattr(chunk, 'id'):
-                print(f"[DEBUG] Processing chunk: {chunk.id[:8]}...")
-                
-            for choice in chunk.choices:
-                if choice.finish_reason == "stop":
-                    continue
 
-                elif choice.finish_reason == "tool_calls":
-                    for tool_call in draft_tool_calls:
-                        yield '9:{{"toolCallId":"{id}","toolName":"{name}","args":{args}}}\n'.format(
-                            id=tool_call["id"],
-                            name=tool_call["name"],
-                            args=tool_call["arguments"])
-
-                    for tool_call in draft_tool_calls:
-                        try:
-                            # Safely execute the tool call with error handling
-                            if tool_call["name"] in available_tools:
-                                tool_result = available_tools[tool_call["name"]](
-                                    **json.loads(tool_call["arguments"]))
-                            else:
-                                tool_result = {"error": f"Tool {tool_call['name']} not found"}
-                            
+        for step in range(max_steps):
+            if cancel is not None and cancel.is_set():
+                raise StreamCancelled()
+            draft_tool_calls = []
+            draft_tool_calls_index = -1
+            text_parts = []
+
+            route = model_route("chat")
+            requested_at = time.monotonic()
+            try:
+                with use_deadline(deadline):
+                    stream = call_upstream(
+                        f"openai:{route['model']}",
+                        lambda: openai_client().chat.completions.create(
+                            messages=messages,
+                            **route,
+                            stream=True,
+                            stream_options={"include_usage": True},
+                            tools=tool_definitions,
+                            timeout=stage_timeout(30, "chat completion")
+                        ),
+                        rate_limit="openai-chat",
+                    )
+            except Exception as e:
+                get_router().record("chat", route["model"], time.monotonic() - requested_at, e)
+                raise
+            
+            print(f"[DEBUG] Stream created successfully (step {step + 1} of {max_steps}, {route['model']})")
+
+            for chunk in stream:
+                if requested_at is not None:
+                    # The chat's latency target is time to first token
+                    get_router().record("chat", route["model"], time.monotonic() - requested_at)
+                    requested_at = None
+                if cancel is not None and cancel.is_set():
+                    # Closing the response makes the upstream stop generating tokens
+                    getattr(stream, "close", lambda: None)()
+                    raise StreamCancelled()
+                if deadline.expired():
+                    raise DeadlineExceeded("the response finished streaming")
+
+                # Debug chunk info
+                if hasattr(chunk, 'id'):
+                    print(f"[DEBUG] Processing chunk: {chunk.id[:8]}...")
+                    
+                for choice in chunk.choices:
+                    if choice.finish_reason == "stop":
+                        continue
+
+                    elif choice.finish_reason == "tool_calls":
+                        # Start whatever hasn't been started yet, i.e. the last call
+                        for tool_call in draft_tool_calls:
+                            if tool_call["future"] is None:
+                                yield from start_tool_call(tool_call)
+
+                        for tool_call in draft_tool_calls:
+                            try:
+                                tool_result = wait_for_tool(tool_call["future"], deadline, cancel)
+                                result = json.dumps(tool_result)
+                            except StreamCancelled:
+                                raise
+                            except AdmissionRejected as e:
+                                # Too many concurrent runs of this tool, tell the client when to retry
+                                tool_result = {"error": str(e), "retry_after": e.retry_after}
+                                result = json.dumps(tool_result)
+                            except FutureTimeoutError:
+                                tool_result = {"error": str(DeadlineExceeded(tool_call["name"]))}
+                                result = json.dumps(tool_result)
+                            except Exception as e:
+                                # Return error as the tool result
+                                tool_result = {"error": str(e)}
+                                result = json.dumps(tool_result)
+
+                            tool_call["result"] = tool_result
                             yield 'a:{{"toolCallId":"{id}","toolName":"{name}","args":{args},"result":{result}}}\n'.format(
                                 id=tool_call["id"],
                                 name=tool_call["name"],
                                 args=tool_call["arguments"],
-                                result=json.dumps(tool_result))
-                        except Exception as e:
-                            # Return error as the tool result
-                            yield 'a:{{"toolCallId":"{id}","toolName":"{name}","args":{args},"result":{{"error":"{error}"}}}}\n'.format(
-                                id=tool_call["id"],
-                                name=tool_call["name"],
-                                args=tool_call["arguments"],
-                                error=str(e).replace('"', '\\"'))
+                                result=result)
 
-                elif choice.delta.tool_calls:
-                    for tool_call in choice.delta.tool_calls:
-                        id = tool_call.id
-                        name = tool_call.function.name
-                        arguments = tool_call.function.arguments
+                    elif choice.delta.tool_calls:
+                        for tool_call in choice.delta.tool_calls:
+                            id = tool_call.id
+                            name = tool_call.function.name
+                            arguments = tool_call.function.arguments
 
-                        if (id is not None):
-                            draft_tool_calls_index += 1
-                            draft_tool_calls.append(
-                                {"id": id, "name": name, "arguments": ""})
+                            if (id is not None):
+                                # The previous call's arguments are as complete as they'll get
+                                if draft_tool_calls and draft_tool_calls[-1]["future"] is None:
+                                    yield from start_tool_call(draft_tool_calls[-1])
 
-                        else:
-                            draft_tool_calls[draft_tool_calls_index]["arguments"] += arguments
+                                draft_tool_calls_index += 1
+                                draft_tool_calls.append({
+                                    "id": id, "name": name, "arguments": "", "future": None,
+                                    "parser": PartialJSONParser(), "unsent": "", "sent_changes": 0})
+                                # Lets the client show the call in the partial-call state right away
+                                yield 'b:{{"toolCallId":"{id}","toolName":"{name}"}}\n'.format(id=id, name=name)
 
-                else:
-                    yield '0:{text}\n'.format(text=json.dumps(choice.delta.content))
-
-            if chunk.choices == []:
-                usage = chunk.usage
-                prompt_tokens = usage.prompt_tokens
-                completion_tokens = usage.completion_tokens
-
-                yield 'e:{{"finishReason":"{reason}","usage":{{"promptTokens":{prompt},"completionTokens":{completion}}},"isContinued":false}}\n'.format(
-                    reason="tool-calls" if len(
-                        draft_tool_calls) > 0 else "stop",
-                    prompt=prompt_tokens,
-                    completion=completion_tokens
-                )
+                            if arguments:
+                                draft_tool_call = draft_tool_calls[draft_tool_calls_index]
+                                draft_tool_call["arguments"] += arguments
+                                draft_tool_call["unsent"] += arguments
+                                draft_tool_call["parser"].feed(arguments)
+                                # Deltas that only add keys or punctuation don't change what the
+                                # client can show, so they go out with the next one that does
+                                parser = draft_tool_call["parser"]
+                                if parser.complete and draft_tool_call["future"] is None:
+                                    # Run the tool while the model is still writing the rest of the turn
+                                    yield from start_tool_call(draft_tool_call)
+                                elif parser.changes > draft_tool_call["sent_changes"]:
+                                    yield tool_call_delta_frame(draft_tool_call)
+
+                    elif choice.delta.content:
+                        # Role-only and finishing chunks carry no text, and a 0:null
+                        # frame would break clients that concatenate the deltas
+                        text_parts.append(choice.delta.content)
+                        yield '0:{text}\n'.format(text=json.dumps(choice.delta.content))
+
+                if chunk.choices == []:
+                    usage = chunk.usage
+                    prompt_tokens = usage.prompt_tokens
+                    completion_tokens = usage.completion_tokens
+                    total_prompt_tokens += prompt_tokens
+                    total_completion_tokens += completion_tokens
+
+                    yield 'e:{{"finishReason":"{reason}","usage":{{"promptTokens":{prompt},"completionTokens":{completion}}},"isContinued":false}}\n'.format(
+                        reason="tool-calls" if len(
+                            draft_tool_calls) > 0 else "stop",
+                        prompt=prompt_tokens,
+                        completion=completion_tokens
+                    )
+
+            finish_reason = "tool-calls" if draft_tool_calls else "stop"
+            if not draft_tool_calls:
+                break
+            # Continue the conversation with the tool results for the model's follow-up
+            messages = messages + tool_step_messages("".join(text_parts), draft_tool_calls)
+
+        yield 'd:{{"finishReason":"{reason}","usage":{{"promptTokens":{prompt},"completionTokens":{completion}}}}}\n'.format(
+            reason=finish_reason,
+            prompt=total_prompt_tokens,
+            completion=total_completion_tokens
+        )
+    except StreamCancelled:
+        print("[DEBUG] Stream cancelled by the client")
     except Exception as e:
         # Handle any exceptions in the streaming process
         error_message = str(e)
@@ -252,18 +528,63 @@ def stream_text(messages: List[ChatCompletionMessageParam], protocol: str = 'dat
             yield 'e:{{"finishReason":"context-length-exceeded","error":"Message context too long, please start a new chat"}}\n'
         else:
             yield 'e:{{"finishReason":"error","error":"{0}"}}\n'.format(error_message.replace('"', '\\"'))
+    finally:
+        # Calls still queued are of no use once the stream has ended early
+        for tool_call in draft_tool_calls:
+            if tool_call["future"] is not None:
+                tool_call["future"].cancel()
+
+
+async def convert_messages(messages: List[ClientMessage]):
+    """
+    convert_to_openai_messages without blocking the event loop: attachments are
+    decoded, downscaled and looked up in the cache on the media bulkhead
+
+    Raises:
+        AdmissionRejected: There are attachments and the media bulkhead is full
+    """
+    if not any(message.experimental_attachments for message in messages):
+        return convert_to_openai_messages(messages)
+    return await get_bulkhead("media").run(convert_to_openai_messages, messages)
+
+
+def too_many_requests(error: AdmissionRejected):
+    """Fast 429 response telling the client when capacity is expected to free up"""
+    return JSONResponse(
+        status_code=429,
+        content={"error": str(error), "retry_after": error.retry_after},
+        headers={"Retry-After": str(error.retry_after)},
+    )
 
 
 @app.post("/api/chat")
-async def handle_chat_data(request: Request, protocol: str = Query('data')):
+async def handle_chat_data(
+    request: Request,
+    protocol: str = Query('data'),
+    jobs: bool = Query(TOOL_JOB_MODE),
+    max_steps: int = Query(CHAT_MAX_STEPS, ge=1, le=CHAT_MAX_STEPS_LIMIT),
+    deadline_ms: Optional[int] = Header(None, alias=DEADLINE_HEADER),
+):
     """
     Handles chat messages from the client and processes tool invocations
+
+    Pass ?jobs=true (or set TOOL_JOB_MODE=1) to run slow tools as background jobs,
+    and ?max_steps=N (or set CHAT_MAX_STEPS) to have the model answer with the tool
+    results in the same response.
     """
+    deadline = route_deadline("chat", deadline_ms)
+    limiter = get_limiter("endpoint:chat")
+    try:
+        with use_deadline(deadline):
+            await limiter.acquire_async()
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+
     try:
         print(f"[DEBUG] Received chat request with protocol: {protocol}")
         
         # Convert client messages to OpenAI format
-        messages = convert_to_openai_messages(request.messages)
+        messages = await convert_messages(request.messages)
         
         print(f"[DEBUG] Processing {len(messages)} messages")
         
@@ -273,38 +594,155 @@ async def handle_chat_data(request: Request, protocol: str = Query('data')):
             if isinstance(last_message, dict) and 'content' in last_message:
                 print(f"[DEBUG] Last message content: {last_message['content'][:100]}...")
         
-        # Stream the response back to the client
+        # Stream the response back to the client, iterating it on the interactive bulkhead
         return StreamingResponse(
-            stream_text(messages, protocol),
+            get_bulkhead("interactive").iterate(
+                hold_slot(stream_text(messages, protocol, deadline, use_jobs=jobs, max_steps=max_steps), limiter)
+            ),
             media_type="text/event-stream"
         )
+    except AdmissionRejected as e:
+        limiter.release()
+        return too_many_requests(e)
     except Exception as e:
+        limiter.release()
         print(f"[ERROR] Error in /api/chat endpoint: {str(e)}")
         # Return a proper error response instead of raising an exception
         return {"error": str(e)}
 
 
+@app.websocket("/api/ws/chat")
+async def websocket_chat(websocket: WebSocket):
+    """
+    Chat over one persistent connection, with several conversations streaming at once
+
+    Client messages (JSON):
+        {"type": "chat", "conversationId": "...", "messages": [...], "maxSteps": 1, "jobs": false}
+        {"type": "cancel", "conversationId": "..."}
+
+    Server messages, tagged with the conversation they belong to:
+        {"type": "frame", "conversationId": "...", "frame": "0:\"Hi\"\n"}, one per
+            data stream frame, the same frames /api/chat streams
+        {"type": "done" | "cancelled", "conversationId": "..."}
+        {"type": "error", "conversationId": "...", "error": "...", "retry_after": 1}
+
+    Each conversation takes an /api/chat concurrency slot while it streams.
+    Cancelling one, or closing the connection, stops its upstream completion.
+    """
+    await websocket.accept()
+    send_lock = asyncio.Lock()
+    # conversationId -> (task, cancel event)
+    conversations = {}
+
+    async def send(message):
+        async with send_lock:
+            await websocket.send_json(message)
+
+    async def run_conversation(chat: WebSocketChat, cancel: threading.Event):
+        conversation_id = chat.conversationId
+        deadline = route_deadline("chat")
+        limiter = get_limiter("endpoint:chat")
+        frames = None
+        try:
+            try:
+                with use_deadline(deadline):
+                    await limiter.acquire_async()
+            except AdmissionRejected as e:
+                await send({"type": "error", "conversationId": conversation_id, "error": str(e), "retry_after": e.retry_after})
+                return
+
+            started = time.monotonic()
+            try:
+                frames = get_bulkhead("interactive").iterate(stream_text(
+                    await convert_messages(chat.messages),
+                    deadline=deadline,
+                    use_jobs=chat.jobs,
+                    max_steps=chat.maxSteps,
+                    cancel=cancel,
+                ))
+                async for frame in frames:
+                    await send({"type": "frame", "conversationId": conversation_id, "frame": frame})
+                await send({"type": "cancelled" if cancel.is_set() else "done", "conversationId": conversation_id})
+            except AdmissionRejected as e:
+                await send({"type": "error", "conversationId": conversation_id, "error": str(e), "retry_after": e.retry_after})
+            finally:
+                limiter.release(time.monotonic() - started)
+        except Exception as e:
+            # Usually the connection closing under us; stop the stream either way
+            cancel.set()
+            print(f"[DEBUG] WebSocket conversation {conversation_id} ended: {e}")
+        finally:
+            if frames is not None:
+                # Closes the stream on the pool, once a step still running it is done
+                await frames.aclose()
+            conversations.pop(conversation_id, None)
+
+    async def error(conversation_id, message):
+        await send({"type": "error", "conversationId": conversation_id, "error": message})
+
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+                conversation_id = message.get("conversationId")
+                kind = message.get("type")
+            except (ValueError, AttributeError):
+                await error(None, "Messages must be JSON objects")
+                continue
+
+            if kind == "cancel":
+                if conversation_id in conversations:
+                    conversations[conversation_id][1].set()
+            elif kind == "chat":
+                try:
+                    chat = WebSocketChat.model_validate(message)
+                except ValidationError as e:
+                    await error(conversation_id, f"Invalid chat message: {e.errors()[0]['msg']}")
+                    continue
+                if chat.conversationId in conversations:
+                    await error(chat.conversationId, "Conversation is already streaming")
+                elif len(conversations) >= WS_MAX_CONVERSATIONS:
+                    await error(chat.conversationId, f"At most {WS_MAX_CONVERSATIONS} conversations can stream at once")
+                else:
+                    cancel = threading.Event()
+                    conversations[chat.conversationId] = (asyncio.create_task(run_conversation(chat, cancel)), cancel)
+            else:
+                await error(conversation_id, f"Unknown message type {kind!r}")
+    except WebSocketDisconnect:
+        pass
+    finally:
+        # Nobody is listening any more, so stop generating
+        running = list(conversations.values())
+        for _, cancel in running:
+            cancel.set()
+        await asyncio.gather(*(task for task, _ in running), return_exceptions=True)
+
+
 @app.post("/api/upload-audio")
-async def upload_audio(file: UploadFile = File(...)):
-    # Create temp directory if it doesn't exist
-    os.makedirs("temp", exist_ok=True)
-    
-    # Save the uploaded file
-    file_path = f"temp/{file.filename}"
-    with open(file_path, "wb") as f:
-        f.write(await file.read())
-    
-    # Transcribe the audio
-    with open(file_path, "rb") as audio_file:
-        transcription = client.audio.transcriptions.create(
-            model="whisper-1",
-            file=audio_file
-        )
-    
-    # Clean up
-    os.remove(file_path)
+async def upload_audio(
+    file: UploadFile = File(...),
+    deadline_ms: Optional[int] = Header(None, alias=DEADLINE_HEADER),
+):
+    limiter = get_limiter("endpoint:upload_audio")
+    with use_deadline(route_deadline("upload_audio", deadline_ms)):
+        try:
+            await limiter.acquire_async()
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+
+        try:
+            return await transcribe_upload(file)
+        finally:
+            limiter.release()
+
+
+async def transcribe_upload(file: UploadFile):
+    from .utils.async_tools import transcribe_bytes
+
+    audio_bytes = await file.read()
     
-    return {"text": transcription.text}
+    # Transcribe the audio (cached by content, so re-uploads are free)
+    return {"text": await transcribe_bytes(audio_bytes, file.filename)}
 
 class TextToSpeechRequest(BaseModel):
     text: str
@@ -312,11 +750,278 @@ class TextToSpeechRequest(BaseModel):
     use_advanced_model: bool = False  # Whether to use the advanced GPT-3.5 audio models
 
 @app.post("/api/text-to-speech")
-async def text_to_speech(request: TextToSpeechRequest):
+async def text_to_speech(
+    request: TextToSpeechRequest,
+    deadline_ms: Optional[int] = Header(None, alias=DEADLINE_HEADER),
+):
     """Generate speech from text using OpenAI's Text-to-Speech API"""
-    result = generate_speech(
-        text=request.text, 
-        voice=request.voice,
-        use_advanced_model=request.use_advanced_model
-    )
+    from .utils.async_tools import generate_speech
+
+    limiter = get_limiter("endpoint:text_to_speech")
+    with use_deadline(route_deadline("text_to_speech", deadline_ms)):
+        try:
+            await limiter.acquire_async()
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+
+        try:
+            result = await generate_speech(
+                text=request.text, 
+                voice=request.voice,
+                use_advanced_model=request.use_advanced_model
+            )
+        finally:
+            limiter.release()
     return result
+
+
+def data_frame(value):
+    """A data stream part carrying custom data alongside the text"""
+    return "2:{0}\n".format(json.dumps([value]))
+
+
+@app.post("/api/voice-chat")
+async def voice_chat(
+    file: UploadFile = File(...),
+    messages: str = Form("[]"),
+    voice: str = Form("alloy"),
+    max_steps: int = Form(CHAT_MAX_STEPS, ge=1, le=CHAT_MAX_STEPS_LIMIT),
+    deadline_ms: Optional[int] = Header(None, alias=DEADLINE_HEADER),
+):
+    """
+    One voice turn in one request: transcribes the recording, streams the chat
+    response and speaks it as it is written
+
+    `messages` is the conversation so far as JSON (the /api/chat body's messages);
+    the transcript is appended as the user's turn. The response is the /api/chat
+    data stream with extra data frames: first {"type": "transcript", "text": ...},
+    then {"type": "audio", "index": n, "text": ..., "audio": <base64 mp3>} for
+    each sentence of the reply, in order. Each sentence is synthesized as soon as
+    the model finishes writing it, so the first audio arrives while the rest of
+    the reply is still streaming.
+    """
+    from .utils.async_tools import generate_speech, transcribe_bytes
+    from .utils.sentences import SentenceBuffer
+
+    deadline = route_deadline("voice_chat", deadline_ms)
+    limiter = get_limiter("endpoint:voice_chat")
+    try:
+        with use_deadline(deadline):
+            await limiter.acquire_async()
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+
+    try:
+        history = [ClientMessage.model_validate(message) for message in json.loads(messages)]
+        with use_deadline(deadline):
+            transcript = await transcribe_bytes(await file.read(), file.filename)
+    except Exception as e:
+        limiter.release()
+        print(f"[ERROR] Error in /api/voice-chat endpoint: {str(e)}")
+        return {"error": str(e)}
+    print(f"[DEBUG] Voice chat transcript: {transcript[:100]}")
+
+    async def speak_sentence(sentence):
+        with use_deadline(deadline):
+            return await generate_speech(sentence, voice)
+
+    def audio_frame(index, sentence, speech):
+        return data_frame({
+            "type": "audio",
+            "index": index,
+            "text": sentence,
+            "audio": speech.get("audio"),
+            "format": speech.get("format"),
+            "error": speech.get("error"),
+        })
+
+    cancel = threading.Event()
+    try:
+        chat_frames = stream_text(
+            await convert_messages(history + [ClientMessage(role="user", content=transcript)]),
+            deadline=deadline,
+            max_steps=max_steps,
+            cancel=cancel,
+        )
+        chat_iterator = get_bulkhead("interactive").iterate(chat_frames)
+    except AdmissionRejected as e:
+        limiter.release()
+        return too_many_requests(e)
+
+    async def frames():
+        started = time.monotonic()
+        next_frame = asyncio.ensure_future(chat_iterator.__anext__())
+        sentences = SentenceBuffer()
+        # (sentence, speech task) in the order they are spoken
+        speeches = deque()
+        spoken = 0
+        finish_frame = None
+        try:
+            yield data_frame({"type": "transcript", "text": transcript})
+            while next_frame is not None or speeches:
+                waiting = [task for task in (next_frame, speeches[0][1] if speeches else None) if task is not None]
+                await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+
+                # Audio is sent in sentence order, as soon as the next one is ready
+                while speeches and speeches[0][1].done():
+                    sentence, task = speeches.popleft()
+                    yield audio_frame(spoken, sentence, task.result())
+                    spoken += 1
+
+                if next_frame is None or not next_frame.done():
+                    continue
+                try:
+                    frame = next_frame.result()
+                except StopAsyncIteration:
+                    next_frame = None
+                    completed = sentences.flush()
+                else:
+                    next_frame = asyncio.ensure_future(chat_iterator.__anext__())
+                    completed = sentences.feed(json.loads(frame[2:])) if frame.startswith("0:") else []
+                    if frame.startswith("d:"):
+                        # The finish frame goes last, after the audio
+                        finish_frame = frame
+                    else:
+                        yield frame
+                for sentence in completed:
+                    speeches.append((sentence, asyncio.create_task(speak_sentence(sentence))))
+            if finish_frame:
+                yield finish_frame
+            print(f"[DEBUG] Voice chat spoke {spoken} sentences in {time.monotonic() - started:.2f}s")
+        finally:
+            # The client may have gone away: stop generating text and speech
+            cancel.set()
+            for _, task in speeches:
+                task.cancel()
+            if next_frame is not None:
+                # An async generator can't be closed while a frame is being read from it
+                await asyncio.wait([next_frame])
+                if not next_frame.cancelled():
+                    next_frame.exception()
+            await chat_iterator.aclose()
+            limiter.release(time.monotonic() - started)
+
+    return StreamingResponse(frames(), media_type="text/event-stream")
+
+
+@app.get("/api/jobs/{job_id}")
+async def job_status(job_id: str):
+    """Status of a background tool job, including its result once done"""
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        return JSONResponse(status_code=404, content={"error": "Job not found or expired"})
+    return job
+
+
+@app.get("/api/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-sent events for a background tool job, ending once it finishes"""
+    store = get_job_runner().store
+
+    async def events():
+        last_status = None
+        last_sent = time.monotonic()
+        while True:
+            job = store.get(job_id)
+            if job is None:
+                yield 'event: error\ndata: {"error":"Job not found or expired"}\n\n'
+                return
+            if job["status"] != last_status:
+                last_status = job["status"]
+                last_sent = time.monotonic()
+                yield "event: status\ndata: {0}\n\n".format(json.dumps(job))
+                if last_status in ("done", "error"):
+                    return
+            elif time.monotonic() - last_sent > 15:
+                # Comment line keeps proxies from closing an idle connection
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.on_event("startup")
+def prewarm():
+    # Off by default: on serverless deployments rendering would add to every cold start
+    if os.environ.get("FALLBACK_IMAGES_PREWARM", "").lower() in ("1", "true", "yes"):
+        prewarm_fallback_images()
+
+
+@app.get("/api/fallback-images/{name}")
+async def fallback_image(name: str, http_request: HTTPRequest):
+    """
+    Locally rendered placeholder images, cached forever by clients
+
+    Rendering one takes tens of milliseconds of CPU, so the first request for each
+    runs on the media bulkhead; after that it is served from memory.
+    """
+    image = rendered_fallback_image(name)
+    if image is None:
+        try:
+            image = await get_bulkhead("media").run(get_fallback_image, name)
+        except AdmissionRejected as e:
+            return too_many_requests(e)
+    if image is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown fallback image"})
+    content, etag = image
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type="image/png", headers=headers)
+
+
+@app.get("/api/images/{image_id}")
+async def cached_image(
+    image_id: str,
+    http_request: HTTPRequest,
+    w: int = Query(DEFAULT_WIDTH, ge=1),
+    format: Optional[str] = Query(None),
+):
+    """
+    Generated images resized to the requested width, in WebP/AVIF when the client accepts it
+
+    Resizing is CPU work, so it runs on the media bulkhead.
+    """
+    format = format or negotiate_format(http_request.headers.get("accept"))
+    try:
+        derivative = await get_bulkhead("media").run(get_derivative, image_id, w, format)
+    except AdmissionRejected as e:
+        return too_many_requests(e)
+    if derivative is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown image or format"})
+    content, media_type, etag = derivative
+    headers = {"Cache-Control": "public, max-age=31536000, immutable", "ETag": etag, "Vary": "Accept"}
+    if http_request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+@app.get("/api/metrics/admission")
+async def admission_metrics():
+    """Current concurrency limiter and upstream rate limiter state"""
+    return admission_snapshot()
+
+
+@app.get("/api/metrics/cache")
+async def cache_metrics():
+    """Hit rates, evictions and size of every cache namespace"""
+    return get_cache().snapshot()
+
+
+@app.get("/api/metrics/router")
+async def router_metrics():
+    """Model routing policies, per-model p95 latency and error rates, and routing decisions"""
+    return router_snapshot()
+
+
+@app.get("/api/metrics/bulkheads")
+async def bulkhead_metrics():
+    """Size, queue depth, utilization and rejections of every bulkhead pool"""
+    return bulkhead_snapshot()
+
+
+@app.get("/api/metrics/breakers")
+async def breaker_metrics():
+    """Circuit breaker state for every upstream model and endpoint"""
+    return breaker_snapshot()
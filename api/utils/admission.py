@@ -0,0 +1,308 @@
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .deadline import current_deadline
+
+# Default (concurrency, queue) limits per endpoint and per tool. Every value can be
+# overridden with ADMISSION_<NAME>_CONCURRENCY / ADMISSION_<NAME>_QUEUE, e.g.
+# ADMISSION_TOOL_SIMULATE_DATE_CONCURRENCY=4.
+DEFAULT_LIMITS = {
+    "endpoint:chat": (16, 32),
+    "endpoint:upload_audio": (4, 8),
+    "endpoint:text_to_speech": (4, 8),
+    "endpoint:voice_chat": (4, 8),
+    "tool:get_current_weather": (8, 16),
+    "tool:evaluate_rizz": (32, 64),
+    "tool:generate_rizz_image": (3, 6),
+    "tool:transcribe_audio": (4, 8),
+    "tool:simulate_date": (3, 6),
+}
+FALLBACK_LIMITS = (8, 16)
+
+# Default client-side request budgets for upstream APIs, in requests per minute.
+# Override with RATE_LIMIT_<NAME>_RPM, e.g. RATE_LIMIT_OPENAI_IMAGES_RPM=50.
+DEFAULT_RATE_LIMITS = {
+    "openai-chat": 3000,
+    "openai-images": 50,
+    "openai-audio": 300,
+    "open-meteo": 600,
+    "media-fetch": 600,
+}
+
+QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "10"))
+THROTTLE_MAX_WAIT = float(os.environ.get("RATE_LIMIT_MAX_WAIT", "10"))
+
+
+class AdmissionRejected(Exception):
+    """Raised when a limiter's queue is full or a caller waited too long for a slot"""
+
+    def __init__(self, name, retry_after, reason="busy"):
+        self.name = name
+        self.retry_after = max(1, int(retry_after + 0.999))
+        self.reason = reason
+        super().__init__(f"{name} is {reason}, retry after {self.retry_after}s")
+
+
+def _wait_timeout(timeout, default):
+    """Queue wait limit: the given or default timeout, but never past the request deadline"""
+    timeout = default if timeout is None else timeout
+    deadline = current_deadline()
+    return timeout if deadline is None else min(timeout, deadline.remaining())
+
+
+def env_name(name):
+    """The part of an environment variable name that identifies a limiter, pool or call type"""
+    return re.sub(r"[^A-Z0-9]+", "_", name.upper()).strip("_")
+
+
+def env_int(key, default):
+    """An integer setting from the environment, or the default when it is missing or malformed"""
+    try:
+        return int(os.environ.get(key, default))
+    except ValueError:
+        return default
+
+
+class _Waiter:
+    __slots__ = ("granted", "event", "loop", "future")
+
+    def __init__(self, event=None, loop=None, future=None):
+        self.granted = False
+        self.event = event
+        self.loop = loop
+        self.future = future
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class ConcurrencyLimiter:
+    """
+    Bounds how many callers run at once, with a bounded FIFO wait queue
+
+    Slots are handed directly to the oldest waiter on release, and both threads
+    (acquire) and coroutines (acquire_async) can wait on the same limiter.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout=QUEUE_TIMEOUT):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self._active = 0
+        self._admitted = 0
+        self._rejected = 0
+        self._avg_hold = 1.0
+
+    def _try_enter(self, waiter_factory):
+        """Takes a free slot or enqueues a waiter; must be called with the lock held"""
+        if self._active < self.max_concurrent and not self._waiters:
+            self._active += 1
+            self._admitted += 1
+            return None
+        if len(self._waiters) >= self.max_queue:
+            self._rejected += 1
+            raise AdmissionRejected(self.name, self.retry_after(), "over capacity")
+        waiter = waiter_factory()
+        self._waiters.append(waiter)
+        return waiter
+
+    def _abandon(self, waiter):
+        """Returns True if the waiter was granted a slot before it gave up"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            self._rejected += 1
+            return False
+
+    def acquire(self, timeout=None):
+        timeout = _wait_timeout(timeout, self.queue_timeout)
+        with self._lock:
+            waiter = self._try_enter(lambda: _Waiter(event=threading.Event()))
+        if waiter is None or waiter.event.wait(timeout) or self._abandon(waiter):
+            return
+        raise AdmissionRejected(self.name, self.retry_after(), "saturated")
+
+    async def acquire_async(self, timeout=None):
+        timeout = _wait_timeout(timeout, self.queue_timeout)
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            waiter = self._try_enter(lambda: _Waiter(loop=loop, future=loop.create_future()))
+        if waiter is None:
+            return
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+        except asyncio.TimeoutError:
+            if self._abandon(waiter):
+                return
+            raise AdmissionRejected(self.name, self.retry_after(), "saturated")
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release()
+            raise
+
+    def release(self, held_for=None):
+        with self._lock:
+            if held_for is not None:
+                self._avg_hold = 0.8 * self._avg_hold + 0.2 * held_for
+            if not self._waiters:
+                self._active -= 1
+                return
+            waiter = self._waiters.popleft()
+            waiter.granted = True
+            self._admitted += 1
+        if waiter.event is not None:
+            waiter.event.set()
+        else:
+            waiter.loop.call_soon_threadsafe(_resolve, waiter.future)
+
+    def retry_after(self):
+        """Estimates how long until a queued caller would get a slot"""
+        backlog = len(self._waiters) + 1
+        return self._avg_hold * backlog / max(1, self.max_concurrent)
+
+    @contextmanager
+    def slot(self, timeout=None):
+        self.acquire(timeout)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.release(time.monotonic() - started)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "active": self._active,
+                "queued": len(self._waiters),
+                "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue,
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+            }
+
+
+class TokenBucket:
+    """
+    Client-side rate limiter that keeps us under an upstream's request budget
+
+    Callers reserve a token and sleep until it is available instead of sending the
+    request and learning about the limit from a 429.
+    """
+
+    def __init__(self, name, rate_per_minute, burst=None):
+        self.name = name
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, rate_per_minute // 10)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._throttled = 0
+        self._rejected = 0
+
+    def reserve(self, max_wait=THROTTLE_MAX_WAIT):
+        """Reserves one token and returns how long the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+            if wait > max_wait:
+                self._rejected += 1
+                raise AdmissionRejected(self.name, wait, "rate limited")
+            self._tokens -= 1
+            if wait:
+                self._throttled += 1
+            return wait
+
+    def acquire(self, max_wait=THROTTLE_MAX_WAIT):
+        wait = self.reserve(max_wait)
+        if wait:
+            time.sleep(wait)
+
+    async def acquire_async(self, max_wait=THROTTLE_MAX_WAIT):
+        wait = self.reserve(max_wait)
+        if wait:
+            await asyncio.sleep(wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "rate_per_minute": self.rate * 60,
+                "capacity": self.capacity,
+                "tokens": round(self._tokens, 2),
+                "throttled": self._throttled,
+                "rejected": self._rejected,
+            }
+
+
+_limiters = {}
+_buckets = {}
+_registry_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """Returns the shared limiter for an endpoint ("endpoint:chat") or tool ("tool:simulate_date")"""
+    limiter = _limiters.get(name)
+    if limiter is None:
+        with _registry_lock:
+            limiter = _limiters.get(name)
+            if limiter is None:
+                concurrency, queue = DEFAULT_LIMITS.get(name, FALLBACK_LIMITS)
+                prefix = f"ADMISSION_{env_name(name)}"
+                limiter = ConcurrencyLimiter(
+                    name,
+                    max(1, env_int(f"{prefix}_CONCURRENCY", concurrency)),
+                    max(0, env_int(f"{prefix}_QUEUE", queue)),
+                )
+                _limiters[name] = limiter
+    return limiter
+
+
+def get_bucket(name):
+    """Returns the shared token bucket for an upstream API"""
+    bucket = _buckets.get(name)
+    if bucket is None:
+        with _registry_lock:
+            bucket = _buckets.get(name)
+            if bucket is None:
+                rpm = env_int(f"RATE_LIMIT_{env_name(name)}_RPM", DEFAULT_RATE_LIMITS.get(name, 600))
+                bucket = TokenBucket(name, max(1, rpm))
+                _buckets[name] = bucket
+    return bucket
+
+
+def throttle(name, max_wait=THROTTLE_MAX_WAIT):
+    """Blocks until the upstream's token bucket allows another request"""
+    get_bucket(name).acquire(max_wait)
+
+
+async def throttle_async(name, max_wait=THROTTLE_MAX_WAIT):
+    """Waits without blocking the event loop until the upstream's token bucket allows another request"""
+    await get_bucket(name).acquire_async(max_wait)
+
+
+def hold_slot(iterator, limiter):
+    """Keeps a limiter slot for as long as a streaming response is being produced"""
+    started = time.monotonic()
+    try:
+        yield from iterator
+    finally:
+        limiter.release(time.monotonic() - started)
+
+
+def admission_snapshot():
+    return {
+        "limiters": {name: limiter.snapshot() for name, limiter in list(_limiters.items())},
+        "rate_limits": {name: bucket.snapshot() for name, bucket in list(_buckets.items())},
+    }
@@ -0,0 +1,350 @@
+# Coroutine versions of the tools in tools.py, on httpx.AsyncClient and AsyncOpenAI.
+# The tool registry picks the function here with the same name as a tool's sync
+# version, so a tool run waiting on an upstream API costs a coroutine rather than
+# an OS thread. Prompts, cache keys, parsing and result shaping come from tools.py
+# and each coroutine takes the same steps as its sync version, so both versions
+# give the same results and share cache entries. Blocking work (CPU-heavy tools,
+# the cache's SQLite tier, image decoding) is handed to threads.
+import asyncio
+import base64
+import hashlib
+import random
+
+import httpx
+
+from .admission import AdmissionRejected
+from .bulkheads import tool_bulkhead
+from .cache import cache_key, cached_async
+from .clients import async_openai_client, http_client
+from .deadline import DeadlineExceeded, has_budget, reserve_budget, stage_timeout
+from .image_cache import THUMBNAIL_WIDTH, derivative_url, has_image, store_image
+from .resilience import CircuitOpenError, call_upstream_async
+from .router import observe
+from . import tools
+from .tools import (
+    ANALYSIS_RESERVE,
+    DATE_CONTEXTS,
+    IMAGE_ATTEMPTS,
+    SPEECH_MIN_BUDGET,
+    SPEECH_REWRITE_MIN_BUDGET,
+    VALIDATION_MIN_BUDGET,
+    completion_cacheable,
+    date_analysis_request,
+    date_error_result,
+    date_image_attempts,
+    date_image_fields,
+    date_result,
+    get_fallback_image_url,
+    read_date_analysis,
+    read_simulation,
+    resolve_date_mode,
+    rizz_image_prompt,
+    rizz_image_result,
+    simulation_call,
+    speech_rewrite_request,
+    weather_cache_key,
+    weather_url,
+)
+
+
+async def get_current_weather(latitude, longitude):
+    return await cached_async("weather", weather_cache_key(latitude, longitude), lambda: fetch_weather(latitude, longitude))
+
+
+async def fetch_weather(latitude, longitude):
+    try:
+        response = await call_upstream_async(
+            "open-meteo",
+            lambda: fetch(weather_url(latitude, longitude), stage_timeout(10)),
+            rate_limit="open-meteo",
+        )
+        return response.json()
+    except (httpx.HTTPError, CircuitOpenError, AdmissionRejected, DeadlineExceeded) as e:
+        print(f"Error fetching weather data: {e}")
+        return None
+
+
+async def fetch(url, timeout=10):
+    """GET a URL, raising for error status codes so they count against the upstream"""
+    response = await http_client().get(url, timeout=timeout)
+    response.raise_for_status()
+    return response
+
+
+async def evaluate_rizz(message, context="casual conversation"):
+    # CPU work (and on first use, building the line index), so it runs on the tool's
+    # bulkhead rather than holding up every other tool on the loop
+    return await tool_bulkhead("evaluate_rizz").run(tools.evaluate_rizz, message, context)
+
+
+async def generate_rizz_image(prompt, context=None):
+    """Generate an image visualizing a flirting scenario or pickup line"""
+    # Only generated images are cached, and only while their file is still in the image cache
+    return await cached_async(
+        "image",
+        cache_key(prompt, context or "casual conversation"),
+        lambda: create_rizz_image(prompt, context),
+        should_cache=lambda image: "image_id" in image,
+        is_valid=lambda image: has_image(image["image_id"]),
+    )
+
+
+async def generate_image_url(model, prompt, timeout_cap, reserve=0, **params):
+    """URL of a newly generated image, or None if the response has none"""
+    response = await call_upstream_async(
+        f"openai:{model}",
+        lambda: async_openai_client().images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+            size="1024x1024",
+            timeout=stage_timeout(timeout_cap, model, reserve=reserve),
+            **params,
+        ),
+        rate_limit="openai-images",
+        retries=1,
+    )
+    return response.data[0].url if response.data else None
+
+
+async def create_rizz_image(prompt, context=None):
+    """Generates a new image for generate_rizz_image, bypassing the cache"""
+    try:
+        context = context or "casual conversation"
+        enhanced_prompt = rizz_image_prompt(prompt, context)
+
+        # DALL-E 3 first, then DALL-E 2, each only if the request has time for it
+        for model, min_budget, timeout_cap in IMAGE_ATTEMPTS:
+            try:
+                if not has_budget(min_budget):
+                    raise DeadlineExceeded(model)
+                url = await generate_image_url(model, enhanced_prompt, timeout_cap)
+                # Download the image into the local cache, which also verifies it is valid
+                image = await localize_image(url) if url else None
+                if image:
+                    return rizz_image_result(prompt, context, image)
+            except Exception as e:
+                print(f"{model} generation failed: {str(e)}")
+
+        return rizz_image_result(prompt, context)
+
+    except Exception as e:
+        print(f"Error in generate_rizz_image: {str(e)}")
+        return rizz_image_result(prompt, context, error=e)
+
+
+async def localize_image(url):
+    """Async version of tools.localize_image"""
+    if not has_budget(VALIDATION_MIN_BUDGET):
+        return {"url": url}
+    try:
+        response = await call_upstream_async(
+            "media-fetch",
+            lambda: fetch(url, stage_timeout(15)),
+            rate_limit="media-fetch",
+            retries=1,
+        )
+        # Decoding and writing the image is CPU and disk work, so it goes to a thread
+        image_id = await asyncio.to_thread(store_image, response.content)
+    except (httpx.HTTPError, CircuitOpenError, AdmissionRejected, DeadlineExceeded, ValueError, OSError) as e:
+        print(f"Could not cache generated image: {e}")
+        return None
+    # The cache is local to this instance, so clients keep the upstream URL and
+    # can use the derivatives when they reach an instance that has them
+    return {
+        "url": url,
+        "optimized_url": derivative_url(image_id),
+        "thumbnail_url": derivative_url(image_id, THUMBNAIL_WIDTH),
+        "image_id": image_id,
+        "original_url": url,
+    }
+
+
+async def transcribe_audio(audio_url):
+    """
+    Transcribes spoken audio to text using OpenAI's Whisper model
+
+    Args:
+        audio_url (str): URL to the audio file
+
+    Returns:
+        dict: Transcription text and metadata
+    """
+    try:
+        audio_response = await call_upstream_async(
+            "media-fetch", lambda: fetch(audio_url, stage_timeout(30)), rate_limit="media-fetch")
+
+        return {
+            "text": await transcribe_bytes(audio_response.content),
+            "success": True
+        }
+
+    except Exception as e:
+        print(f"Error transcribing audio: {e}")
+        return {
+            "text": "",
+            "success": False,
+            "error": str(e)
+        }
+
+
+async def transcribe_bytes(audio_bytes, filename="audio.mp3"):
+    """Async version of tools.transcribe_bytes, sharing its cache entries"""
+    async def transcribe():
+        transcription = await call_upstream_async(
+            "openai:whisper-1",
+            lambda: async_openai_client().audio.transcriptions.create(
+                model="whisper-1",
+                file=(filename, audio_bytes),
+                timeout=stage_timeout(120, "transcription")
+            ),
+            rate_limit="openai-audio",
+        )
+        return transcription.text
+
+    digest = await asyncio.to_thread(lambda: hashlib.sha256(audio_bytes).hexdigest())
+    return await cached_async("transcription", cache_key("whisper-1", digest), transcribe)
+
+
+async def cached_completion(stage, timeout_cap, reserve=0, call_type=None, **params):
+    """Async version of tools.cached_completion, sharing its cache entries"""
+    async def complete():
+        with observe(call_type, params["model"]):
+            response = await call_upstream_async(
+                f"openai:{params['model']}",
+                lambda: async_openai_client().chat.completions.create(
+                    **params,
+                    timeout=stage_timeout(timeout_cap, stage, reserve=reserve),
+                ),
+                rate_limit="openai-chat",
+            )
+        return response.choices[0].message.content
+
+    if not completion_cacheable(params):
+        return await complete()
+    return await cached_async("completion", cache_key(params), complete)
+
+
+async def generate_speech(text, voice="alloy", use_advanced_model=False):
+    """
+    Generates speech from text using OpenAI's Text-to-Speech API
+
+    Args:
+        text (str): The text to convert to speech
+        voice (str): The voice to use (e.g., "alloy", "echo", "fable", "onyx", "nova", "shimmer")
+        use_advanced_model (bool): Whether to rewrite the text for the HD model first
+
+    Returns:
+        dict: Audio data and metadata
+    """
+    if use_advanced_model and not has_budget(SPEECH_REWRITE_MIN_BUDGET):
+        print("[DEBUG] Not enough time left for the advanced TTS model, using standard")
+        use_advanced_model = False
+
+    # Failures aren't cached
+    return await cached_async(
+        "speech",
+        cache_key(text, voice, use_advanced_model),
+        lambda: synthesize_speech(text, voice, use_advanced_model),
+        should_cache=lambda speech: speech.get("audio") is not None,
+    )
+
+
+async def speak(model, voice, text):
+    return await call_upstream_async(
+        f"openai:{model}",
+        lambda: async_openai_client().audio.speech.create(
+            model=model,
+            voice=voice,
+            input=text,
+            timeout=stage_timeout(60, "speech")
+        ),
+        rate_limit="openai-audio",
+    )
+
+
+async def synthesize_speech(text, voice, use_advanced_model):
+    """Generates new speech for generate_speech, bypassing the cache"""
+    try:
+        speech_response = None
+        if use_advanced_model:
+            try:
+                tts_text = await cached_completion("speech rewrite", 30, call_type="speech_rewrite", **speech_rewrite_request(text))
+                speech_response = await speak("tts-1-hd", voice, tts_text)
+            except Exception as e:
+                print(f"Error using advanced TTS model, falling back to standard: {e}")
+        if speech_response is None:
+            speech_response = await speak("tts-1", voice, text)
+
+        return {
+            "audio": base64.b64encode(speech_response.content).decode("utf-8"),
+            "format": "mp3"
+        }
+    except Exception as e:
+        print(f"Error generating speech: {e}")
+        return {
+            "error": str(e),
+            "audio": None,
+            "format": None
+        }
+
+
+async def date_image(context, reserve, skipped_stages):
+    """Async version of tools.date_image"""
+    image_url = None
+    for model, min_budget, timeout_cap, prompt in date_image_attempts(context):
+        try:
+            if not has_budget(min_budget, reserve=reserve):
+                raise DeadlineExceeded(model)
+            image_url = await generate_image_url(model, prompt, timeout_cap, reserve=reserve, quality="standard")
+        except Exception as e:
+            print(f"{model} image generation error: {str(e)}")
+        if image_url:
+            break
+
+    if not image_url:
+        skipped_stages.append("image")
+        return get_fallback_image_url("date"), {}
+    return date_image_fields(image_url, await localize_image(image_url))
+
+
+async def date_speech(date_responses, reserve, skipped_stages):
+    """The date's lines read out, or None if there are none or no time for them"""
+    if not date_responses:
+        return None
+    if not has_budget(SPEECH_MIN_BUDGET, reserve=reserve):
+        skipped_stages.append("speech")
+        print("[DEBUG] Skipping date speech, not enough time left before the deadline")
+        return None
+    with reserve_budget(reserve):
+        return await generate_speech(" ... ".join(date_responses), voice="nova", use_advanced_model=True)
+
+
+async def simulate_date(message, context=None, mode=None):
+    """Async version of tools.simulate_date"""
+    mode = resolve_date_mode(mode)
+    analysis_reserve = ANALYSIS_RESERVE if mode == "two_call" else 0
+
+    try:
+        if not context:
+            context = random.choice(DATE_CONTEXTS)
+            print(f"Randomly selected context: {context}")
+
+        simulation_text = await cached_completion("date simulation", 60, **simulation_call(mode, message, context))
+        simulation_text, date_responses, analysis = read_simulation(mode, simulation_text)
+
+        skipped_stages = []
+        image, speech = await asyncio.gather(
+            date_image(context, analysis_reserve, skipped_stages),
+            date_speech(date_responses, analysis_reserve, skipped_stages),
+        )
+
+        if analysis is None:
+            analysis = read_date_analysis(await cached_completion(
+                "date analysis", 30, call_type="analysis", **date_analysis_request(simulation_text)))
+
+        return date_result(simulation_text, image, context, analysis, speech, skipped_stages)
+
+    except Exception as e:
+        print(f"Error simulating date: {e}")
+        return date_error_result(context, e)
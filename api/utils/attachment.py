@@ -1,7 +1,159 @@
+import base64
+import binascii
+import hashlib
+import os
+from io import BytesIO
+from urllib.parse import unquote_to_bytes
+
 from pydantic import BaseModel
 
+from .cache import cached
+
+# The model looks at images scaled to fit in 2048x2048 with the short side at most
+# 768 pixels, so anything larger only costs upload time and payload size
+IMAGE_MAX_SIDE = 2048
+IMAGE_SHORT_SIDE = 768
+IMAGE_QUALITY = 85
+MAX_TEXT_ATTACHMENT_CHARS = int(os.environ.get("MAX_TEXT_ATTACHMENT_CHARS", "20000"))
+
 
 class ClientAttachment(BaseModel):
     name: str
     contentType: str
     url: str
+
+
+def parse_data_url(url):
+    """
+    Decodes a data: URL
+
+    Returns:
+        tuple: (media_type, bytes), or None if url is not a valid data URL
+    """
+    if not url.startswith("data:"):
+        return None
+    header, separator, payload = url.partition(",")
+    if not separator:
+        return None
+    media_type = header[len("data:"):].split(";")[0] or "text/plain"
+    try:
+        if header.endswith(";base64"):
+            return media_type, base64.b64decode(payload)
+        return media_type, unquote_to_bytes(payload)
+    except (binascii.Error, ValueError):
+        return None
+
+
+def downscale_image(content):
+    """
+    Re-encodes an image at the resolution the model uses
+
+    Args:
+        content (bytes): The encoded image
+
+    Returns:
+        str: A data URL of the smaller image, or None if it can't be made smaller
+        (already small enough, animated or not readable)
+    """
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(content)) as image:
+            if getattr(image, "n_frames", 1) > 1:
+                return None
+            width, height = image.size
+            scale = min(1, IMAGE_MAX_SIDE / max(width, height))
+            scale *= min(1, IMAGE_SHORT_SIDE / (min(width, height) * scale))
+
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+            if scale < 1:
+                image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+
+            # JPEG is smallest, but can't keep transparency
+            pil_format, media_type = ("WEBP", "image/webp") if has_alpha else ("JPEG", "image/jpeg")
+            buffer = BytesIO()
+            image.save(buffer, format=pil_format, quality=IMAGE_QUALITY)
+    except Exception as e:
+        print(f"[DEBUG] Could not downscale image attachment: {e}")
+        return None
+
+    encoded = buffer.getvalue()
+    if scale == 1 and len(encoded) >= len(content):
+        return None
+    return f"data:{media_type};base64,{base64.b64encode(encoded).decode('ascii')}"
+
+
+def preprocess_image(url, digest):
+    """
+    The URL to send the model for an image attachment, with data URLs downscaled
+
+    The result is cached by digest (the hash of the URL), so an image in the
+    history is only decoded and resized on the first request that includes it.
+    """
+    if not url.startswith("data:image/"):
+        # Remote images are fetched by the model itself
+        return url
+
+    def process():
+        decoded = parse_data_url(url)
+        return {"url": downscale_image(decoded[1]) if decoded else None}
+
+    # Images that can't be made smaller are cached too, so they aren't decoded every time
+    processed = cached("attachment", digest, process, should_cache=lambda _: True)
+    return processed["url"] or url
+
+
+def text_attachment_content(attachment):
+    """The text of a text attachment, decoded from its data URL and cut to MAX_TEXT_ATTACHMENT_CHARS"""
+    decoded = parse_data_url(attachment.url)
+    if decoded is None:
+        # Not inlined, so the model at least sees where it is
+        return attachment.url
+    text = decoded[1].decode("utf-8", "replace")
+    if len(text) > MAX_TEXT_ATTACHMENT_CHARS:
+        text = text[:MAX_TEXT_ATTACHMENT_CHARS] + f"\n[{len(text) - MAX_TEXT_ATTACHMENT_CHARS} more characters omitted]"
+    return f"{attachment.name}:\n{text}"
+
+
+def attachment_parts(attachments, seen):
+    """
+    Converts a message's attachments into content parts for the model
+
+    Args:
+        attachments (List[ClientAttachment]): The message's attachments
+        seen (dict): Hashes of attachments already sent earlier in the conversation,
+            mapped to their names; shared across the messages of one request
+
+    Returns:
+        list: Content parts; an attachment seen earlier in the conversation is
+        replaced by a short text reference instead of being sent again
+    """
+    parts = []
+    for attachment in attachments:
+        is_image = attachment.contentType.startswith('image')
+        if not is_image and not attachment.contentType.startswith('text'):
+            continue
+
+        digest = hashlib.sha256(attachment.url.encode("utf-8")).hexdigest()
+        if digest in seen:
+            parts.append({
+                'type': 'text',
+                'text': f"[{attachment.name}: same attachment as {seen[digest]} above]"
+            })
+            continue
+        seen[digest] = attachment.name
+
+        if is_image:
+            parts.append({
+                'type': 'image_url',
+                'image_url': {
+                    'url': preprocess_image(attachment.url, digest)
+                }
+            })
+        else:
+            parts.append({
+                'type': 'text',
+                'text': text_attachment_content(attachment)
+            })
+    return parts
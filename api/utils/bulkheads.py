@@ -0,0 +1,234 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from .admission import AdmissionRejected, env_int, env_name
+
+# Default (workers, queue) per workload class. Every value can be overridden with
+# BULKHEAD_<NAME>_WORKERS / BULKHEAD_<NAME>_QUEUE, e.g. BULKHEAD_MEDIA_WORKERS=4.
+DEFAULT_BULKHEADS = {
+    # Iterating chat streams: one short task per frame, so it needs to stay responsive
+    "interactive": (32, 64),
+    # Tools and background jobs that wait on upstream APIs (image, speech and
+    # simulation models, weather), and image resizing
+    "media": (8, 16),
+    # Quick tools that are mostly local work
+    "cpu": (4, 32),
+}
+
+TOOL_BULKHEADS = {
+    "simulate_date": "media",
+    "generate_rizz_image": "media",
+    "transcribe_audio": "media",
+    "evaluate_rizz": "cpu",
+    # A network call: a slow weather API must not tie up the workers evaluate_rizz needs
+    "get_current_weather": "media",
+}
+
+
+# StopIteration can't be passed through a future, so the end of an iterator is signalled with this
+_DONE = object()
+
+
+def _next(iterator):
+    return next(iterator, _DONE)
+
+
+class Bulkhead:
+    """
+    A bounded thread pool for one class of blocking work
+
+    At most `workers` tasks run at once and `queue` more may wait; anything beyond
+    that is rejected with AdmissionRejected straight away instead of queueing
+    behind work it has nothing to do with. Keeping workload classes in separate
+    pools means a burst of slow media tools can't hold up chat streams.
+    """
+
+    def __init__(self, name, workers, queue):
+        self.name = name
+        self.workers = workers
+        self.queue = queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"bulkhead-{name}")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._queued = 0
+        self._running = 0
+        self._stats = {"submitted": 0, "rejected": 0, "completed": 0}
+        self._queue_wait = 0.0
+        self._max_queue_wait = 0.0
+        self._run_time = 0.0
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.workers + self.queue:
+                self._stats["rejected"] += 1
+                raise AdmissionRejected(f"bulkhead:{self.name}", self.retry_after(), "saturated")
+            self._admitted += 1
+
+    def _release(self):
+        with self._lock:
+            self._admitted -= 1
+
+    def retry_after(self):
+        """Rough seconds until a slot frees up, from the average task run time"""
+        completed = self._stats["completed"]
+        average = self._run_time / completed if completed else 1.0
+        return average * (self._admitted - self.workers + 1) / self.workers
+
+    def _execute(self, queued_at, context, fn, args):
+        started = time.monotonic()
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            waited = started - queued_at
+            self._queue_wait += waited
+            self._max_queue_wait = max(self._max_queue_wait, waited)
+        try:
+            return context.run(fn, *args)
+        finally:
+            with self._lock:
+                self._running -= 1
+                self._stats["completed"] += 1
+                self._run_time += time.monotonic() - started
+
+    def _finished(self, future, admitted):
+        with self._lock:
+            if future.cancelled():
+                # Dropped from the queue before it started
+                self._queued -= 1
+            if admitted:
+                self._admitted -= 1
+
+    def _submit(self, fn, args, admitted):
+        with self._lock:
+            self._stats["submitted"] += 1
+            self._queued += 1
+        future = self._executor.submit(self._execute, time.monotonic(), contextvars.copy_context(), fn, args)
+        future.add_done_callback(lambda future: self._finished(future, admitted))
+        return future
+
+    def submit(self, fn, *args):
+        """
+        Queues fn(*args), with a copy of the caller's context variables
+
+        Returns:
+            concurrent.futures.Future: Its result
+
+        Raises:
+            AdmissionRejected: The pool and its queue are full
+        """
+        self._admit()
+        try:
+            return self._submit(fn, args, admitted=True)
+        except Exception:
+            self._release()
+            raise
+
+    async def run(self, fn, *args):
+        """Runs fn(*args) on the pool without blocking the event loop"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def iterate(self, iterator):
+        """
+        Iterates a blocking iterator on the pool, like starlette's iterate_in_threadpool
+
+        The slot is taken here, so a full pool is reported before a response
+        starts, and held for the whole iteration, so an admitted stream isn't
+        rejected halfway through; each step runs as its own task.
+
+        Returns:
+            An async iterator of the items
+
+        Raises:
+            AdmissionRejected: The pool and its queue are full
+        """
+        self._admit()
+        return self._iterate(iter(iterator))
+
+    async def _iterate(self, iterator):
+        step = None
+        try:
+            while True:
+                step = self._submit(_next, (iterator,), admitted=False)
+                item = await asyncio.wrap_future(step)
+                if item is _DONE:
+                    step = None
+                    return
+                yield item
+        finally:
+            if step is None:
+                self._release()
+            else:
+                # Stopped early: the source may hold an upstream response open
+                self._close(iterator, step)
+
+    def _close(self, iterator, step):
+        """
+        Closes a source iterator on the pool and frees its slot once that's done
+
+        A generator can't be closed while a step is running it, so the close
+        waits for the last step to finish.
+        """
+        close = getattr(iterator, "close", None)
+        if close is None:
+            self._release()
+            return
+
+        def submit_close(step):
+            try:
+                self._submit(close, (), admitted=True)
+            except RuntimeError:
+                # The pool was shut down with the interpreter
+                self._release()
+
+        step.add_done_callback(submit_close)
+
+    def snapshot(self):
+        with self._lock:
+            started = self._stats["completed"] + self._running
+            return {
+                "workers": self.workers,
+                "queue": self.queue,
+                "running": self._running,
+                "queued": self._queued,
+                # Tasks plus streams being iterated, which hold a slot between steps too
+                "admitted": self._admitted,
+                "utilization": round(self._running / self.workers, 3),
+                "saturation": round(self._admitted / (self.workers + self.queue), 3),
+                **self._stats,
+                "avg_queue_wait_ms": round(self._queue_wait / started * 1000, 2) if started else 0.0,
+                "max_queue_wait_ms": round(self._max_queue_wait * 1000, 2),
+            }
+
+
+_bulkheads = {}
+_bulkheads_lock = threading.Lock()
+
+
+def get_bulkhead(name):
+    """Returns the shared pool for a workload class ("interactive", "media" or "cpu")"""
+    bulkhead = _bulkheads.get(name)
+    if bulkhead is None:
+        with _bulkheads_lock:
+            bulkhead = _bulkheads.get(name)
+            if bulkhead is None:
+                workers, queue = DEFAULT_BULKHEADS[name]
+                prefix = f"BULKHEAD_{env_name(name)}"
+                bulkhead = Bulkhead(
+                    name,
+                    max(1, env_int(f"{prefix}_WORKERS", workers)),
+                    max(0, env_int(f"{prefix}_QUEUE", queue)),
+                )
+                _bulkheads[name] = bulkhead
+    return bulkhead
+
+
+def tool_bulkhead(name):
+    """The pool a tool's blocking calls run on"""
+    return get_bulkhead(TOOL_BULKHEADS.get(name, "cpu"))
+
+
+def bulkhead_snapshot():
+    return {name: bulkhead.snapshot() for name, bulkhead in list(_bulkheads.items())}
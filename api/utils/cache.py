@@ -0,0 +1,359 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+# Shared tier: "sqlite" (one file every worker on the host reads), or "none" for per-process only
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "sqlite").lower()
+CACHE_PATH = os.environ.get("CACHE_PATH", os.path.join(tempfile.gettempdir(), "rizz-cache.sqlite3"))
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_LOCAL_MAX_BYTES = int(os.environ.get("CACHE_LOCAL_MAX_BYTES", str(32 * 1024 * 1024)))
+# The shared tier is checked for expired entries and size every this many writes
+CACHE_PRUNE_EVERY = 50
+# Recency in the shared tier only needs to be roughly right, so it is refreshed at most this often
+ACCESS_REFRESH_SECONDS = 60
+
+# Seconds an entry lives, per namespace; override with CACHE_TTL_<NAMESPACE>_SECONDS
+DEFAULT_TTLS = {
+    "weather": 600,
+    "transcription": 7 * 24 * 3600,
+    "speech": 24 * 3600,
+    "image": 6 * 3600,
+    "completion": 3600,
+    "attachment": 24 * 3600,
+}
+DEFAULT_TTL = 3600
+
+MISSING = object()
+
+
+def ttl_for(namespace):
+    default = DEFAULT_TTLS.get(namespace, DEFAULT_TTL)
+    return float(os.environ.get(f"CACHE_TTL_{namespace.upper()}_SECONDS", default))
+
+
+def cache_key(*parts):
+    """Stable key for any JSON-serialisable arguments"""
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class LocalTier:
+    """In-process LRU of encoded values, bounded by total size"""
+
+    def __init__(self, max_bytes=CACHE_LOCAL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, namespace, key):
+        """Returns (encoded, expires_at), or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                self._remove((namespace, key))
+                return None
+            self._entries.move_to_end((namespace, key))
+            return entry
+
+    def set(self, namespace, key, encoded, expires_at):
+        """Stores an entry and returns the namespaces of the entries evicted to make room"""
+        evicted = []
+        if len(encoded) > self.max_bytes:
+            return evicted
+        with self._lock:
+            self._remove((namespace, key))
+            self._entries[(namespace, key)] = (encoded, expires_at)
+            self._bytes += len(encoded)
+            while self._bytes > self.max_bytes:
+                (evicted_namespace, _), (value, _) = self._entries.popitem(last=False)
+                self._bytes -= len(value)
+                evicted.append(evicted_namespace)
+        return evicted
+
+    def _remove(self, entry_key):
+        entry = self._entries.pop(entry_key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def usage(self):
+        with self._lock:
+            usage = defaultdict(lambda: {"entries": 0, "bytes": 0})
+            for (namespace, _), (value, _) in self._entries.items():
+                usage[namespace]["entries"] += 1
+                usage[namespace]["bytes"] += len(value)
+            return dict(usage)
+
+
+class SQLiteTier:
+    """
+    Entries in a local SQLite file in WAL mode, shared by every worker process on
+    the host. Expired entries are deleted, then the least recently used ones until
+    the file's contents fit in max_bytes.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._writes = 0
+        self._writes_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT, key TEXT, value TEXT, size INTEGER, expires_at REAL, accessed_at REAL, "
+                "PRIMARY KEY (namespace, key)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed_at)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, namespace, key):
+        now = time.time()
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT value, expires_at, accessed_at FROM cache_entries WHERE namespace = ? AND key = ? AND expires_at > ?",
+            (namespace, key, now),
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] < now - ACCESS_REFRESH_SECONDS:
+            conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, key),
+            )
+        return row[0], row[1]
+
+    def set(self, namespace, key, encoded, expires_at):
+        """Stores an entry and returns {"expired": {namespace: n}, "evicted": {namespace: n}} for any pruning done"""
+        now = time.time()
+        self._connect().execute(
+            "INSERT OR REPLACE INTO cache_entries VALUES (?, ?, ?, ?, ?, ?)",
+            (namespace, key, encoded, len(encoded), expires_at, now),
+        )
+        with self._writes_lock:
+            self._writes += 1
+            due = self._writes % CACHE_PRUNE_EVERY == 0
+        return self.prune() if due else None
+
+    def prune(self):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            expired = dict(conn.execute(
+                "SELECT namespace, COUNT(*) FROM cache_entries WHERE expires_at <= ? GROUP BY namespace", (now,)
+            ).fetchall())
+            conn.execute("DELETE FROM cache_entries WHERE expires_at <= ?", (now,))
+
+            evicted = defaultdict(int)
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache_entries").fetchone()[0]
+            if total > self.max_bytes:
+                # Evict down to 90% of the limit so the next few writes don't prune again
+                target = self.max_bytes * 0.9
+                victims = []
+                for namespace, key, size in conn.execute(
+                    "SELECT namespace, key, size FROM cache_entries ORDER BY accessed_at"
+                ):
+                    if total <= target:
+                        break
+                    victims.append((namespace, key))
+                    evicted[namespace] += 1
+                    total -= size
+                conn.executemany("DELETE FROM cache_entries WHERE namespace = ? AND key = ?", victims)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return {"expired": expired, "evicted": dict(evicted)}
+
+    def usage(self):
+        rows = self._connect().execute(
+            "SELECT namespace, COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE expires_at > ? GROUP BY namespace",
+            (time.time(),),
+        ).fetchall()
+        return {namespace: {"entries": entries, "bytes": size} for namespace, entries, size in rows}
+
+
+# Shared tier implementations by CACHE_BACKEND name. Anything with the same
+# get/set/usage methods as SQLiteTier can be registered here.
+SHARED_BACKENDS = {
+    "sqlite": SQLiteTier,
+}
+
+
+class Cache:
+    """
+    Two-tier cache of JSON-serialisable values, split into namespaces
+
+    Reads go to the in-process LRU first, then to the shared tier (if any), whose
+    hits are copied into the LRU for the rest of their TTL. Writes go to both.
+    Values are stored encoded, so callers always get their own copy. Errors in
+    the shared tier are counted and treated as misses: the cache never fails a request.
+    """
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self._stats = defaultdict(lambda: defaultdict(int))
+        self._stats_lock = threading.Lock()
+
+    def _count(self, namespace, stat, n=1):
+        with self._stats_lock:
+            self._stats[namespace][stat] += n
+
+    def get(self, namespace, key):
+        """The cached value, or MISSING"""
+        entry = self.local.get(namespace, key)
+        if entry is not None:
+            self._count(namespace, "local_hits")
+            return json.loads(entry[0])
+
+        if self.shared is not None:
+            try:
+                entry = self.shared.get(namespace, key)
+            except sqlite3.Error as e:
+                print(f"[DEBUG] Shared cache read failed: {e}")
+                self._count(namespace, "errors")
+                entry = None
+            if entry is not None:
+                self._count(namespace, "shared_hits")
+                self._record_evictions(self.local.set(namespace, key, *entry))
+                return json.loads(entry[0])
+
+        self._count(namespace, "misses")
+        return MISSING
+
+    def set(self, namespace, key, value, ttl=None):
+        encoded = json.dumps(value, separators=(",", ":"))
+        expires_at = time.time() + (ttl if ttl is not None else ttl_for(namespace))
+        self._count(namespace, "writes")
+        self._record_evictions(self.local.set(namespace, key, encoded, expires_at))
+        if self.shared is not None:
+            try:
+                pruned = self.shared.set(namespace, key, encoded, expires_at)
+            except sqlite3.Error as e:
+                print(f"[DEBUG] Shared cache write failed: {e}")
+                self._count(namespace, "errors")
+                pruned = None
+            if pruned:
+                for stat in ("expired", "evicted"):
+                    for pruned_namespace, n in pruned[stat].items():
+                        self._count(pruned_namespace, f"shared_{stat}", n)
+
+    def _record_evictions(self, namespaces):
+        for namespace in namespaces:
+            self._count(namespace, "local_evicted")
+
+    def snapshot(self):
+        """Per-namespace hit/miss counters for this process, plus entries and bytes in each tier"""
+        with self._stats_lock:
+            stats = {namespace: dict(counters) for namespace, counters in self._stats.items()}
+        local = self.local.usage()
+        shared = {}
+        if self.shared is not None:
+            try:
+                shared = self.shared.usage()
+            except sqlite3.Error as e:
+                print(f"[DEBUG] Shared cache usage query failed: {e}")
+        namespaces = {}
+        for namespace in sorted(set(stats) | set(local) | set(shared)):
+            counters = stats.get(namespace, {})
+            hits = counters.get("local_hits", 0) + counters.get("shared_hits", 0)
+            lookups = hits + counters.get("misses", 0)
+            namespaces[namespace] = {
+                **counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else None,
+                "local": local.get(namespace, {"entries": 0, "bytes": 0}),
+                "shared": shared.get(namespace, {"entries": 0, "bytes": 0}),
+            }
+        return {
+            "backend": CACHE_BACKEND if self.shared is not None else "none",
+            "namespaces": namespaces,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                shared = None
+                backend = SHARED_BACKENDS.get(CACHE_BACKEND)
+                if backend is not None:
+                    try:
+                        shared = backend()
+                    except sqlite3.Error as e:
+                        print(f"[DEBUG] Shared cache unavailable, using the in-process cache only: {e}")
+                _cache = Cache(LocalTier(), shared)
+    return _cache
+
+
+def cached(namespace, key, compute, ttl=None, should_cache=None, is_valid=None):
+    """
+    Returns the cached value for key, or computes, caches and returns it
+
+    Args:
+        namespace (str): Cache namespace, which sets the default TTL and groups the stats
+        key (str): Key within the namespace, usually from cache_key()
+        compute (callable): Produces the value on a miss
+        ttl (float): Seconds to keep the value, defaults to the namespace TTL
+        should_cache (callable): Decides whether a computed value is worth keeping;
+            by default anything but None is
+        is_valid (callable): Checked on hits, e.g. that a file the value refers to
+            still exists; invalid entries are recomputed
+
+    Returns:
+        The cached or computed value
+    """
+    cache = get_cache()
+    value = cache.get(namespace, key)
+    if value is not MISSING and (is_valid is None or is_valid(value)):
+        return value
+    value = compute()
+    if (should_cache(value) if should_cache else value is not None):
+        cache.set(namespace, key, value, ttl)
+    return value
+
+
+async def cached_async(namespace, key, compute, ttl=None, should_cache=None, is_valid=None):
+    """
+    cached() for coroutines: compute is awaited on a miss
+
+    Lookups, validity checks and writes touch SQLite and the disk, so they run on a
+    thread instead of holding up the other coroutines on the loop.
+    """
+    cache = get_cache()
+
+    def lookup():
+        value = cache.get(namespace, key)
+        if value is not MISSING and (is_valid is None or is_valid(value)):
+            return value
+        return MISSING
+
+    value = await asyncio.to_thread(lookup)
+    if value is not MISSING:
+        return value
+    value = await compute()
+    if (should_cache(value) if should_cache else value is not None):
+        await asyncio.to_thread(cache.set, namespace, key, value, ttl)
+    return value
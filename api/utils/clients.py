@@ -0,0 +1,84 @@
+import asyncio
+import os
+import threading
+import weakref
+
+from dotenv import load_dotenv
+
+# Loaded once, before any module reads its configuration from the environment
+load_dotenv(".env.local")
+
+# Seconds an async HTTP request may take when the caller doesn't pass a timeout
+HTTP_TIMEOUT = 30
+
+_openai_client = None
+_lock = threading.Lock()
+# Async clients hold connection pools that belong to one event loop, so there is one set per loop
+_async_clients = weakref.WeakKeyDictionary()
+_async_openai_override = None
+
+
+def openai_client():
+    """
+    The shared OpenAI client, created on first use
+
+    openai is one of the slowest imports in the app, so it is only loaded by the
+    first request that actually talks to OpenAI rather than on every cold start.
+    Retries are handled by call_upstream so that they go through the circuit breakers.
+    """
+    global _openai_client
+    if _openai_client is None:
+        with _lock:
+            if _openai_client is None:
+                from openai import OpenAI
+
+                _openai_client = OpenAI(
+                    api_key=os.environ.get("OPENAI_API_KEY"),
+                    max_retries=0,
+                )
+    return _openai_client
+
+
+def set_openai_client(client):
+    """Replaces the shared client, e.g. with a stub in benchmarks"""
+    global _openai_client
+    _openai_client = client
+
+
+def _loop_clients():
+    loop = asyncio.get_running_loop()
+    clients = _async_clients.get(loop)
+    if clients is None:
+        clients = _async_clients[loop] = {}
+    return clients
+
+
+def async_openai_client():
+    """The AsyncOpenAI client of the running event loop, created on first use"""
+    if _async_openai_override is not None:
+        return _async_openai_override
+    clients = _loop_clients()
+    if "openai" not in clients:
+        from openai import AsyncOpenAI
+
+        clients["openai"] = AsyncOpenAI(
+            api_key=os.environ.get("OPENAI_API_KEY"),
+            max_retries=0,
+        )
+    return clients["openai"]
+
+
+def set_async_openai_client(client):
+    """Replaces the async client on every loop, e.g. with a stub in benchmarks"""
+    global _async_openai_override
+    _async_openai_override = client
+
+
+def http_client():
+    """The httpx.AsyncClient of the running event loop, for plain HTTP requests from async tools"""
+    clients = _loop_clients()
+    if "http" not in clients:
+        import httpx
+
+        clients["http"] = httpx.AsyncClient(timeout=HTTP_TIMEOUT, follow_redirects=True)
+    return clients["http"]
@@ -0,0 +1,116 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+# Per-route budgets in seconds, override with DEADLINE_<ROUTE>_SECONDS
+DEFAULT_DEADLINES = {
+    "chat": 120.0,
+    "upload_audio": 60.0,
+    "text_to_speech": 45.0,
+    "voice_chat": 120.0,
+}
+
+# A client may ask for a shorter budget with this header (milliseconds)
+DEADLINE_HEADER = "X-Deadline-Ms"
+
+_current: ContextVar[Optional["Deadline"]] = ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a stage would start after the request's deadline has passed"""
+
+    def __init__(self, stage="request"):
+        self.stage = stage
+        super().__init__(f"Deadline exceeded before {stage}")
+
+
+class Deadline:
+    """An absolute point in time by which the whole request should be answered"""
+
+    def __init__(self, seconds):
+        self.budget = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return time.monotonic() >= self.expires_at
+
+    def timeout(self, cap, stage="upstream call", reserve=0):
+        """
+        The timeout a stage should use: its own cap or whatever budget is left, whichever is smaller
+
+        reserve keeps that many seconds back for the required stages that still follow.
+        """
+        remaining = self.remaining() - reserve
+        if remaining <= 0:
+            raise DeadlineExceeded(stage)
+        return min(cap, remaining)
+
+    def __repr__(self):
+        return f"Deadline(remaining={self.remaining():.2f}s)"
+
+
+def route_deadline(route, header_ms=None):
+    """
+    Creates the deadline for a request
+
+    Args:
+        route (str): Route name used to look up the default budget (e.g. "chat")
+        header_ms (int): Optional client-requested budget; it can only shorten the route's budget
+
+    Returns:
+        Deadline: The request deadline, starting now
+    """
+    seconds = float(os.environ.get(f"DEADLINE_{route.upper()}_SECONDS", DEFAULT_DEADLINES.get(route, 60.0)))
+    if header_ms is not None and header_ms > 0:
+        seconds = min(seconds, header_ms / 1000)
+    return Deadline(seconds)
+
+
+def current_deadline():
+    return _current.get()
+
+
+@contextmanager
+def use_deadline(deadline):
+    """Makes a deadline visible to every tool and upstream call made inside the block"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def reserve_budget(seconds):
+    """Runs the block under a deadline that ends `seconds` before the current one"""
+    deadline = _current.get()
+    if deadline is None:
+        yield None
+        return
+    with use_deadline(Deadline(deadline.remaining() - seconds)) as inner:
+        yield inner
+
+
+def stage_timeout(cap, stage="upstream call", reserve=0):
+    """Timeout for a stage under the current deadline, or cap when there is no deadline"""
+    deadline = _current.get()
+    if deadline is None:
+        return cap
+    return deadline.timeout(cap, stage, reserve)
+
+
+def has_budget(seconds, reserve=0):
+    """Whether an optional stage that needs about this many seconds (plus reserve) should still run"""
+    deadline = _current.get()
+    return deadline is None or deadline.remaining() >= seconds + reserve
+
+
+def check_deadline(stage="upstream call"):
+    deadline = _current.get()
+    if deadline is not None and deadline.expired():
+        raise DeadlineExceeded(stage)
@@ -0,0 +1,33 @@
+import asyncio
+import threading
+
+_loop = None
+_lock = threading.Lock()
+
+
+def background_loop():
+    """
+    The event loop async tools run on, in a daemon thread started on first use
+
+    stream_text and the job runner are plain threads rather than coroutines, so
+    they hand tool coroutines to this loop: any number of tool runs waiting on
+    upstream APIs share its one thread.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="tool-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def submit_coroutine(coroutine):
+    """
+    Schedules a coroutine on the background loop
+
+    Returns:
+        concurrent.futures.Future: Its result; cancelling the future cancels the coroutine
+    """
+    return asyncio.run_coroutine_threadsafe(coroutine, background_loop())
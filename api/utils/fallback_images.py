@@ -0,0 +1,120 @@
+import hashlib
+import os
+import random
+import threading
+from io import BytesIO
+
+FALLBACK_IMAGE_ROUTE = "/api/fallback-images/"
+FALLBACK_IMAGE_SIZE = 1024
+
+# Same palette and captions as the old placehold.co placeholders
+FALLBACK_IMAGES = {
+    "flirt": [
+        ("e879f9", "Flirting Scenario"),
+        ("d946ef", "Dating Scene"),
+    ],
+    "date": [
+        ("9333ea", "Date Conversation"),
+        ("7e22ce", "Romance Scene"),
+    ],
+    "generic": [
+        ("6d28d9", "Image Unavailable"),
+        ("4c1d95", "Try Again Later"),
+    ],
+}
+
+FONT_PATH = os.path.join(os.path.dirname(__file__), "..", "..", "assets", "geist-semibold.ttf")
+
+_rendered = {}
+_render_lock = threading.Lock()
+
+
+def _load_font(size):
+    from PIL import ImageFont
+
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        pass
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 only has the small bitmap font
+        return ImageFont.load_default()
+
+
+def render_fallback_image(color, caption, size=FALLBACK_IMAGE_SIZE):
+    """
+    Renders a placeholder the way placehold.co did: a solid colour with a centred caption
+
+    Args:
+        color (str): Background colour as a hex string without the leading #
+        caption (str): Text drawn in the middle of the image
+        size (int): Width and height in pixels
+
+    Returns:
+        bytes: The PNG-encoded image
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new("RGB", (size, size), f"#{color}")
+    draw = ImageDraw.Draw(image)
+    font = _load_font(size // 12)
+    left, top, right, bottom = draw.textbbox((0, 0), caption, font=font)
+    position = ((size - (right - left)) / 2 - left, (size - (bottom - top)) / 2 - top)
+    draw.text(position, caption, fill="#ffffff", font=font)
+
+    buffer = BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def fallback_image_names(type=None):
+    types = [type] if type else FALLBACK_IMAGES.keys()
+    return [f"{t}-{i}.png" for t in types for i in range(len(FALLBACK_IMAGES[t]))]
+
+
+def rendered_fallback_image(name):
+    """Returns (png_bytes, etag) for a fallback image that has been rendered already, else None"""
+    return _rendered.get(name)
+
+
+def get_fallback_image(name):
+    """
+    Returns (png_bytes, etag) for a fallback image name like "date-1.png", rendering it on first use
+
+    Returns None for unknown names.
+    """
+    cached = _rendered.get(name)
+    if cached is not None:
+        return cached
+
+    type, _, rest = name.partition("-")
+    index = rest[:-len(".png")] if rest.endswith(".png") else None
+    if type not in FALLBACK_IMAGES or not index or not index.isdigit() or int(index) >= len(FALLBACK_IMAGES[type]):
+        return None
+
+    with _render_lock:
+        cached = _rendered.get(name)
+        if cached is None:
+            color, caption = FALLBACK_IMAGES[type][int(index)]
+            content = render_fallback_image(color, caption)
+            cached = (content, '"{0}"'.format(hashlib.sha256(content).hexdigest()[:16]))
+            _rendered[name] = cached
+    return cached
+
+
+def prewarm_fallback_images():
+    """Renders every fallback image up front so the first degraded request does no work"""
+    for name in fallback_image_names():
+        get_fallback_image(name)
+
+
+def fallback_image_url(type="generic"):
+    """URL of a random locally served fallback image for the given type"""
+    type = type if type in FALLBACK_IMAGES else "generic"
+    return FALLBACK_IMAGE_ROUTE + random.choice(fallback_image_names(type))
+
+
+def is_fallback_image_url(url):
+    return bool(url) and url.startswith(FALLBACK_IMAGE_ROUTE)
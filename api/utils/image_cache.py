@@ -0,0 +1,168 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from io import BytesIO
+
+IMAGE_CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "rizz-images"))
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_ROUTE = "/api/images/"
+
+# Requested widths are rounded up to one of these so the cache stays small
+DERIVATIVE_WIDTHS = (128, 256, 512, 768, 1024)
+DEFAULT_WIDTH = 512
+THUMBNAIL_WIDTH = 256
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp", {"quality": 80, "method": 4}),
+    "avif": ("AVIF", "image/avif", {"quality": 60}),
+    "jpeg": ("JPEG", "image/jpeg", {"quality": 85, "optimize": True}),
+}
+
+_IMAGE_ID = re.compile(r"^[0-9a-f]{32}$")
+_locks = {}
+_locks_guard = threading.Lock()
+_stores_since_prune = 0
+
+
+def _path(name):
+    return os.path.join(IMAGE_CACHE_DIR, name)
+
+
+def _write_atomic(path, content):
+    os.makedirs(IMAGE_CACHE_DIR, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=IMAGE_CACHE_DIR, suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+def _lock_for(key):
+    with _locks_guard:
+        return _locks.setdefault(key, threading.Lock())
+
+
+def supported_formats():
+    from PIL import features
+
+    formats = ["webp", "jpeg"]
+    if features.check("avif"):
+        formats.insert(0, "avif")
+    return formats
+
+
+def store_image(content):
+    """
+    Stores an original image in the cache
+
+    Args:
+        content (bytes): Encoded image as downloaded from the upstream
+
+    Returns:
+        str: The image ID (derived from the content, so the same image is stored once)
+
+    Raises:
+        ValueError: If the bytes are not a readable image
+    """
+    from PIL import Image
+
+    try:
+        Image.open(BytesIO(content)).verify()
+    except Exception as e:
+        raise ValueError(f"Not a valid image: {e}")
+
+    image_id = hashlib.sha256(content).hexdigest()[:32]
+    path = _path(f"{image_id}.orig")
+    if not os.path.exists(path):
+        _write_atomic(path, content)
+        _maybe_prune()
+    return image_id
+
+
+def has_image(image_id):
+    """Whether the original of an image is still in the cache (it may have been pruned)"""
+    return bool(_IMAGE_ID.match(image_id)) and os.path.exists(_path(f"{image_id}.orig"))
+
+
+def derivative_url(image_id, width=DEFAULT_WIDTH, format=None):
+    url = f"{IMAGE_ROUTE}{image_id}?w={width}"
+    return url + f"&format={format}" if format else url
+
+
+def negotiate_format(accept):
+    """Picks the smallest format the client says it can display"""
+    accept = accept or ""
+    for format in supported_formats():
+        if FORMATS[format][1] in accept:
+            return format
+    return "jpeg"
+
+
+def snap_width(width):
+    for candidate in DERIVATIVE_WIDTHS:
+        if width <= candidate:
+            return candidate
+    return DERIVATIVE_WIDTHS[-1]
+
+
+def get_derivative(image_id, width=DEFAULT_WIDTH, format="webp"):
+    """
+    Returns (content, media_type, etag) for a resized copy of a cached image, creating it on first request
+
+    Returns None when the image ID is unknown or the format is not available.
+    """
+    if not _IMAGE_ID.match(image_id) or format not in supported_formats():
+        return None
+    original = _path(f"{image_id}.orig")
+    if not os.path.exists(original):
+        return None
+
+    width = snap_width(width)
+    pil_format, media_type, options = FORMATS[format]
+    path = _path(f"{image_id}-{width}.{format}")
+    etag = f'"{image_id}-{width}-{format}"'
+
+    if not os.path.exists(path):
+        with _lock_for(path):
+            if not os.path.exists(path):
+                _write_atomic(path, _render(original, width, pil_format, options))
+
+    with open(path, "rb") as f:
+        return f.read(), media_type, etag
+
+
+def _render(original, width, pil_format, options):
+    from PIL import Image
+
+    with Image.open(original) as image:
+        image = image.convert("RGBA" if pil_format != "JPEG" and image.mode in ("RGBA", "LA", "P") else "RGB")
+        image.thumbnail((width, width), Image.LANCZOS)
+        buffer = BytesIO()
+        image.save(buffer, format=pil_format, **options)
+        return buffer.getvalue()
+
+
+def _maybe_prune():
+    """Every so often, drop the least recently written files once the cache is over its size limit"""
+    global _stores_since_prune
+    _stores_since_prune += 1
+    if _stores_since_prune < 20:
+        return
+    _stores_since_prune = 0
+
+    entries = []
+    total = 0
+    for entry in os.scandir(IMAGE_CACHE_DIR):
+        if entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+    for _, size, path in sorted(entries):
+        if total <= IMAGE_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
@@ -0,0 +1,150 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import uuid
+
+from .admission import AdmissionRejected
+from .bulkheads import get_bulkhead
+from .deadline import Deadline, use_deadline
+
+JOB_TTL_SECONDS = float(os.environ.get("JOB_TTL_SECONDS", "900"))
+JOB_DEADLINE_SECONDS = float(os.environ.get("JOB_DEADLINE_SECONDS", "180"))
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", os.path.join(tempfile.gettempdir(), "rizz-jobs.sqlite3"))
+
+# Tools slow enough to run as background jobs when job mode is on
+SLOW_TOOLS = {"simulate_date", "generate_rizz_image"}
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+ERROR = "error"
+
+
+class JobStore:
+    """
+    Job status and results in a local SQLite file, so that any worker process on
+    the host can answer a status request. Rows expire JOB_TTL_SECONDS after
+    their last update.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, ttl=JOB_TTL_SECONDS):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, tool TEXT, status TEXT, result TEXT, error TEXT, "
+                "created_at REAL, updated_at REAL, expires_at REAL)"
+            )
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create(self, tool):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM jobs WHERE expires_at < ?", (now,))
+        conn.execute(
+            "INSERT INTO jobs VALUES (?, ?, ?, NULL, NULL, ?, ?, ?)",
+            (job_id, tool, PENDING, now, now, now + self.ttl),
+        )
+        return job_id
+
+    def update(self, job_id, status, result=None, error=None):
+        now = time.time()
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ?, expires_at = ? WHERE id = ?",
+            (status, None if result is None else json.dumps(result), error, now, now + self.ttl, job_id),
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, tool, status, result, error, created_at, updated_at FROM jobs WHERE id = ? AND expires_at >= ?",
+            (job_id, time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        job = {
+            "id": row[0],
+            "tool": row[1],
+            "status": row[2],
+            "created_at": row[5],
+            "updated_at": row[6],
+        }
+        if row[3] is not None:
+            job["result"] = json.loads(row[3])
+        if row[4] is not None:
+            job["error"] = row[4]
+        return job
+
+
+class JobRunner:
+    """Runs jobs on the media bulkhead; submissions it has no room for are rejected"""
+
+    def __init__(self, store, bulkhead=None):
+        self.store = store
+        self.bulkhead = bulkhead or get_bulkhead("media")
+
+    def submit(self, tool, fn):
+        """
+        Queues fn() as a background job
+
+        Args:
+            tool (str): Tool name, recorded with the job
+            fn (callable): Runs the tool and returns its JSON-serialisable result
+
+        Returns:
+            str: The job ID
+        """
+        job_id = self.store.create(tool)
+        try:
+            self.bulkhead.submit(self._run, job_id, fn)
+        except AdmissionRejected as e:
+            self.store.update(job_id, ERROR, error=str(e))
+            raise
+        return job_id
+
+    def _run(self, job_id, fn):
+        try:
+            self.store.update(job_id, RUNNING)
+            # Jobs outlive the request that started them, so they get their own deadline
+            with use_deadline(Deadline(JOB_DEADLINE_SECONDS)):
+                result = fn()
+            self.store.update(job_id, DONE, result=result)
+        except Exception as e:
+            print(f"[ERROR] Job {job_id} failed: {e}")
+            self.store.update(job_id, ERROR, error=str(e))
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_job_runner():
+    global _runner
+    if _runner is None:
+        with _runner_lock:
+            if _runner is None:
+                _runner = JobRunner(JobStore())
+    return _runner
+
+
+def job_reference(job_id):
+    """The tool result handed to the client in place of a slow tool's output"""
+    return {
+        "job_id": job_id,
+        "status": PENDING,
+        "status_url": f"/api/jobs/{job_id}",
+        "events_url": f"/api/jobs/{job_id}/events",
+    }
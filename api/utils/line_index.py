@@ -0,0 +1,330 @@
+import array
+import hashlib
+import mmap
+import os
+import re
+import struct
+import sys
+import tempfile
+import threading
+from bisect import bisect_left
+
+ASSETS_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "assets")
+PICKUP_LINE_CORPUS = os.environ.get("PICKUP_LINE_CORPUS", os.path.join(ASSETS_DIR, "pickup-lines.txt"))
+LINE_INDEX_DIR = os.environ.get("LINE_INDEX_DIR", tempfile.gettempdir())
+# Estimated Jaccard similarity of character shingles above which a line counts as a known one
+GENERIC_LINE_SIMILARITY = float(os.environ.get("GENERIC_LINE_SIMILARITY", "0.6"))
+
+SHINGLE_SIZE = 4
+# 32 MinHash values in 8 bands of 4: lines with similarity around 0.6 and up share a band
+# with high probability, while unrelated lines almost never do
+NUM_HASHES = 32
+BANDS = 8
+ROWS = NUM_HASHES // BANDS
+# Message fragments shorter than this are too short to match anything reliably
+MIN_FRAGMENT_CHARS = 8
+# Pickup lines are short: a fragment longer than this can't be similar enough to
+# one to match, so it isn't looked up. Only the first few sentences are checked.
+MAX_FRAGMENT_CHARS = 300
+MAX_FRAGMENTS = 8
+# Setups ("are you a parking ticket") are indexed on their own too. Short ones are
+# only matched word for word, since "are you a cat" is close to "are you a cat person".
+MIN_SETUP_CHARS = 16
+# Exact setups are found anywhere in a message as long as they end a clause there
+# (before punctuation or "because"); they are this many words long
+MIN_PHRASE_WORDS = 3
+MAX_PHRASE_WORDS = 12
+MAX_PHRASE_SCAN_WORDS = 80
+
+MAGIC = b"RZLI"
+VERSION = 2
+HEADER = struct.Struct("<4sIIIII")
+SIGNATURE = struct.Struct(f"<{NUM_HASHES}H")
+
+_NOT_WORD = re.compile(r"[^\w\s]+")
+_SPACES = re.compile(r"\s+")
+_FRAGMENT_END = re.compile(r"[.!?\n]+")
+# Where a line's setup ends and its punchline starts
+_SETUP_END = re.compile(r"[?,;:]|\s(?:because|cause|cuz)\b", re.IGNORECASE)
+_CLAUSE_END = re.compile(r"[.!?,;:\n]+")
+PUNCHLINE_WORDS = {"because", "cause", "cuz", "coz"}
+
+
+def normalize(text):
+    """Lowercases and drops punctuation, so small edits to it don't count"""
+    text = _NOT_WORD.sub("", text.lower())
+    return _SPACES.sub(" ", text).strip()
+
+
+def signature(text):
+    """MinHash signature of a normalized text's character shingles"""
+    if len(text) < SHINGLE_SIZE:
+        text = text.ljust(SHINGLE_SIZE)
+    # Each shingle's 64-byte digest gives it one 16-bit value per hash function;
+    # every NUM_HASHES-th value of the joined digests belongs to the same function
+    digests = b"".join([
+        hashlib.blake2b(text[i:i + SHINGLE_SIZE].encode("utf-8"), digest_size=SIGNATURE.size).digest()
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    ])
+    values = memoryview(digests).cast("H")
+    return tuple([min(values[i::NUM_HASHES]) for i in range(NUM_HASHES)])
+
+
+def setup(line):
+    """
+    The setup of a pickup line, the part before its punchline ("Are you a parking
+    ticket" for "Are you a parking ticket? Because ..."), or None if the line
+    doesn't split into one
+    """
+    match = _SETUP_END.search(line)
+    if not match:
+        return None
+    text = line[:match.start()].strip()
+    return text if len(normalize(text)) >= MIN_FRAGMENT_CHARS else None
+
+
+def clause_words(text):
+    """The normalized words of each clause of a text"""
+    return [normalize(clause).split() for clause in _CLAUSE_END.split(text)]
+
+
+def phrase_key(words):
+    """64-bit key of a normalized phrase"""
+    return int.from_bytes(hashlib.blake2b(" ".join(words).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def band_keys(values):
+    """One 64-bit LSH bucket key per band of a signature"""
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<B{ROWS}H", band, *values[band * ROWS:(band + 1) * ROWS])
+        keys.append(int.from_bytes(hashlib.blake2b(chunk, digest_size=8).digest(), "little"))
+    return keys
+
+
+def _pad(length):
+    return -length % 8
+
+
+def build_index(lines, path):
+    """
+    Writes the index for a list of lines to path
+
+    Every line is indexed whole and, when it has a long enough one, by its setup,
+    so a known setup with a different punchline still matches; both entries
+    carry the whole line's text. The setups (or short lines) are also indexed
+    as exact phrases, to find them inside longer sentences.
+
+    Layout (native byte order, like the signature values, sections 8-byte aligned): header, one signature
+    per entry, the sorted bucket keys of every band, the entry number for each
+    key, text offsets, the UTF-8 text of the entries, then the sorted phrase
+    keys and the entry number for each.
+    """
+    entries = []
+    phrases = []
+    for line in lines:
+        number = len(entries)
+        entries.append((line, line))
+        clause = setup(line)
+        if clause and len(normalize(clause)) >= MIN_SETUP_CHARS:
+            entries.append((clause, line))
+        words = normalize(clause or line).split()
+        if MIN_PHRASE_WORDS <= len(words) <= MAX_PHRASE_WORDS:
+            phrases.append((phrase_key(words), number))
+    phrases.sort()
+
+    signatures = []
+    buckets = []
+    texts = []
+    for number, (text, line) in enumerate(entries):
+        values = signature(normalize(text))
+        signatures.append(SIGNATURE.pack(*values))
+        buckets.extend((key, number) for key in band_keys(values))
+        texts.append(line.encode("utf-8"))
+    buckets.sort()
+
+    offsets = [0]
+    for text in texts:
+        offsets.append(offsets[-1] + len(text))
+
+    sections = [
+        b"".join(signatures),
+        array.array("Q", [key for key, _ in buckets]).tobytes(),
+        array.array("I", [number for _, number in buckets]).tobytes(),
+        array.array("Q", offsets).tobytes(),
+        b"".join(texts),
+        array.array("Q", [key for key, _ in phrases]).tobytes(),
+        array.array("I", [number for _, number in phrases]).tobytes(),
+    ]
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", suffix=".tmp")
+    with os.fdopen(fd, "wb") as f:
+        header = HEADER.pack(MAGIC, VERSION, len(entries), len(buckets), offsets[-1], len(phrases))
+        f.write(header + b"\0" * _pad(len(header)))
+        for section in sections:
+            f.write(section + b"\0" * _pad(len(section)))
+    # Other workers may be building the same index; whichever finishes last wins
+    os.replace(tmp_path, path)
+
+
+class LineIndex:
+    """
+    A memory-mapped MinHash/LSH index of known lines
+
+    Lookups cost a signature of the query plus a binary search per band, so they
+    stay well under a millisecond however large the corpus gets, and every worker
+    process shares the same pages of the file.
+    """
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.line_count, key_count, text_bytes, phrase_count = HEADER.unpack_from(self._mmap)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} line index")
+
+        view = memoryview(self._mmap)
+        position = HEADER.size + _pad(HEADER.size)
+
+        def section(length):
+            nonlocal position
+            start = position
+            position += length + _pad(length)
+            return view[start:start + length]
+
+        self._signatures = section(self.line_count * SIGNATURE.size)
+        self._keys = section(key_count * 8).cast("Q")
+        self._numbers = section(key_count * 4).cast("I")
+        self._offsets = section((self.line_count + 1) * 8).cast("Q")
+        self._texts = section(text_bytes)
+        self._phrase_keys = section(phrase_count * 8).cast("Q")
+        self._phrase_numbers = section(phrase_count * 4).cast("I")
+
+    def line(self, number):
+        return bytes(self._texts[self._offsets[number]:self._offsets[number + 1]]).decode("utf-8")
+
+    def best_match(self, text):
+        """
+        Returns (similarity, line) for the known line most similar to text, or None
+        if no line shares a bucket with it
+        """
+        normalized = normalize(text)
+        if not normalized:
+            return None
+        values = signature(normalized)
+
+        candidates = set()
+        for key in band_keys(values):
+            position = bisect_left(self._keys, key)
+            while position < len(self._keys) and self._keys[position] == key:
+                candidates.add(self._numbers[position])
+                position += 1
+
+        best = None
+        for number in candidates:
+            stored = SIGNATURE.unpack_from(self._signatures, number * SIGNATURE.size)
+            similarity = sum(a == b for a, b in zip(values, stored)) / NUM_HASHES
+            if best is None or similarity > best[0]:
+                best = (similarity, number)
+        return None if best is None else (best[0], self.line(best[1]))
+
+    def find_phrase(self, text):
+        """
+        Returns the known line whose setup appears word for word in text, ending
+        a clause ("so are you a magician, ..." but not "are you a magician fan"), or None
+
+        Only spans ending at a clause end or before "because" are looked up, so
+        the cost grows with the message, not the corpus.
+        """
+        scanned = 0
+        for words in clause_words(text):
+            if scanned >= MAX_PHRASE_SCAN_WORDS:
+                break
+            scanned += len(words)
+            ends = [end for end in range(MIN_PHRASE_WORDS, len(words)) if words[end] in PUNCHLINE_WORDS] + [len(words)]
+            for end in ends:
+                for start in range(max(0, end - MAX_PHRASE_WORDS), end - MIN_PHRASE_WORDS + 1):
+                    key = phrase_key(words[start:end])
+                    position = bisect_left(self._phrase_keys, key)
+                    if position < len(self._phrase_keys) and self._phrase_keys[position] == key:
+                        return self.line(self._phrase_numbers[position])
+        return None
+
+
+def read_corpus(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def index_path_for(corpus_path):
+    """Index file for the current contents of a corpus, so editing the corpus triggers a rebuild"""
+    with open(corpus_path, "rb") as f:
+        digest = hashlib.sha256(f.read()).hexdigest()[:16]
+    return os.path.join(LINE_INDEX_DIR, f"rizz-lines-{digest}-v{VERSION}-{sys.byteorder}.idx")
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_line_index():
+    """The index of PICKUP_LINE_CORPUS, built on first use if there isn't one on disk yet"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                path = index_path_for(PICKUP_LINE_CORPUS)
+                if not os.path.exists(path):
+                    print(f"[DEBUG] Building pickup line index for {PICKUP_LINE_CORPUS}")
+                    build_index(read_corpus(PICKUP_LINE_CORPUS), path)
+                _index = LineIndex(path)
+    return _index
+
+
+def fragments(message):
+    """The whole message plus its first sentences, since a known line is often only part of a message"""
+    sentences = [part for part in _FRAGMENT_END.split(message) if len(part.strip()) >= MIN_FRAGMENT_CHARS]
+    parts = [message] + (sentences[:MAX_FRAGMENTS] if len(sentences) > 1 else [])
+    return [part for part in parts if len(part) <= MAX_FRAGMENT_CHARS]
+
+
+def find_known_line(message, threshold=GENERIC_LINE_SIMILARITY):
+    """
+    Looks a message up in the pickup line corpus, tolerating small edits,
+    punctuation and word swaps. A known setup matches too, with any punchline
+    and anywhere in the message.
+
+    Args:
+        message (str): The message to check
+        threshold (float): Minimum estimated similarity for a match
+
+    Returns:
+        tuple: (similarity, known_line) of the best match (similarity 1.0 for a
+        setup found word for word), or None if there is none (or the index can't be loaded)
+    """
+    try:
+        index = get_line_index()
+    except (OSError, ValueError) as e:
+        print(f"[ERROR] Pickup line index unavailable: {e}")
+        return None
+
+    best = None
+    for fragment in fragments(message):
+        match = index.best_match(fragment)
+        if match and match[0] >= threshold and (best is None or match[0] > best[0]):
+            best = match
+    if best is None:
+        # A known setup inside a longer sentence, "so, are you a magician?"
+        line = index.find_phrase(message)
+        if line is not None:
+            best = (1.0, line)
+    return best
+
+
+if __name__ == "__main__":
+    # python -m api.utils.line_index corpus.txt [index.idx]: builds an index ahead of deployment
+    corpus = sys.argv[1] if len(sys.argv) > 1 else PICKUP_LINE_CORPUS
+    output = sys.argv[2] if len(sys.argv) > 2 else index_path_for(corpus)
+    lines = read_corpus(corpus)
+    build_index(lines, output)
+    print(f"Indexed {len(lines)} lines into {output}")
@@ -0,0 +1,231 @@
+import json
+import re
+
+# What the parser expects next
+VALUE = "value"
+KEY = "key"
+COLON = "colon"
+AFTER_VALUE = "after_value"
+STRING = "string"
+NUMBER = "number"
+LITERAL = "literal"
+DONE = "done"
+
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+LITERALS = {"true": True, "false": False, "null": None}
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789+-.eE"
+# A run of string characters that need no special handling
+PLAIN_STRING = re.compile(r'[^"\\]+')
+SURROGATE = re.compile("[\ud800-\udfff]")
+
+
+class PartialJSONParser:
+    """
+    Incremental parser for a JSON document that arrives in pieces, such as the
+    argument deltas of a streamed tool call
+
+    Every character is looked at once, so feeding a document in any number of
+    pieces costs time linear in its length. value() returns what has been parsed
+    so far, with open strings, arrays and objects closed; unfinished numbers,
+    literals and keys are left out. `changes` goes up whenever that value grows,
+    and `complete` is set once the top-level value has been closed.
+    """
+
+    def __init__(self):
+        self.complete = False
+        self.error = None
+        self.changes = 0
+        self._root = None
+        self._stack = []
+        # Key of the value being parsed in each open object
+        self._keys = []
+        self._state = VALUE
+        self._is_key = False
+        self._buffer = []
+        self._escape = None
+
+    def feed(self, text):
+        """Parses the next piece of the document; anything after the end or an error is ignored"""
+        position = 0
+        while position < len(text):
+            if self._state == DONE or self.error:
+                return
+            if self._state == STRING and self._escape is None:
+                # Strings are most of a tool call's arguments, so take plain runs in one step
+                run = PLAIN_STRING.match(text, position)
+                if run:
+                    self._append_to_string(run.group())
+                    position = run.end()
+                    continue
+            self._consume(text[position])
+            position += 1
+
+    def _consume(self, char):
+        state = self._state
+
+        if state == STRING:
+            if self._escape is not None:
+                self._continue_escape(char)
+            elif char == "\\":
+                self._escape = ""
+            elif char == '"':
+                self._end_string()
+            else:
+                self._append_to_string(char)
+            return
+
+        if state in (NUMBER, LITERAL):
+            if (state == NUMBER and char in NUMBER_CHARS) or (state == LITERAL and char.isalpha()):
+                self._buffer.append(char)
+                return
+            if not self._end_scalar():
+                return
+            state = self._state
+
+        if char in WHITESPACE:
+            return
+
+        if state == VALUE:
+            self._start_value(char)
+        elif state == KEY:
+            if char == '"':
+                self._state, self._is_key, self._buffer = STRING, True, []
+            elif char == "}" and not self._stack[-1]:
+                self._close_container()
+            else:
+                self._fail(char)
+        elif state == COLON:
+            if char == ":":
+                self._state = VALUE
+            else:
+                self._fail(char)
+        elif state == AFTER_VALUE:
+            container = self._stack[-1]
+            if char == ",":
+                self._state = KEY if isinstance(container, dict) else VALUE
+            elif char == ("}" if isinstance(container, dict) else "]"):
+                self._close_container()
+            else:
+                self._fail(char)
+
+    def _start_value(self, char):
+        if char == "{" or char == "[":
+            container = {} if char == "{" else []
+            self._add_value(container)
+            self._stack.append(container)
+            if char == "{":
+                self._keys.append(None)
+            self._state = KEY if char == "{" else VALUE
+        elif char == '"':
+            self._state, self._is_key, self._buffer = STRING, False, []
+            self._add_value("")
+        elif char in NUMBER_CHARS:
+            self._state, self._buffer = NUMBER, [char]
+        elif char.isalpha():
+            self._state, self._buffer = LITERAL, [char]
+        elif char == "]" and self._stack and self._stack[-1] == []:
+            # Empty array
+            self._close_container()
+        else:
+            self._fail(char)
+
+    def _add_value(self, value):
+        """Puts a new value where the parser is, i.e. into the open container or as the root"""
+        self.changes += 1
+        if not self._stack:
+            self._root = value
+            return
+        container = self._stack[-1]
+        if isinstance(container, dict):
+            container[self._keys[-1]] = value
+        else:
+            container.append(value)
+
+    def _replace_current(self, value):
+        """Replaces the value added last, used as a string grows"""
+        if not self._stack:
+            self._root = value
+            return
+        container = self._stack[-1]
+        if isinstance(container, dict):
+            container[self._keys[-1]] = value
+        else:
+            container[-1] = value
+
+    def _append_to_string(self, chars):
+        self._buffer.append(chars)
+        if not self._is_key:
+            self.changes += 1
+
+    def _continue_escape(self, char):
+        if self._escape == "":
+            if char == "u":
+                self._escape = "u"
+            elif char in ESCAPES:
+                self._escape = None
+                self._append_to_string(ESCAPES[char])
+            else:
+                self._fail(char)
+            return
+        self._escape += char
+        if len(self._escape) == 5:
+            try:
+                code = int(self._escape[1:], 16)
+            except ValueError:
+                self._fail(self._escape)
+                return
+            self._escape = None
+            self._append_to_string(chr(code))
+
+    def _end_string(self):
+        text = "".join(self._buffer)
+        if SURROGATE.search(text):
+            # Join \u escaped surrogate pairs into the characters they encode
+            text = text.encode("utf-16", "surrogatepass").decode("utf-16", "replace")
+        self._buffer = []
+        if self._is_key:
+            self._keys[-1] = text
+            self._state = COLON
+        else:
+            self._replace_current(text)
+            self._after_value()
+
+    def _end_scalar(self):
+        token = "".join(self._buffer)
+        self._buffer = []
+        if self._state == LITERAL:
+            if token not in LITERALS:
+                self._fail(token)
+                return False
+            value = LITERALS[token]
+        else:
+            try:
+                value = json.loads(token)
+            except ValueError:
+                self._fail(token)
+                return False
+        self._add_value(value)
+        self._after_value()
+        return True
+
+    def _close_container(self):
+        if isinstance(self._stack.pop(), dict):
+            self._keys.pop()
+        self._after_value()
+
+    def _after_value(self):
+        if not self._stack:
+            self._state = DONE
+            self.complete = True
+            return
+        self._state = AFTER_VALUE
+
+    def _fail(self, text):
+        self.error = f"Unexpected {text!r}"
+
+    def value(self):
+        """The document parsed so far, or None if no value has started"""
+        if self._state == STRING and not self._is_key:
+            self._replace_current("".join(self._buffer))
+        return self._root
@@ -0,0 +1,200 @@
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+# Profiling is off unless one of these is set. A request is profiled when it sends
+# PROFILE_HEADER with the PROFILE_TOKEN value, or at random with PROFILE_SAMPLE_RATE.
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_HEADER = "X-Profile"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "rizz-profiles"))
+# Time between stack samples
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL_MS", "5")) / 1000
+
+# Stacks of threads other than the event loop are only kept while they run code
+# from this package (stream_text, tools), which leaves out idle worker threads
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def profiling_enabled():
+    return bool(PROFILE_TOKEN) or PROFILE_SAMPLE_RATE > 0
+
+
+def thread_cpu_time(thread_id):
+    """CPU seconds used by another thread so far, or None where the platform can't tell"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+
+class RequestProfile:
+    """
+    Wall-clock and CPU profile of one request, from stack samples of every thread
+
+    A sampler thread looks at all stacks every PROFILE_INTERVAL while the request
+    runs. Each stack of the event loop thread, and of any other thread while it
+    runs app code, is counted once with the time since the last sample (wall
+    clock, so waiting on an upstream, a tool or a thread hop shows up, the last
+    as the loop sitting in select) and once with the CPU time its thread used
+    meanwhile. Other requests running at the same time are sampled too, so
+    profile one request at a time for a clean picture.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-')}-{uuid.uuid4().hex[:8]}"
+        self.path = os.path.join(PROFILE_DIR, f"{self.id}.speedscope.json")
+        self._stop = threading.Event()
+        self._thread = None
+        self._frames = []
+        self._frame_index = {}
+        # thread_id -> {"wall": [[stack, weight], ...], "cpu": [...]}
+        self._samples = {}
+        self._cpu = {}
+        self._started = None
+        self._elapsed = 0.0
+        self._loop_thread = None
+
+    def start(self):
+        """Starts sampling; called from the event loop thread"""
+        self._loop_thread = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._started = time.perf_counter()
+        for thread_id in sys._current_frames():
+            self._cpu[thread_id] = thread_cpu_time(thread_id)
+        self._thread.start()
+
+    def stop(self):
+        """Stops sampling; the profile is written from the sampler thread"""
+        self._stop.set()
+
+    def _run(self):
+        last = self._started
+        while not self._stop.wait(PROFILE_INTERVAL):
+            last = self._sample(last)
+        self._sample(last)
+        self._elapsed = time.perf_counter() - self._started
+        try:
+            self.save()
+        except OSError as e:
+            print(f"[ERROR] Could not save profile {self.path}: {e}")
+
+    def _frame(self, code):
+        key = (code.co_filename, code.co_firstlineno, getattr(code, "co_qualname", code.co_name))
+        index = self._frame_index.get(key)
+        if index is None:
+            index = self._frame_index[key] = len(self._frames)
+            self._frames.append({"name": key[2], "file": key[0], "line": key[1]})
+        return index
+
+    def _add(self, samples, stack, weight):
+        # Runs of the same stack are merged, keeping the timeline in order
+        if samples and samples[-1][0] == stack:
+            samples[-1][1] += weight
+        else:
+            samples.append([stack, weight])
+
+    def _sample(self, last):
+        now = time.perf_counter()
+        wall_ms = (now - last) * 1000
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            cpu = thread_cpu_time(thread_id)
+            previous = self._cpu.get(thread_id)
+            self._cpu[thread_id] = cpu
+            stack = []
+            in_app = False
+            while frame is not None:
+                code = frame.f_code
+                in_app = in_app or code.co_filename.startswith(APP_DIR)
+                stack.append(code)
+                frame = frame.f_back
+            if not in_app and thread_id != self._loop_thread:
+                continue
+
+            stack = tuple(self._frame(code) for code in reversed(stack))
+            samples = self._samples.setdefault(thread_id, {"wall": [], "cpu": []})
+            self._add(samples["wall"], stack, wall_ms)
+            if cpu is not None and previous is not None and cpu > previous:
+                self._add(samples["cpu"], stack, (cpu - previous) * 1000)
+        return now
+
+    def save(self):
+        """Writes the profile in speedscope's file format, one wall and one CPU profile per thread"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        profiles = []
+        for thread_id, samples in self._samples.items():
+            for clock in ("wall", "cpu"):
+                if not samples[clock]:
+                    continue
+                weights = [round(weight, 3) for _, weight in samples[clock]]
+                profiles.append({
+                    "type": "sampled",
+                    "name": f"{names.get(thread_id, thread_id)} ({clock})",
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": round(sum(weights), 3),
+                    "samples": [list(stack) for stack, _ in samples[clock]],
+                    "weights": weights,
+                })
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        with open(self.path, "w") as f:
+            json.dump({
+                "$schema": "https://www.speedscope.app/file-format-schema.json",
+                "name": f"{self.name} ({self._elapsed * 1000:.0f} ms)",
+                "exporter": "rizz request profiler",
+                "shared": {"frames": self._frames},
+                "profiles": profiles,
+            }, f)
+        print(f"[DEBUG] Profiled {self.name} in {self._elapsed:.2f}s -> {self.path}")
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware that profiles selected requests from the moment their headers
+    arrive to the last byte of the response, so body validation is included and
+    a streamed response is covered until its generator finishes
+
+    Profiled responses carry an X-Profile-Id header naming the file in PROFILE_DIR.
+    """
+
+    def __init__(self, app, token=PROFILE_TOKEN, sample_rate=PROFILE_SAMPLE_RATE):
+        self.app = app
+        self.token = token.encode()
+        self.sample_rate = sample_rate
+
+    def should_profile(self, scope):
+        if self.token:
+            header = PROFILE_HEADER.lower().encode()
+            for name, value in scope["headers"]:
+                if name == header and hmac.compare_digest(value, self.token):
+                    return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(f"{scope['method']} {scope['path']}")
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        profile.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            profile.stop()
@@ -1,10 +1,13 @@
 import json
 from enum import Enum
-from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 from pydantic import BaseModel
 import base64
-from typing import List, Optional, Any
-from .attachment import ClientAttachment
+from typing import TYPE_CHECKING, List, Optional, Any
+from .attachment import ClientAttachment, attachment_parts
+
+if TYPE_CHECKING:
+    # Only needed for annotations; importing openai at runtime costs the cold start
+    from openai.types.chat.chat_completion_message_param import ChatCompletionMessageParam
 
 class ToolInvocationState(str, Enum):
     CALL = 'call'
@@ -25,15 +28,10 @@ class ClientMessage(BaseModel):
     experimental_attachments: Optional[List[ClientAttachment]] = None
     toolInvocations: Optional[List[ToolInvocation]] = None
 
-def ensure_allowed_model(model: str) -> str:
-    """Ensures that only allowed models are used, defaulting to gpt-3.5-turbo to avoid rate limits."""
-    # If model is explicitly gpt-4 or gpt-4o variant, force it to be gpt-3.5-turbo
-    if model and ("gpt-4" in model or "gpt-4o" in model):
-        return "gpt-3.5-turbo"
-    return model or "gpt-3.5-turbo"
-
-def convert_to_openai_messages(messages: List[ClientMessage]) -> List[ChatCompletionMessageParam]:
+def convert_to_openai_messages(messages: List[ClientMessage]) -> List["ChatCompletionMessageParam"]:
     openai_messages = []
+    # Attachments already sent, so repeats later in the history aren't sent again
+    seen_attachments = {}
 
     for message in messages:
         parts = []
@@ -45,20 +43,7 @@ def convert_to_openai_messages(messages: List[ClientMessage]) -> List[ChatComple
         })
 
         if (message.experimental_attachments):
-            for attachment in message.experimental_attachments:
-                if (attachment.contentType.startswith('image')):
-                    parts.append({
-                        'type': 'image_url',
-                        'image_url': {
-                            'url': attachment.url
-                        }
-                    })
-
-                elif (attachment.contentType.startswith('text')):
-                    parts.append({
-                        'type': 'text',
-                        'text': attachment.url
-                    })
+            parts.extend(attachment_parts(message.experimental_attachments, seen_attachments))
 
         if(message.toolInvocations):
             for toolInvocation in message.toolInvocations:
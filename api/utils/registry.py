@@ -0,0 +1,59 @@
+import importlib
+import inspect
+import threading
+
+
+class ToolRegistry:
+    """
+    Maps tool names to functions given as "module:function" paths relative to api.utils
+
+    Modules are imported the first time one of their tools is looked up, which keeps
+    the tools module and its dependencies out of the cold start path.
+
+    With async_module, a coroutine function there with the same name as a tool's
+    function is that tool's async variant, which callers able to await prefer.
+    """
+
+    def __init__(self, specs, async_module=None):
+        self._specs = dict(specs)
+        self._async_module = async_module
+        self._resolved = {}
+        self._async_resolved = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self._specs or name in self._resolved
+
+    def __getitem__(self, name):
+        tool = self._resolved.get(name)
+        if tool is None:
+            if name not in self._specs:
+                raise KeyError(name)
+            with self._lock:
+                tool = self._resolved.get(name)
+                if tool is None:
+                    module_name, _, attribute = self._specs[name].partition(":")
+                    tool = getattr(importlib.import_module(module_name, __package__), attribute)
+                    self._resolved[name] = tool
+        return tool
+
+    def __setitem__(self, name, tool):
+        self._resolved[name] = tool
+        # A replaced tool keeps no async variant, unless it is a coroutine function itself
+        self._async_resolved[name] = tool if inspect.iscoroutinefunction(tool) else None
+
+    def async_variant(self, name):
+        """The coroutine version of a tool, or None if it only has a sync one"""
+        if name in self._async_resolved:
+            return self._async_resolved[name]
+        if self._async_module is None or name not in self._specs:
+            return None
+        with self._lock:
+            if name not in self._async_resolved:
+                attribute = self._specs[name].partition(":")[2]
+                tool = getattr(importlib.import_module(self._async_module, __package__), attribute, None)
+                self._async_resolved[name] = tool if inspect.iscoroutinefunction(tool) else None
+        return self._async_resolved[name]
+
+    def names(self):
+        return list(self._specs)
@@ -0,0 +1,265 @@
+import asyncio
+import os
+import random
+import threading
+import time
+
+from .admission import THROTTLE_MAX_WAIT, AdmissionRejected, throttle, throttle_async
+from .deadline import DeadlineExceeded, check_deadline, current_deadline
+
+FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_SECONDS", "30"))
+DEFAULT_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", "2"))
+BASE_DELAY = float(os.environ.get("UPSTREAM_RETRY_BASE_DELAY", "0.25"))
+MAX_DELAY = float(os.environ.get("UPSTREAM_RETRY_MAX_DELAY", "4"))
+
+_transient_errors = None
+
+
+def transient_errors():
+    """
+    Errors worth retrying: the request may succeed if sent again a moment later
+
+    Imported lazily, the HTTP clients are heavy and only needed once a call fails.
+    """
+    global _transient_errors
+    if _transient_errors is None:
+        import httpx
+        import openai
+        import requests
+
+        _transient_errors = (
+            openai.APIConnectionError,  # includes APITimeoutError
+            openai.RateLimitError,
+            openai.InternalServerError,
+            requests.ConnectionError,
+            requests.Timeout,
+            httpx.TransportError,
+        )
+    return _transient_errors
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit breaker is open"""
+
+    def __init__(self, name, retry_in):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"{name} is unavailable (circuit open, retrying in {retry_in:.0f}s)")
+
+
+def is_transient(error):
+    import httpx
+    import requests
+
+    if isinstance(error, transient_errors()):
+        return True
+    if isinstance(error, (requests.HTTPError, httpx.HTTPStatusError)) and error.response is not None:
+        return error.response.status_code == 429 or error.response.status_code >= 500
+    return False
+
+
+def upstream_answered(error):
+    """Whether an error is the upstream's own (4xx) response, which means it is up"""
+    import httpx
+    import openai
+    import requests
+
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code < 500
+    if isinstance(error, (requests.HTTPError, httpx.HTTPStatusError)) and error.response is not None:
+        return error.response.status_code < 500
+    return False
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive transient failures of one upstream model or endpoint
+
+    After failure_threshold failures in a row the breaker opens and calls fail
+    immediately with CircuitOpenError. Once reset_timeout has passed a single
+    probe call is let through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name, failure_threshold=FAILURE_THRESHOLD, reset_timeout=RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._stats = {"calls": 0, "failures": 0, "short_circuited": 0, "opened": 0}
+
+    def before_call(self):
+        with self._lock:
+            if self._state == self.OPEN:
+                waited = time.monotonic() - self._opened_at
+                if waited < self.reset_timeout:
+                    self._stats["short_circuited"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout - waited)
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._state == self.HALF_OPEN:
+                if self._probe_in_flight:
+                    self._stats["short_circuited"] += 1
+                    raise CircuitOpenError(self.name, self.reset_timeout)
+                self._probe_in_flight = True
+            self._stats["calls"] += 1
+
+    def abort_call(self):
+        """Forgets a call that was admitted but never reached the upstream"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._stats["failures"] += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._stats["opened"] += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    @property
+    def state(self):
+        return self._state
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {"state": self._state, "consecutive_failures": self._failures, **self._stats}
+            if self._state == self.OPEN:
+                snapshot["retry_in"] = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return snapshot
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name))
+    return breaker
+
+
+def find_breaker(name):
+    """The breaker for an upstream if it has been called yet, without creating one"""
+    return _breakers.get(name)
+
+
+def backoff_delay(attempt):
+    """Full-jitter exponential backoff"""
+    return random.uniform(0, min(MAX_DELAY, BASE_DELAY * (2 ** attempt)))
+
+
+def call_upstream(name, fn, rate_limit=None, retries=DEFAULT_RETRIES):
+    """
+    Calls an upstream through its circuit breaker, retrying transient errors
+
+    Args:
+        name (str): Breaker name, one per upstream model or endpoint (e.g. "openai:dall-e-3")
+        fn (callable): Performs the request and returns its result
+        rate_limit (str): Token bucket to draw from before every attempt
+        retries (int): How many times to retry a transient failure, as long as the
+            current request deadline leaves room for another attempt
+
+    Returns:
+        The result of fn()
+    """
+    breaker = get_breaker(name)
+    deadline = current_deadline()
+    attempt = 0
+    while True:
+        check_deadline(name)
+        breaker.before_call()
+        try:
+            if rate_limit:
+                throttle(rate_limit, THROTTLE_MAX_WAIT if deadline is None else min(THROTTLE_MAX_WAIT, deadline.remaining()))
+            result = fn()
+        except (AdmissionRejected, DeadlineExceeded):
+            breaker.abort_call()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                if upstream_answered(e):
+                    # The upstream answered, the request itself was bad
+                    breaker.record_success()
+                else:
+                    # A bug on our side says nothing about the upstream
+                    breaker.abort_call()
+                raise
+            breaker.record_failure()
+            if attempt >= retries or breaker.state == CircuitBreaker.OPEN:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and delay >= deadline.remaining():
+                raise
+            attempt += 1
+            print(f"[DEBUG] {name} failed with {type(e).__name__}, retry {attempt}/{retries} in {delay:.2f}s")
+            time.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+async def call_upstream_async(name, fn, rate_limit=None, retries=DEFAULT_RETRIES):
+    """
+    call_upstream for coroutines: fn() returns an awaitable, and waiting for a
+    rate limit token or a retry suspends the caller instead of blocking a thread
+
+    Shares the circuit breakers and token buckets with call_upstream.
+    """
+    breaker = get_breaker(name)
+    deadline = current_deadline()
+    attempt = 0
+    while True:
+        check_deadline(name)
+        breaker.before_call()
+        try:
+            if rate_limit:
+                await throttle_async(rate_limit, THROTTLE_MAX_WAIT if deadline is None else min(THROTTLE_MAX_WAIT, deadline.remaining()))
+            result = await fn()
+        except (AdmissionRejected, DeadlineExceeded, asyncio.CancelledError):
+            breaker.abort_call()
+            raise
+        except Exception as e:
+            if not is_transient(e):
+                if upstream_answered(e):
+                    # The upstream answered, the request itself was bad
+                    breaker.record_success()
+                else:
+                    # A bug on our side says nothing about the upstream
+                    breaker.abort_call()
+                raise
+            breaker.record_failure()
+            if attempt >= retries or breaker.state == CircuitBreaker.OPEN:
+                raise
+            delay = backoff_delay(attempt)
+            if deadline is not None and delay >= deadline.remaining():
+                raise
+            attempt += 1
+            print(f"[DEBUG] {name} failed with {type(e).__name__}, retry {attempt}/{retries} in {delay:.2f}s")
+            await asyncio.sleep(delay)
+        else:
+            breaker.record_success()
+            return result
+
+
+def breaker_snapshot():
+    return {name: breaker.snapshot() for name, breaker in list(_breakers.items())}
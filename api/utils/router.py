@@ -0,0 +1,236 @@
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from .admission import AdmissionRejected, env_name
+from .deadline import DeadlineExceeded
+from .resilience import CircuitBreaker, CircuitOpenError, find_breaker
+
+# Models each call type may use, most preferred first, with its output token limit
+# and p95 latency target in seconds (time to first token for the streamed chat).
+# Override with ROUTER_<CALL_TYPE>_MODELS (comma separated), ROUTER_<CALL_TYPE>_MAX_TOKENS
+# and ROUTER_<CALL_TYPE>_P95_SECONDS, e.g. ROUTER_CHAT_MODELS=gpt-4o-mini,gpt-3.5-turbo.
+DEFAULT_POLICIES = {
+    "chat": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "max_tokens": 300, "p95_seconds": 3.0},
+    "simulation": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "max_tokens": 1000, "p95_seconds": 20.0},
+    "simulation_dialogue": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "max_tokens": 800, "p95_seconds": 15.0},
+    "analysis": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "max_tokens": 500, "p95_seconds": 10.0},
+    "speech_rewrite": {"models": ["gpt-3.5-turbo", "gpt-4o-mini"], "max_tokens": 150, "p95_seconds": 5.0},
+}
+
+# Outcomes kept per model and call type: the last WINDOW_SIZE calls, at most WINDOW_SECONDS old
+WINDOW_SIZE = int(os.environ.get("ROUTER_WINDOW_SIZE", "100"))
+WINDOW_SECONDS = float(os.environ.get("ROUTER_WINDOW_SECONDS", "300"))
+# Fewer outcomes than this say nothing about a model, so it counts as healthy
+MIN_SAMPLES = int(os.environ.get("ROUTER_MIN_SAMPLES", "5"))
+MAX_ERROR_RATE = float(os.environ.get("ROUTER_MAX_ERROR_RATE", "0.2"))
+# The gpt-4 family costs more and has tighter rate limits, so like the old
+# ensure_allowed_model guard the router leaves it out unless ROUTER_ALLOW_GPT4 is set
+ALLOW_GPT4 = os.environ.get("ROUTER_ALLOW_GPT4", "").lower() in ("1", "true", "yes")
+DEFAULT_MODEL = "gpt-3.5-turbo"
+# Share of calls sent to a more preferred model that was judged unhealthy, so its
+# stats keep up with it recovering
+PROBE_RATE = float(os.environ.get("ROUTER_PROBE_RATE", "0.05"))
+
+
+def allowed_model(model):
+    return ALLOW_GPT4 or "gpt-4" not in model
+
+
+def load_policy(call_type):
+    policy = dict(DEFAULT_POLICIES.get(call_type, DEFAULT_POLICIES["chat"]))
+    prefix = f"ROUTER_{env_name(call_type)}"
+    models = os.environ.get(f"{prefix}_MODELS")
+    if models:
+        policy["models"] = [model.strip() for model in models.split(",") if model.strip()]
+    policy["models"] = [model for model in policy["models"] if allowed_model(model)] or [DEFAULT_MODEL]
+    policy["max_tokens"] = int(os.environ.get(f"{prefix}_MAX_TOKENS", policy["max_tokens"]))
+    policy["p95_seconds"] = float(os.environ.get(f"{prefix}_P95_SECONDS", policy["p95_seconds"]))
+    return policy
+
+
+def counts_against_model(error):
+    """Whether a failed call says something about the model, rather than about our own limits"""
+    return not isinstance(error, (AdmissionRejected, DeadlineExceeded, CircuitOpenError))
+
+
+class ModelStats:
+    """Recent latencies and failures of one model for one call type"""
+
+    def __init__(self):
+        # (finished_at, seconds or None for a failure)
+        self._outcomes = deque(maxlen=WINDOW_SIZE)
+
+    def record(self, seconds, failed):
+        self._outcomes.append((time.monotonic(), None if failed else seconds))
+
+    def _recent(self):
+        cutoff = time.monotonic() - WINDOW_SECONDS
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+        return self._outcomes
+
+    def summary(self):
+        outcomes = self._recent()
+        latencies = sorted(seconds for _, seconds in outcomes if seconds is not None)
+        samples = len(outcomes)
+        return {
+            "samples": samples,
+            "error_rate": (samples - len(latencies)) / samples if samples else 0.0,
+            "p95_seconds": latencies[max(0, math.ceil(len(latencies) * 0.95) - 1)] if latencies else None,
+        }
+
+
+class ModelRouter:
+    """
+    Picks the model and token limit for each call type
+
+    The first model in a call type's policy is used while it is healthy: its
+    breaker isn't open and, once it has MIN_SAMPLES recent outcomes, its error
+    rate is at most MAX_ERROR_RATE and its p95 latency within the policy's target.
+    Otherwise calls go to the next healthy model, and if none is, to the one
+    with the lowest p95. Stats age out of the window, so a model that stopped
+    getting traffic is tried again; PROBE_RATE of calls try it sooner.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._policies = {}
+        self._stats = {}
+        # call_type -> {"routed": {model: count}, "reasons": {reason: count}, "last": {...}}
+        self._decisions = {}
+
+    def policy(self, call_type):
+        policy = self._policies.get(call_type)
+        if policy is None:
+            policy = self._policies.setdefault(call_type, load_policy(call_type))
+        return policy
+
+    def _stats_for(self, call_type, model):
+        key = (call_type, model)
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats.setdefault(key, ModelStats())
+        return stats
+
+    def _health(self, call_type, model, policy):
+        """Why a model shouldn't get traffic right now, or None if it should"""
+        # A model that was never called has no breaker, and checking it shouldn't create one
+        breaker = find_breaker(f"openai:{model}")
+        if breaker is not None and breaker.state == CircuitBreaker.OPEN:
+            return "circuit_open"
+        summary = self._stats_for(call_type, model).summary()
+        if summary["samples"] < MIN_SAMPLES:
+            return None
+        if summary["error_rate"] > MAX_ERROR_RATE:
+            return "error_rate"
+        if summary["p95_seconds"] is not None and summary["p95_seconds"] > policy["p95_seconds"]:
+            return "slow"
+        return None
+
+    def route(self, call_type):
+        """
+        Chooses the model for one call
+
+        Returns:
+            dict: {"model": ..., "max_tokens": ...}, ready to pass to chat.completions.create
+        """
+        policy = self.policy(call_type)
+        models = policy["models"]
+        with self._lock:
+            model, reason = None, "preferred"
+            for candidate in models:
+                problem = self._health(call_type, candidate, policy)
+                if problem is None:
+                    model = candidate
+                    break
+                if reason == "preferred":
+                    reason = f"{candidate} {problem}"
+
+            if model is None:
+                # Nothing is healthy: the least slow model is still the best bet
+                def p95(candidate):
+                    value = self._stats_for(call_type, candidate).summary()["p95_seconds"]
+                    return math.inf if value is None else value
+                model = min(models, key=p95)
+                reason = "none healthy"
+            elif model != models[0] and random.random() < PROBE_RATE:
+                model = models[0]
+                reason = "probe"
+
+            decisions = self._decisions.setdefault(call_type, {"routed": {}, "reasons": {}})
+            decisions["routed"][model] = decisions["routed"].get(model, 0) + 1
+            decisions["reasons"][reason] = decisions["reasons"].get(reason, 0) + 1
+            decisions["last"] = {"model": model, "reason": reason, "at": round(time.time(), 3)}
+        if reason != "preferred":
+            print(f"[DEBUG] Routed {call_type} to {model} ({reason})")
+        return {"model": model, "max_tokens": policy["max_tokens"]}
+
+    def record(self, call_type, model, seconds, error=None):
+        """Records how one routed call went; errors from our own limits are ignored"""
+        if error is not None and not counts_against_model(error):
+            return
+        with self._lock:
+            self._stats_for(call_type, model).record(seconds, error is not None)
+
+    def snapshot(self):
+        with self._lock:
+            snapshot = {}
+            for call_type in list(self._policies):
+                policy = self._policies[call_type]
+                snapshot[call_type] = {
+                    "policy": policy,
+                    "models": {
+                        model: {
+                            **self._stats_for(call_type, model).summary(),
+                            "unhealthy": self._health(call_type, model, policy),
+                        }
+                        for model in policy["models"]
+                    },
+                    **self._decisions.get(call_type, {}),
+                }
+            return snapshot
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
+
+
+def model_route(call_type):
+    """The model and max_tokens the shared router picks for one call of a call type"""
+    return get_router().route(call_type)
+
+
+@contextmanager
+def observe(call_type, model):
+    """
+    Times a call to a routed model and records its outcome with the shared router;
+    does nothing without a call type
+    """
+    if call_type is None:
+        yield
+        return
+    started = time.monotonic()
+    try:
+        yield
+    except Exception as e:
+        get_router().record(call_type, model, time.monotonic() - started, e)
+        raise
+    get_router().record(call_type, model, time.monotonic() - started)
+
+
+def router_snapshot():
+    return get_router().snapshot()
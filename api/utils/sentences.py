@@ -0,0 +1,47 @@
+import re
+
+# End of a sentence: terminal punctuation (and any closing quotes or brackets)
+# followed by whitespace, or a line break
+SENTENCE_END = re.compile(r"""[.!?…]+["')\]]*\s+|\n+""")
+# Sentences shorter than this are joined to the next one rather than spoken
+# alone, so "Hi!" doesn't cost a speech request of its own
+MIN_SENTENCE_CHARS = 20
+
+
+class SentenceBuffer:
+    """
+    Collects streamed text and hands it back one complete sentence at a time
+
+    feed() returns the sentences completed by a text delta, so each can be
+    synthesized while the model is still writing the next; flush() returns
+    whatever is left once the text has ended.
+    """
+
+    def __init__(self, min_chars=MIN_SENTENCE_CHARS):
+        self.min_chars = min_chars
+        self._text = ""
+        # Where to resume searching for a sentence end
+        self._scan = 0
+
+    def feed(self, delta):
+        if not delta:
+            # Chunks without text (a role, a tool call, the finish) complete nothing
+            return []
+        self._text += delta
+        sentences = []
+        start = 0
+        # Back up a little so punctuation split across deltas still matches
+        for match in SENTENCE_END.finditer(self._text, max(0, self._scan - 4)):
+            sentence = self._text[start:match.end()].strip()
+            if len(sentence) >= self.min_chars:
+                sentences.append(sentence)
+                start = match.end()
+        self._text = self._text[start:]
+        self._scan = len(self._text)
+        return sentences
+
+    def flush(self):
+        sentence = self._text.strip()
+        self._text = ""
+        self._scan = 0
+        return [sentence] if sentence else []
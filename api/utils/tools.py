@@ -4,45 +4,123 @@ import random
 import os
 import json
 import base64
-from openai import OpenAI
-from dotenv import load_dotenv
-from PIL import Image
-from io import BytesIO
-import logging
-from ..utils.prompt import ensure_allowed_model
+import hashlib
+from .router import model_route, observe
+from .clients import openai_client
+from .admission import AdmissionRejected
+from .bulkheads import get_bulkhead
+from .resilience import CircuitOpenError, call_upstream
+from .fallback_images import fallback_image_url, is_fallback_image_url
+from .image_cache import THUMBNAIL_WIDTH, derivative_url, has_image, store_image
+from .cache import cache_key, cached
+from .line_index import find_known_line
+from .deadline import DeadlineExceeded, has_budget, reserve_budget, stage_timeout
 
-load_dotenv(".env.local")
+# Seconds of request budget an optional stage needs before it is worth starting;
+# with less left the stage is skipped and its fallback is used instead
+DALLE3_MIN_BUDGET = 25
+DALLE2_MIN_BUDGET = 12
+VALIDATION_MIN_BUDGET = 3
+SPEECH_MIN_BUDGET = 10
+SPEECH_REWRITE_MIN_BUDGET = 15
+# Budget simulate_date keeps back for its final analysis call in two_call mode
+ANALYSIS_RESERVE = 10
+# How simulate_date gets its dialogue and analysis: "structured" asks for both in
+# one JSON completion, "two_call" writes the dialogue and then analyzes it separately
+DATE_SIMULATION_MODES = ("structured", "two_call")
+DATE_SIMULATION_MODE = os.environ.get("DATE_SIMULATION_MODE", "structured")
+# Completions sampled above temperature 0 (the simulated date, the speech rewrite) are
+# meant to come out differently every time, so they are only cached when this is set
+CACHE_SAMPLED_COMPLETIONS = os.environ.get("CACHE_SAMPLED_COMPLETIONS", "").lower() in ("1", "true", "yes")
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY"),
-)
+# Settings simulate_date picks from when it isn't given one
+DATE_CONTEXTS = [
+    "coffee shop",
+    "upscale restaurant",
+    "casual bar",
+    "art gallery opening",
+    "bookstore",
+    "park picnic",
+    "beach sunset",
+    "rooftop lounge",
+    "museum tour",
+    "hiking trail",
+    "wine tasting",
+    "cooking class",
+    "farmers market",
+    "concert venue",
+    "botanical garden",
+    "ice cream parlor",
+    "arcade",
+    "bowling alley",
+    "jazz club",
+    "food truck festival"
+]
+
+DEFAULT_DATE_ANALYSIS = {
+    "overall_score": 7,
+    "chemistry_score": 6,
+    "conversation_score": 7,
+    "strengths": [
+        "Good opening approach",
+        "Maintained positive tone",
+        "Showed genuine interest"
+    ],
+    "improvements": [
+        "Could ask more open-ended questions",
+        "Be more specific with compliments",
+        "Add more humor to lighten the mood"
+    ]
+}
+
+def weather_cache_key(latitude, longitude):
+    try:
+        # Nearby requests share an entry: the key rounds coordinates to about 1 km
+        return cache_key(round(float(latitude), 2), round(float(longitude), 2))
+    except (TypeError, ValueError):
+        return cache_key(latitude, longitude)
+
+def weather_url(latitude, longitude):
+    return f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
 
 def get_current_weather(latitude, longitude):
+    return cached("weather", weather_cache_key(latitude, longitude), lambda: fetch_weather(latitude, longitude))
+
+def fetch_weather(latitude, longitude):
     # Format the URL with proper parameter substitution
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
+    url = weather_url(latitude, longitude)
 
     try:
-        # Make the API call
-        response = requests.get(url)
-
-        # Raise an exception for bad status codes
-        response.raise_for_status()
+        # Make the API call, raising an exception for bad status codes
+        response = call_upstream("open-meteo", lambda: fetch(url, stage_timeout(10)), rate_limit="open-meteo")
 
         # Return the JSON response
         return response.json()
 
-    except requests.RequestException as e:
+    except (requests.RequestException, CircuitOpenError, AdmissionRejected, DeadlineExceeded) as e:
         # Handle any errors that occur during the request
         print(f"Error fetching weather data: {e}")
         return None
 
+def fetch(url, timeout=10):
+    """GET a URL, raising for error status codes so they count against the upstream"""
+    response = requests.get(url, timeout=timeout)
+    response.raise_for_status()
+    return response
+
 def generate_rizz_image(prompt, context=None):
     """Generate an image visualizing a flirting scenario or pickup line"""
-    try:
-        context = context or "casual conversation"
-        
-        # Enhance the prompt for better image quality
-        enhanced_prompt = f"""Create a stylized artistic illustration for this flirting scenario: 
+    # Only generated images are cached, and only while their file is still in the image cache
+    return cached(
+        "image",
+        cache_key(prompt, context or "casual conversation"),
+        lambda: create_rizz_image(prompt, context),
+        should_cache=lambda image: "image_id" in image,
+        is_valid=lambda image: has_image(image["image_id"]),
+    )
+
+def rizz_image_prompt(prompt, context):
+    return f"""Create a stylized artistic illustration for this flirting scenario: 
         
         {prompt}
         
@@ -55,97 +133,130 @@ def generate_rizz_image(prompt, context=None):
         - Appropriate for a dating app profile
         - Non-photorealistic style preferred
         """
-        
-        # Try to generate with DALL-E 3 first
-        try:
-            response = client.images.generate(
-                model="dall-e-3",
-                prompt=enhanced_prompt,
-                n=1,
-                size="1024x1024",
-                timeout=30
-            )
-            image_url = response.data[0].url
-            
-            # Verify the image URL is valid
-            if validate_image_url(image_url):
-                return {
-                    "url": image_url,
-                    "prompt": prompt,
-                    "context": context
-                }
-        except Exception as e:
-            print(f"DALL-E 3 generation failed: {str(e)}")
-        
-        # If DALL-E 3 fails, try DALL-E 2
-        try:
-            response = client.images.generate(
-                model="dall-e-2",
-                prompt=enhanced_prompt,
-                n=1,
-                size="1024x1024",
-                timeout=20
-            )
-            image_url = response.data[0].url
-            
-            # Verify the image URL is valid
-            if validate_image_url(image_url):
-                return {
-                    "url": image_url,
-                    "prompt": prompt,
-                    "context": context
-                }
-        except Exception as e:
-            print(f"DALL-E 2 generation failed: {str(e)}")
-        
-        # If all else fails, use a static fallback
-        return {
-            "url": get_fallback_image_url("flirt"),
-            "prompt": prompt,
-            "context": context,
-            "note": "Used fallback image due to generation failure"
-        }
-        
-    except Exception as e:
-        print(f"Error in generate_rizz_image: {str(e)}")
+
+# Image models to try in order: (model, minimum request budget, timeout cap)
+IMAGE_ATTEMPTS = (("dall-e-3", DALLE3_MIN_BUDGET, 30), ("dall-e-2", DALLE2_MIN_BUDGET, 20))
+
+def generate_image_url(model, prompt, timeout_cap, reserve=0, **params):
+    """URL of a newly generated image, or None if the response has none"""
+    response = call_upstream(
+        f"openai:{model}",
+        lambda: openai_client().images.generate(
+            model=model,
+            prompt=prompt,
+            n=1,
+            size="1024x1024",
+            timeout=stage_timeout(timeout_cap, model, reserve=reserve),
+            **params,
+        ),
+        rate_limit="openai-images",
+        retries=1,
+    )
+    return response.data[0].url if response.data else None
+
+def rizz_image_result(prompt, context, image=None, error=None):
+    """generate_rizz_image's result for a cached image, or for the fallback image without one"""
+    if image:
+        return {**image, "prompt": prompt, "context": context}
+    if error is not None:
         return {
             "url": get_fallback_image_url("flirt"),
             "prompt": prompt or "Unknown prompt",
             "context": context or "Unknown context",
-            "error": str(e)
+            "error": str(error)
         }
+    return {
+        "url": get_fallback_image_url("flirt"),
+        "prompt": prompt,
+        "context": context,
+        "note": "Used fallback image due to generation failure"
+    }
+
+def create_rizz_image(prompt, context=None):
+    """Generates a new image for generate_rizz_image, bypassing the cache"""
+    try:
+        context = context or "casual conversation"
+        enhanced_prompt = rizz_image_prompt(prompt, context)
+
+        # DALL-E 3 first, then DALL-E 2, each only if the request has time for it
+        for model, min_budget, timeout_cap in IMAGE_ATTEMPTS:
+            try:
+                if not has_budget(min_budget):
+                    raise DeadlineExceeded(model)
+                url = generate_image_url(model, enhanced_prompt, timeout_cap)
+                # Download the image into the local cache, which also verifies it is valid
+                image = localize_image(url) if url else None
+                if image:
+                    return rizz_image_result(prompt, context, image)
+            except Exception as e:
+                print(f"{model} generation failed: {str(e)}")
+
+        return rizz_image_result(prompt, context)
+
+    except Exception as e:
+        print(f"Error in generate_rizz_image: {str(e)}")
+        return rizz_image_result(prompt, context, error=e)
+
+def localize_image(url):
+    """
+    Downloads a generated image into the local cache so it can be served as resized derivatives
+
+    Args:
+        url (str): Upstream URL of the generated image (these expire after a while)
+
+    Returns:
+        dict: url and original_url (the upstream URL), optimized_url (chat-sized derivative),
+        thumbnail_url and image_id; just the upstream url if there is no time left to download
+        it; None if it could not be fetched
+    """
+    if not has_budget(VALIDATION_MIN_BUDGET):
+        return {"url": url}
+    try:
+        response = call_upstream(
+            "media-fetch",
+            lambda: fetch(url, stage_timeout(15)),
+            rate_limit="media-fetch",
+            retries=1,
+        )
+        image_id = store_image(response.content)
+    except (requests.RequestException, CircuitOpenError, AdmissionRejected, DeadlineExceeded, ValueError, OSError) as e:
+        print(f"Could not cache generated image: {e}")
+        return None
+    # The cache is local to this instance, so clients keep the upstream URL and
+    # can use the derivatives when they reach an instance that has them
+    return {
+        "url": url,
+        "optimized_url": derivative_url(image_id),
+        "thumbnail_url": derivative_url(image_id, THUMBNAIL_WIDTH),
+        "image_id": image_id,
+        "original_url": url,
+    }
 
 def validate_image_url(url):
     """Validate if an image URL is accessible"""
+    if is_fallback_image_url(url):
+        # Rendered and served by this app, no need for a round trip
+        return True
+    if not has_budget(VALIDATION_MIN_BUDGET):
+        # Not enough time left to check, trust the URL rather than blow the deadline
+        return True
     try:
         import requests
         from requests.exceptions import RequestException
         
-        response = requests.head(url, timeout=5)
+        response = call_upstream(
+            "media-fetch",
+            lambda: requests.head(url, timeout=stage_timeout(5)),
+            rate_limit="media-fetch",
+            retries=0,
+        )
         return response.status_code == 200
-    except RequestException:
+    except (RequestException, CircuitOpenError, AdmissionRejected, DeadlineExceeded):
         return False
 
 def get_fallback_image_url(type="generic"):
-    """Get a fallback image URL based on type"""
-    fallback_images = {
-        "flirt": [
-            "https://placehold.co/1024x1024/e879f9/ffffff?text=Flirting+Scenario",
-            "https://placehold.co/1024x1024/d946ef/ffffff?text=Dating+Scene"
-        ],
-        "date": [
-            "https://placehold.co/1024x1024/9333ea/ffffff?text=Date+Conversation",
-            "https://placehold.co/1024x1024/7e22ce/ffffff?text=Romance+Scene"
-        ],
-        "generic": [
-            "https://placehold.co/1024x1024/6d28d9/ffffff?text=Image+Unavailable",
-            "https://placehold.co/1024x1024/4c1d95/ffffff?text=Try+Again+Later"
-        ]
-    }
-    
-    import random
-    image_list = fallback_images.get(type, fallback_images["generic"])
-    return random.choice(image_list)
+    """Get a fallback image URL based on type, served locally from /api/fallback-images"""
+    return fallback_image_url(type)
 
 def evaluate_rizz(message, context="casual conversation"):
     """
@@ -165,21 +276,11 @@ def evaluate_rizz(message, context="casual conversation"):
         cleaned_message = message.strip().lower()
         word_count = len(cleaned_message.split())
         
-        # Detect if it contains common overused pickup lines
-        common_lines = [
-            "did it hurt when you fell from heaven",
-            "are you a parking ticket",
-            "did we have class together",
-            "do you believe in love at first sight",
-            "is your name google",
-            "are you wifi",
-            "if you were a vegetable",
-            "are you from tennessee",
-            "are you a magician",
-            "is your dad a baker"
-        ]
-        
-        is_generic = any(line in cleaned_message for line in common_lines)
+        # Detect if it contains (a variation of) a common overused pickup line
+        known_line = find_known_line(message)
+        is_generic = known_line is not None
+        if is_generic:
+            print(f"[DEBUG] Message matches known line {known_line[1]!r} (similarity {known_line[0]:.2f})")
         
         # Check for question vs. statement
         is_question = "?" in message
@@ -390,26 +491,10 @@ def transcribe_audio(audio_url):
     """
     try:
         # Download the audio file
-        audio_response = requests.get(audio_url)
-        audio_response.raise_for_status()
-        
-        # Save to a temporary file
-        temp_file = "temp_audio.mp3"
-        with open(temp_file, "wb") as f:
-            f.write(audio_response.content)
-        
-        # Transcribe the audio file
-        with open(temp_file, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
-                model="whisper-1",
-                file=audio_file
-            )
-        
-        # Clean up
-        os.remove(temp_file)
+        audio_response = call_upstream("media-fetch", lambda: fetch(audio_url, stage_timeout(30)), rate_limit="media-fetch")
         
         return {
-            "text": transcription.text,
+            "text": transcribe_bytes(audio_response.content),
             "success": True
         }
         
@@ -421,6 +506,71 @@ def transcribe_audio(audio_url):
             "error": str(e)
         }
 
+def transcribe_bytes(audio_bytes, filename="audio.mp3"):
+    """
+    Transcribes audio held in memory with Whisper, cached by the audio's content
+
+    Args:
+        audio_bytes (bytes): The encoded audio
+        filename (str): Name sent to the API, which uses its extension to detect the format
+
+    Returns:
+        str: The transcribed text
+    """
+    def transcribe():
+        # Sent from memory so a retry can send the same bytes again
+        transcription = call_upstream(
+            "openai:whisper-1",
+            lambda: openai_client().audio.transcriptions.create(
+                model="whisper-1",
+                file=(filename, audio_bytes),
+                timeout=stage_timeout(120, "transcription")
+            ),
+            rate_limit="openai-audio",
+        )
+        return transcription.text
+
+    return cached("transcription", cache_key("whisper-1", hashlib.sha256(audio_bytes).hexdigest()), transcribe)
+
+def completion_cacheable(params):
+    """Whether a completion gives the same answer to the same request, or caching sampled ones is allowed"""
+    # The API samples at temperature 1 when none is given
+    return CACHE_SAMPLED_COMPLETIONS or params.get("temperature", 1) == 0
+
+def cached_completion(stage, timeout_cap, reserve=0, call_type=None, **params):
+    """
+    Text of a chat completion, cached by its parameters so that identical requests
+    (retries, resubmitted jobs, other workers) don't pay for the same completion twice
+
+    Sampled completions are not cached unless CACHE_SAMPLED_COMPLETIONS is set.
+
+    Args:
+        stage (str): Stage name used in deadline errors
+        timeout_cap (float): Longest the call may take, further capped by the request deadline
+        reserve (float): Seconds of request budget to leave for later stages
+        call_type (str): Router call type the model was picked for, so the call's
+            latency or failure is recorded against the model
+        **params: Arguments for chat.completions.create
+
+    Returns:
+        str: The content of the first choice
+    """
+    def complete():
+        with observe(call_type, params["model"]):
+            response = call_upstream(
+                f"openai:{params['model']}",
+                lambda: openai_client().chat.completions.create(
+                    **params,
+                    timeout=stage_timeout(timeout_cap, stage, reserve=reserve),
+                ),
+                rate_limit="openai-chat",
+            )
+        return response.choices[0].message.content
+
+    if not completion_cacheable(params):
+        return complete()
+    return cached("completion", cache_key(params), complete)
+
 def generate_speech(text, voice="alloy", use_advanced_model=False):
     """
     Generates speech from text using OpenAI's Text-to-Speech API
@@ -433,44 +583,73 @@ def generate_speech(text, voice="alloy", use_advanced_model=False):
     Returns:
         dict: Audio data and metadata
     """
+    if use_advanced_model and not has_budget(SPEECH_REWRITE_MIN_BUDGET):
+        print("[DEBUG] Not enough time left for the advanced TTS model, using standard")
+        use_advanced_model = False
+
+    # Failures aren't cached
+    return cached(
+        "speech",
+        cache_key(text, voice, use_advanced_model),
+        lambda: synthesize_speech(text, voice, use_advanced_model),
+        should_cache=lambda speech: speech.get("audio") is not None,
+    )
+
+def speech_rewrite_request(text):
+    """Chat completion parameters for rewriting text so the advanced TTS model speaks it with emotion"""
+    return {
+        **model_route("speech_rewrite"),
+        "messages": [
+            {"role": "system", "content": "You are an AI that speaks with natural emotion and tone."},
+            {"role": "user", "content": text}
+        ],
+        "temperature": 0.7,
+    }
+
+def synthesize_speech(text, voice, use_advanced_model):
+    """Generates new speech for generate_speech, bypassing the cache"""
     try:
         if use_advanced_model:
             # Try using the advanced model
             try:
                 # This model understands how to speak with the right emotion and tone
-                response = client.chat.completions.create(
-                    model=ensure_allowed_model("gpt-3.5-turbo"),
-                    messages=[
-                        {"role": "system", "content": "You are an AI that speaks with natural emotion and tone."},
-                        {"role": "user", "content": text}
-                    ],
-                    temperature=0.7,
-                    max_tokens=150
-                )
-                
-                # Extract the content from the response for text-to-speech
-                tts_text = response.choices[0].message.content
+                tts_text = cached_completion("speech rewrite", 30, call_type="speech_rewrite", **speech_rewrite_request(text))
                 
                 # Generate speech with the processed text
-                speech_response = client.audio.speech.create(
-                    model="tts-1-hd",  # Using HD model for better quality
-                    voice=voice,
-                    input=tts_text
+                speech_response = call_upstream(
+                    "openai:tts-1-hd",
+                    lambda: openai_client().audio.speech.create(
+                        model="tts-1-hd",  # Using HD model for better quality
+                        voice=voice,
+                        input=tts_text,
+                        timeout=stage_timeout(60, "speech")
+                    ),
+                    rate_limit="openai-audio",
                 )
                 
             except Exception as e:
                 print(f"Error using advanced TTS model, falling back to standard: {e}")
-                speech_response = client.audio.speech.create(
-                    model="tts-1",
-                    voice=voice,
-                    input=text
+                speech_response = call_upstream(
+                    "openai:tts-1",
+                    lambda: openai_client().audio.speech.create(
+                        model="tts-1",
+                        voice=voice,
+                        input=text,
+                        timeout=stage_timeout(60, "speech")
+                    ),
+                    rate_limit="openai-audio",
                 )
         else:
             # Use standard TTS
-            speech_response = client.audio.speech.create(
-                model="tts-1",
-                voice=voice,
-                input=text
+            speech_response = call_upstream(
+                "openai:tts-1",
+                lambda: openai_client().audio.speech.create(
+                    model="tts-1",
+                    voice=voice,
+                    input=text,
+                    timeout=stage_timeout(60, "speech")
+                ),
+                rate_limit="openai-audio",
             )
         
         # Get audio data
@@ -491,52 +670,26 @@ def generate_speech(text, voice="alloy", use_advanced_model=False):
             "format": None
         }
 
-def simulate_date(message, context=None):
+def extract_date_responses(simulation_text):
     """
-    Simulates a date scenario based on the user's input and evaluates how it would go
-    
+    Extracts the date's lines from a simulated dialogue
+
     Args:
-        message (str): The user's approach or conversation starter
-        context (str): The dating context (e.g., "restaurant", "coffee shop", "park")
-        
+        simulation_text (str): The dialogue produced by the simulation prompt
+
     Returns:
-        dict: Date simulation results with scenario, response, outcome and score
+        list: The text of every line spoken by the date, in order
     """
-    try:
-        # If no context is provided, randomly select one
-        if not context:
-            import random
-            
-            # Create a diverse list of dating contexts
-            contexts = [
-                "coffee shop",
-                "upscale restaurant",
-                "casual bar",
-                "art gallery opening",
-                "bookstore",
-                "park picnic",
-                "beach sunset",
-                "rooftop lounge",
-                "museum tour",
-                "hiking trail",
-                "wine tasting",
-                "cooking class",
-                "farmers market",
-                "concert venue",
-                "botanical garden",
-                "ice cream parlor",
-                "arcade",
-                "bowling alley",
-                "jazz club",
-                "food truck festival"
-            ]
-            
-            # Select a random context
-            context = random.choice(contexts)
-            print(f"Randomly selected context: {context}")
-        
-        # Create a system prompt for the date simulation
-        system_prompt = f"""
+    date_responses = []
+    for line in simulation_text.split('\n'):
+        if line.startswith('Date:'):
+            date_response = line.replace('Date:', '').strip()
+            date_responses.append(date_response)
+    return date_responses
+
+def date_simulation_request(message, context):
+    """Chat completion parameters for the dialogue of a two_call simulation"""
+    system_prompt = f"""
         You are a dating coach AI that simulates realistic dating scenarios. 
         Based on the user's conversation starter or approach in a {context} setting, 
         create a detailed simulation of how the date would unfold.
@@ -556,112 +709,18 @@ def simulate_date(message, context=None):
         2. Specific feedback on what worked well
         3. Suggestions for improvement
         """
-        
-        # Call the OpenAI API with GPT-3.5-turbo
-        response = client.chat.completions.create(
-            model=ensure_allowed_model("gpt-3.5-turbo"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": message}
-            ],
-            temperature=0.7,
-            max_tokens=800,
-        )
-        
-        # Parse the response to extract the date simulation components
-        simulation_text = response.choices[0].message.content
-        
-        # Use a better prompt for DALL-E 3 image generation
-        image_prompt = f"""Create a stylized, artistic illustration of a romantic date conversation in a {context} setting.
-Two people engaging in conversation with appropriate body language showing interest.
-Vibrant colors, non-photorealistic style, modern aesthetic.
-No text overlay. Focus on the emotional connection between the people."""
+    return {
+        **model_route("simulation_dialogue"),
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message}
+        ],
+        "temperature": 0.7,
+    }
 
-        # Setup multiple fallback image URLs
-        placeholder_image_url = "https://placehold.co/1024x1024/9333ea/ffffff?text=Date+Simulation+Image+Loading"
-        static_fallback_images = [
-            "https://placehold.co/1024x1024/9333ea/ffffff?text=Date+Conversation",
-            "https://placehold.co/1024x1024/7e22ce/ffffff?text=Romance+Scene",
-            "https://placehold.co/1024x1024/6d28d9/ffffff?text=Dating+Simulation"
-        ]
-        
-        # Set up image generation with a shorter timeout and better error handling
-        image_url = None
-        try:
-            # Try DALL-E 3 first (best quality)
-            image_response = client.images.generate(
-                model="dall-e-3",
-                prompt=image_prompt,
-                size="1024x1024",
-                quality="standard",
-                n=1,
-                timeout=30,  # 30 second timeout
-            )
-            if hasattr(image_response, 'data') and len(image_response.data) > 0 and hasattr(image_response.data[0], 'url'):
-                image_url = image_response.data[0].url
-                print(f"Successfully generated DALL-E 3 image: {image_url[:60]}...")
-        except Exception as img_error:
-            print(f"DALL-E 3 image generation error: {str(img_error)}")
-            
-        # If DALL-E 3 failed, try DALL-E 2
-        if not image_url:
-            try:
-                print("Falling back to DALL-E 2...")
-                fallback_response = client.images.generate(
-                    model="dall-e-2",
-                    prompt=f"Artistic illustration of two people on a date in a {context}",
-                    size="1024x1024",
-                    quality="standard",
-                    n=1,
-                    timeout=20,  # 20 second timeout
-                )
-                if hasattr(fallback_response, 'data') and len(fallback_response.data) > 0 and hasattr(fallback_response.data[0], 'url'):
-                    image_url = fallback_response.data[0].url
-                    print(f"Successfully generated DALL-E 2 image: {image_url[:60]}...")
-            except Exception as fallback_error:
-                print(f"DALL-E 2 fallback image generation error: {str(fallback_error)}")
-        
-        # If all dynamic generation failed, use one of the static fallback images
-        if not image_url:
-            image_url = get_fallback_image_url("date")
-            print(f"Using static fallback image: {image_url}")
-        
-        # Validate the image URL (perform a HEAD request to verify it's accessible)
-        if not validate_image_url(image_url):
-            image_url = get_fallback_image_url("date")
-            print(f"Using fallback image after URL validation failure")
-        
-        # Extract the date's responses from the simulation text for text-to-speech
-        date_responses = []
-        for line in simulation_text.split('\n'):
-            if line.startswith('Date:'):
-                date_response = line.replace('Date:', '').strip()
-                date_responses.append(date_response)
-        
-        # Generate speech for the date's responses
-        date_speech = None
-        if date_responses:
-            # Join with a pause between responses
-            combined_responses = " ... ".join(date_responses)
-            
-            # Use the advanced TTS model for more natural and emotional delivery
-            description = ""
-            if "flirty" in context.lower() or "bar" in context.lower():
-                description = "Speak this in a flirtatious, warm manner"
-            elif "restaurant" in context.lower() or "fancy" in context.lower():
-                description = "Speak this in a sophisticated, elegant manner"
-            elif "coffee" in context.lower() or "casual" in context.lower():
-                description = "Speak this in a casual, friendly manner"
-            
-            # Use more natural, emotional speech for the date
-            date_speech = generate_speech(
-                combined_responses, 
-                voice="nova", 
-                use_advanced_model=True
-            )
-        
-        # Use a second API call to analyze and score the date
-        analysis_prompt = f"""
+def date_analysis_request(simulation_text):
+    """Chat completion parameters for the analysis call of a two_call simulation"""
+    analysis_prompt = f"""
         Based on this date scenario:
         
         {simulation_text}
@@ -675,59 +734,271 @@ No text overlay. Focus on the emotional connection between the people."""
         
         Format as a JSON object with keys: overall_score, chemistry_score, conversation_score, strengths, improvements
         """
-        
-        analysis_response = client.chat.completions.create(
-            model=ensure_allowed_model("gpt-3.5-turbo"),
-            messages=[
-                {"role": "system", "content": "You are a dating coach AI. Respond only with the requested JSON format."},
-                {"role": "user", "content": analysis_prompt}
-            ],
-            temperature=0.3,
-            response_format={"type": "json_object"},
-        )
-        
+    return {
+        **model_route("analysis"),
+        "messages": [
+            {"role": "system", "content": "You are a dating coach AI. Respond only with the requested JSON format."},
+            {"role": "user", "content": analysis_prompt}
+        ],
+        "temperature": 0.3,
+        "response_format": {"type": "json_object"},
+    }
+
+def structured_date_request(message, context):
+    """Chat completion parameters for a structured simulation, which returns the dialogue and its analysis as one JSON object"""
+    system_prompt = f"""
+        You are a dating coach AI that simulates realistic dating scenarios. 
+        Based on the user's conversation starter or approach in a {context} setting, 
+        simulate how the date would unfold as a dialogue between the user and their date,
+        starting with the user's opening line and continuing for 3-4 exchanges, then evaluate it.
+        
+        Respond only with a JSON object with these keys:
+        - setting: brief description of the {context} setting with specific details
+        - dialogue: list of {{"speaker": "you" or "date", "text": what they say}}, in order
+        - analysis: object with overall_score (1-10), chemistry_score (1-10),
+          conversation_score (1-10), strengths (3 strings) and improvements (3 strings)
+        """
+    return {
+        **model_route("simulation"),
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": message}
+        ],
+        "temperature": 0.7,
+        "response_format": {"type": "json_object"},
+    }
+
+def parse_structured_date(content):
+    """
+    Reads a structured simulation
+
+    Args:
+        content (str): The JSON returned for structured_date_request
+
+    Returns:
+        tuple: (scenario, date_responses, analysis), with the scenario rendered in the
+        same "Date Setting:/You:/Date:" format as a two_call simulation, or None if
+        content is not a usable simulation
+    """
+    try:
+        data = json.loads(content)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(data, dict) or not isinstance(data.get("dialogue"), list) or not isinstance(data.get("analysis"), dict):
+        return None
+
+    lines = [f"Date Setting: {data.get('setting', '')}".strip(), ""]
+    date_responses = []
+    for turn in data["dialogue"]:
+        if not isinstance(turn, dict) or not str(turn.get("text", "")).strip():
+            continue
+        text = str(turn["text"]).strip()
+        if str(turn.get("speaker", "")).lower() == "date":
+            lines.append(f"Date: {text}")
+            date_responses.append(text)
+        else:
+            lines.append(f"You: {text}")
+    if not date_responses:
+        return None
+    return "\n".join(lines), date_responses, data["analysis"]
+
+def date_image_prompt(context):
+    return f"""Create a stylized, artistic illustration of a romantic date conversation in a {context} setting.
+Two people engaging in conversation with appropriate body language showing interest.
+Vibrant colors, non-photorealistic style, modern aesthetic.
+No text overlay. Focus on the emotional connection between the people."""
+
+def resolve_date_mode(mode):
+    """The simulation mode to use, DATE_SIMULATION_MODE unless one is given"""
+    mode = mode or DATE_SIMULATION_MODE
+    if mode not in DATE_SIMULATION_MODES:
+        print(f"[DEBUG] Unknown date simulation mode {mode!r}, using structured")
+        mode = "structured"
+    return mode
+
+def simulation_call(mode, message, context):
+    """cached_completion arguments (besides the stage) for a date simulation in the given mode"""
+    if mode == "structured":
+        # Gets the dialogue and the analysis from this one call
+        return {"call_type": "simulation", **structured_date_request(message, context)}
+    # Leaves time for the separate analysis call
+    return {"reserve": ANALYSIS_RESERVE, "call_type": "simulation_dialogue", **date_simulation_request(message, context)}
+
+def read_simulation(mode, simulation_text):
+    """
+    Returns:
+        tuple: (scenario, date_responses, analysis); analysis is None in two_call
+        mode, where it comes from a separate call
+    """
+    if mode != "structured":
+        # Extract the date's responses from the simulation text for text-to-speech
+        return simulation_text, extract_date_responses(simulation_text), None
+    structured = parse_structured_date(simulation_text)
+    if structured:
+        return structured
+    print("[DEBUG] Structured date simulation was not valid, using the default analysis")
+    return simulation_text, extract_date_responses(simulation_text or ""), DEFAULT_DATE_ANALYSIS
+
+def read_date_analysis(analysis_text):
+    try:
+        return json.loads(analysis_text)
+    except (TypeError, ValueError):
+        return DEFAULT_DATE_ANALYSIS
+
+def date_image_attempts(context):
+    """(model, minimum budget, timeout cap, prompt) of each image model to try for a date"""
+    prompts = {
+        "dall-e-3": date_image_prompt(context),
+        "dall-e-2": f"Artistic illustration of two people on a date in a {context}",
+    }
+    return [(model, min_budget, timeout_cap, prompts[model]) for model, min_budget, timeout_cap in IMAGE_ATTEMPTS]
+
+def date_image_fields(image_url, image):
+    """
+    The date's image_url and extra result fields, given what localize_image made of the generated image
+
+    Returns:
+        tuple: (image_url, extra result fields for a locally cached image)
+    """
+    if image is None:
+        print("Using fallback image after URL validation failure")
+        return get_fallback_image_url("date"), {}
+    if "image_id" not in image:
+        return image_url, {}
+    return image["url"], {
+        "optimized_image_url": image["optimized_url"],
+        "thumbnail_url": image["thumbnail_url"],
+        "image_id": image["image_id"],
+        "original_image_url": image["original_url"],
+    }
+
+def date_result(simulation_text, image, context, analysis, speech, skipped_stages):
+    image_url, image_fields = image
+    return {
+        "scenario": simulation_text,
+        "image_url": image_url,
+        **image_fields,
+        "context": context,
+        "analysis": analysis,
+        "date_speech": speech,
+        **({"skipped_stages": skipped_stages} if skipped_stages else {})
+    }
+
+def date_image(context, reserve, skipped_stages):
+    """
+    The image for a simulated date; images are optional, so they are skipped
+    when the request deadline is too close
+
+    Returns:
+        tuple: (image_url, extra result fields for a locally cached image)
+    """
+    image_url = None
+    for model, min_budget, timeout_cap, prompt in date_image_attempts(context):
         try:
-            # Parse the JSON response
-            analysis = json.loads(analysis_response.choices[0].message.content)
-        except:
-            # Fallback if JSON parsing fails
-            analysis = {
-                "overall_score": 7,
-                "chemistry_score": 6,
-                "conversation_score": 7,
-                "strengths": [
-                    "Good opening approach",
-                    "Maintained positive tone",
-                    "Showed genuine interest"
-                ],
-                "improvements": [
-                    "Could ask more open-ended questions",
-                    "Be more specific with compliments",
-                    "Add more humor to lighten the mood"
-                ]
-            }
-        
-        # Return the complete simulation results
-        return {
-            "scenario": simulation_text,
-            "image_url": image_url,
-            "context": context,
-            "analysis": analysis,
-            "date_speech": date_speech
-        }
-        
+            if not has_budget(min_budget, reserve=reserve):
+                raise DeadlineExceeded(model)
+            image_url = generate_image_url(model, prompt, timeout_cap, reserve=reserve, quality="standard")
+        except Exception as e:
+            print(f"{model} image generation error: {str(e)}")
+        if image_url:
+            break
+
+    if not image_url:
+        skipped_stages.append("image")
+        return get_fallback_image_url("date"), {}
+    # Download the image into the local cache, which also verifies it's accessible
+    return date_image_fields(image_url, localize_image(image_url))
+
+def date_speech(date_responses, reserve, skipped_stages):
+    """The date's lines read out, or None if there are none or no time for them"""
+    if not date_responses:
+        return None
+    if not has_budget(SPEECH_MIN_BUDGET, reserve=reserve):
+        skipped_stages.append("speech")
+        print("[DEBUG] Skipping date speech, not enough time left before the deadline")
+        return None
+    # Natural, emotional speech with a pause between responses, leaving time for the analysis
+    with reserve_budget(reserve):
+        return generate_speech(" ... ".join(date_responses), voice="nova", use_advanced_model=True)
+
+def start_media_task(fn, *args):
+    """
+    Starts fn(*args) on the media bulkhead, with the caller's context variables
+    (deadline, budget reserve), to overlap with the caller's own work
+
+    The caller usually holds a media worker itself, so a task that is still
+    queued when its result is wanted, or that the full pool rejected, runs on
+    the calling thread instead of waiting behind it.
+
+    Returns:
+        callable: Returns fn's result, waiting for it if it is running
+    """
+    try:
+        future = get_bulkhead("media").submit(fn, *args)
+    except AdmissionRejected:
+        future = None
+
+    def result():
+        if future is None or future.cancel():
+            return fn(*args)
+        return future.result()
+
+    return result
+
+def simulate_date(message, context=None, mode=None):
+    """
+    Simulates a date scenario based on the user's input and evaluates how it would go
+
+    The image and the speech are made at the same time, since neither depends on
+    the other. async_tools.simulate_date is the same flow with awaits.
+
+    Args:
+        message (str): The user's approach or conversation starter
+        context (str): The dating context (e.g., "restaurant", "coffee shop", "park")
+        mode (str): "structured" or "two_call", defaults to DATE_SIMULATION_MODE
+
+    Returns:
+        dict: Date simulation results with scenario, response, outcome and score
+    """
+    mode = resolve_date_mode(mode)
+    # Later stages only need to leave time for the analysis when it is a separate call
+    analysis_reserve = ANALYSIS_RESERVE if mode == "two_call" else 0
+
+    try:
+        if not context:
+            context = random.choice(DATE_CONTEXTS)
+            print(f"Randomly selected context: {context}")
+
+        simulation_text = cached_completion("date simulation", 60, **simulation_call(mode, message, context))
+        simulation_text, date_responses, analysis = read_simulation(mode, simulation_text)
+
+        skipped_stages = []
+        speech = start_media_task(date_speech, date_responses, analysis_reserve, skipped_stages)
+        image = date_image(context, analysis_reserve, skipped_stages)
+        speech = speech()
+
+        if analysis is None:
+            analysis = read_date_analysis(cached_completion(
+                "date analysis", 30, call_type="analysis", **date_analysis_request(simulation_text)))
+
+        return date_result(simulation_text, image, context, analysis, speech, skipped_stages)
+
     except Exception as e:
         print(f"Error simulating date: {e}")
-        return {
-            "scenario": "There was an error simulating the date scenario.",
-            "image_url": get_fallback_image_url("date"),
-            "context": context,
-            "analysis": {
-                "overall_score": 5,
-                "chemistry_score": 5,
-                "conversation_score": 5,
-                "strengths": ["Unable to analyze strengths"],
-                "improvements": ["Unable to provide improvements"]
-            },
-            "error": str(e)
-        }
+        return date_error_result(context, e)
+
+def date_error_result(context, error):
+    """What simulate_date returns when the simulation fails"""
+    return {
+        "scenario": "There was an error simulating the date scenario.",
+        "image_url": get_fallback_image_url("date"),
+        "context": context,
+        "analysis": {
+            "overall_score": 5,
+            "chemistry_score": 5,
+            "conversation_score": 5,
+            "strengths": ["Unable to analyze strengths"],
+            "improvements": ["Unable to provide improvements"]
+        },
+        "error": str(error)
+    }
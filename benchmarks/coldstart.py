@@ -0,0 +1,148 @@
+"""Cold-start profile and budget check for the serverless entry point.
+
+Usage:
+    python -m benchmarks.coldstart                 # report and check the budgets
+    python -m benchmarks.coldstart --runs 10 --top 30
+
+Every measurement runs in a fresh interpreter. The report lists the modules
+that dominate `import api.index` (from `python -X importtime`), then checks:
+
+- cold import time of api.index against COLDSTART_IMPORT_BUDGET (seconds)
+- latency of the first /api/chat request, which pays for the lazily loaded
+  OpenAI client and tools, against COLDSTART_FIRST_REQUEST_BUDGET (seconds)
+- that none of the heavy dependencies are imported eagerly
+
+The first request is sent to an unreachable OpenAI base URL, so it measures
+our own work without depending on the network. Exits with status 1 when a
+check fails.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_BUDGET = float(os.environ.get("COLDSTART_IMPORT_BUDGET", "2.0"))
+FIRST_REQUEST_BUDGET = float(os.environ.get("COLDSTART_FIRST_REQUEST_BUDGET", "1.5"))
+
+# Must only be loaded by the request paths that need them
+LAZY_MODULES = ["openai", "requests", "PIL", "httpx", "api.utils.tools", "api.utils.async_tools"]
+
+IMPORT_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import api.index
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "eager": [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+FIRST_REQUEST_SCRIPT = """
+import asyncio, json, time
+from api.index import app
+
+async def first_request():
+    body = json.dumps({"messages": [{"role": "user", "content": "hi"}]}).encode()
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+        "method": "POST", "scheme": "http", "path": "/api/chat", "raw_path": b"/api/chat",
+        "root_path": "", "query_string": b"", "server": ("testserver", 80), "client": ("127.0.0.1", 1),
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+    }
+    received = []
+
+    async def receive():
+        if received:
+            await asyncio.sleep(3600)
+        received.append(True)
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    status = []
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    start = time.perf_counter()
+    await app({**scope}, receive, send)
+    return time.perf_counter() - start, status[0]
+
+seconds, status = asyncio.run(first_request())
+print(json.dumps({"seconds": seconds, "status": status}))
+"""
+
+
+def run_python(args, script=None, env=None):
+    environment = dict(os.environ)
+    environment.update({
+        "OPENAI_API_KEY": environment.get("OPENAI_API_KEY", "sk-coldstart"),
+        "OPENAI_BASE_URL": "http://127.0.0.1:9/v1",
+        "UPSTREAM_RETRIES": "0",
+    })
+    environment.update(env or {})
+    command = [sys.executable] + args + (["-c", script] if script else [])
+    return subprocess.run(command, cwd=ROOT, env=environment, capture_output=True, text=True, check=True)
+
+
+def import_profile(runs):
+    """Self time per module, summed per top-level package, best of several runs"""
+    best = {}
+    for _ in range(runs):
+        result = run_python(["-X", "importtime"], "import api.index")
+        totals = defaultdict(float)
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            name = name.strip()
+            group = name if name.startswith("api.") else name.split(".")[0]
+            totals[group] += int(self_us) / 1e6
+        for group, seconds in totals.items():
+            best[group] = min(best.get(group, seconds), seconds)
+    return best
+
+
+def best_of(runs, script):
+    results = [json.loads(run_python([], script).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    return min(results, key=lambda result: result["seconds"])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--import-budget", type=float, default=IMPORT_BUDGET)
+    parser.add_argument("--first-request-budget", type=float, default=FIRST_REQUEST_BUDGET)
+    args = parser.parse_args(argv)
+
+    profile = import_profile(args.runs)
+    print(f"Import profile of api.index (self time, best of {args.runs} runs):")
+    for group, seconds in sorted(profile.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {group:40s} {seconds * 1000:8.1f} ms")
+    print(f"  {'total':40s} {sum(profile.values()) * 1000:8.1f} ms")
+
+    failures = []
+
+    cold_import = best_of(args.runs, IMPORT_SCRIPT)
+    print(f"Cold import:   {cold_import['seconds'] * 1000:8.1f} ms (budget {args.import_budget * 1000:.0f} ms)")
+    if cold_import["seconds"] > args.import_budget:
+        failures.append("cold import time over budget")
+    if cold_import["eager"]:
+        print(f"Eagerly imported: {', '.join(cold_import['eager'])}")
+        failures.append("heavy modules imported at startup")
+
+    first_request = best_of(args.runs, FIRST_REQUEST_SCRIPT)
+    print(f"First request: {first_request['seconds'] * 1000:8.1f} ms (budget {args.first_request_budget * 1000:.0f} ms, status {first_request['status']})")
+    if first_request["seconds"] > args.first_request_budget:
+        failures.append("first request latency over budget")
+
+    if failures:
+        print("FAILED: " + "; ".join(failures))
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Latency and token cost of the two simulate_date modes, against the live API.
+
+Usage:
+    python -m benchmarks.date_modes              # 5 runs per mode
+    python -m benchmarks.date_modes --runs 10 --context "jazz club"
+
+Only the chat completions that differ between the modes are measured (images
+and speech are the same in both): "two_call" writes the dialogue and then sends
+it back for a JSON analysis, "structured" asks for both in one JSON completion.
+The cache is bypassed, so every run pays for real completions. Needs
+OPENAI_API_KEY.
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from api.utils.clients import openai_client
+from api.utils.tools import (
+    date_analysis_request,
+    date_simulation_request,
+    parse_structured_date,
+    structured_date_request,
+)
+
+OPENERS = [
+    "Hey, I couldn't help noticing you're reading my favourite book. How far in are you?",
+    "Did it hurt when you fell from heaven?",
+    "I'm terrible at this, but I'd regret not saying hi. I'm Sam.",
+]
+
+
+def complete(params):
+    """Returns (content, seconds, prompt_tokens, completion_tokens) for one completion"""
+    start = time.perf_counter()
+    response = openai_client().chat.completions.create(**params)
+    seconds = time.perf_counter() - start
+    return response.choices[0].message.content, seconds, response.usage.prompt_tokens, response.usage.completion_tokens
+
+
+def run_two_call(message, context):
+    scenario, seconds, prompt_tokens, completion_tokens = complete(date_simulation_request(message, context))
+    _, analysis_seconds, analysis_prompt, analysis_completion = complete(date_analysis_request(scenario))
+    return {
+        "seconds": seconds + analysis_seconds,
+        "prompt_tokens": prompt_tokens + analysis_prompt,
+        "completion_tokens": completion_tokens + analysis_completion,
+        "valid": True,
+    }
+
+
+def run_structured(message, context):
+    content, seconds, prompt_tokens, completion_tokens = complete(structured_date_request(message, context))
+    return {
+        "seconds": seconds,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "valid": parse_structured_date(content) is not None,
+    }
+
+
+MODES = {
+    "two_call": run_two_call,
+    "structured": run_structured,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--context", default="coffee shop")
+    args = parser.parse_args(argv)
+
+    summaries = {}
+    for mode, run in MODES.items():
+        results = [run(OPENERS[i % len(OPENERS)], args.context) for i in range(args.runs)]
+        seconds = [result["seconds"] for result in results]
+        summaries[mode] = {
+            "median_seconds": statistics.median(seconds),
+            "max_seconds": max(seconds),
+            "prompt_tokens": statistics.mean(result["prompt_tokens"] for result in results),
+            "completion_tokens": statistics.mean(result["completion_tokens"] for result in results),
+            "invalid": sum(not result["valid"] for result in results),
+        }
+
+    print(f"{'mode':12s} {'median s':>9s} {'max s':>7s} {'prompt tok':>11s} {'compl tok':>10s} {'invalid':>8s}")
+    for mode, summary in summaries.items():
+        print(
+            f"{mode:12s} {summary['median_seconds']:9.2f} {summary['max_seconds']:7.2f} "
+            f"{summary['prompt_tokens']:11.0f} {summary['completion_tokens']:10.0f} {summary['invalid']:8d}"
+        )
+
+    two_call, structured = summaries["two_call"], summaries["structured"]
+    print(
+        f"structured vs two_call: {structured['median_seconds'] / two_call['median_seconds'] - 1:+.0%} latency, "
+        f"{(structured['prompt_tokens'] + structured['completion_tokens']) / (two_call['prompt_tokens'] + two_call['completion_tokens']) - 1:+.0%} tokens"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
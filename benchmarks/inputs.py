@@ -0,0 +1,123 @@
+"""Realistic generated inputs for the microbenchmarks.
+
+Every generator is seeded so that the same case produces the same input on
+every run, which keeps timings comparable against the stored baseline.
+"""
+import base64
+import json
+import random
+from types import SimpleNamespace
+
+from api.utils.attachment import ClientAttachment
+from api.utils.prompt import ClientMessage, ToolInvocation, ToolInvocationState
+
+WORDS = (
+    "hey you look amazing tonight did it hurt when fell from heaven coffee "
+    "shop smile laugh funny maybe sorry think feel beautiful clever dinner "
+    "music dance walk park sunset really want know more about your day"
+).split()
+
+TOOL_NAMES = ["get_current_weather", "evaluate_rizz", "generate_rizz_image", "simulate_date"]
+
+
+def sentence(rng, words):
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def tool_invocation(rng, index):
+    name = TOOL_NAMES[index % len(TOOL_NAMES)]
+    return ToolInvocation(
+        state=ToolInvocationState.RESULT,
+        toolCallId=f"call_{index:06d}",
+        toolName=name,
+        args={"message": sentence(rng, 12), "context": "bar"},
+        result={
+            "score": rng.randint(1, 10),
+            "feedback": sentence(rng, 30),
+            "improvements": [sentence(rng, 8) for _ in range(3)],
+        },
+    )
+
+
+def image_attachment(rng, size_bytes):
+    payload = base64.b64encode(rng.randbytes(size_bytes)).decode("ascii")
+    return ClientAttachment(
+        name="photo.png",
+        contentType="image/png",
+        url=f"data:image/png;base64,{payload}",
+    )
+
+
+def history(messages=200, tool_calls_per_message=0, attachment_bytes=0, words_per_message=40, seed=0):
+    """Builds a chat history alternating user and assistant messages"""
+    rng = random.Random(seed)
+    result = []
+    call_index = 0
+    for i in range(messages):
+        role = "user" if i % 2 == 0 else "assistant"
+        attachments = None
+        invocations = None
+        if role == "user" and attachment_bytes:
+            attachments = [image_attachment(rng, attachment_bytes)]
+        if role == "assistant" and tool_calls_per_message:
+            invocations = []
+            for _ in range(tool_calls_per_message):
+                invocations.append(tool_invocation(rng, call_index))
+                call_index += 1
+        result.append(ClientMessage(
+            role=role,
+            content=sentence(rng, words_per_message),
+            experimental_attachments=attachments,
+            toolInvocations=invocations,
+        ))
+    return result
+
+
+def _chunk(content=None, tool_calls=None, finish_reason=None):
+    delta = SimpleNamespace(content=content, tool_calls=tool_calls)
+    choice = SimpleNamespace(delta=delta, finish_reason=finish_reason)
+    return SimpleNamespace(id="chatcmpl-benchmark", choices=[choice], usage=None)
+
+
+def _tool_delta(id, name, arguments):
+    return SimpleNamespace(id=id, function=SimpleNamespace(name=name, arguments=arguments))
+
+
+def completion_chunks(text_deltas=400, tool_calls=0, argument_deltas=20, seed=0):
+    """Builds the chunk sequence an OpenAI streaming completion would produce"""
+    rng = random.Random(seed)
+    chunks = [_chunk(content=" " + rng.choice(WORDS)) for _ in range(text_deltas)]
+
+    for i in range(tool_calls):
+        arguments = json.dumps({"message": sentence(rng, argument_deltas * 3), "context": "bar"})
+        step = max(1, len(arguments) // argument_deltas)
+        chunks.append(_chunk(tool_calls=[_tool_delta(f"call_{i:06d}", "unknown_tool", "")]))
+        for start in range(0, len(arguments), step):
+            chunks.append(_chunk(tool_calls=[_tool_delta(None, None, arguments[start:start + step])]))
+
+    chunks.append(_chunk(finish_reason="tool_calls" if tool_calls else "stop"))
+    usage = SimpleNamespace(prompt_tokens=1200, completion_tokens=text_deltas)
+    chunks.append(SimpleNamespace(id="chatcmpl-benchmark", choices=[], usage=usage))
+    return chunks
+
+
+def pickup_message(words, seed=0):
+    rng = random.Random(seed)
+    return "Did it hurt when you fell from heaven? " + sentence(rng, words) + "!"
+
+
+def corpus_lines(lines, seed=0):
+    """A pickup line corpus of the given size"""
+    rng = random.Random(seed)
+    return [sentence(rng, rng.randint(6, 16)) + rng.choice(["?", "!", "."]) for _ in range(lines)]
+
+
+def simulation_text(exchanges, seed=0):
+    rng = random.Random(seed)
+    lines = ["Date Setting: A quiet rooftop lounge with string lights", ""]
+    for _ in range(exchanges):
+        lines.append(f"You: {sentence(rng, 15)}")
+        lines.append(f"Date: {sentence(rng, 20)}")
+    lines.append("")
+    lines.append("1. Overall assessment: 7/10")
+    return "\n".join(lines)
@@ -0,0 +1,282 @@
+"""Microbenchmarks for the CPU-bound helpers that run on every request.
+
+Usage:
+    python -m benchmarks.microbench                    # compare against the baseline
+    python -m benchmarks.microbench --update-baseline  # record a new baseline
+    python -m benchmarks.microbench --only stream_text --threshold 0.1
+
+Each case is timed in several rounds, and every round also times a fixed
+calibration workload right before the case. A case's cost is the median over
+the rounds of its fastest sample divided by the calibration's, which cancels
+out how fast the machine happens to be running at that moment (raw timings on
+a shared machine swing by a third between runs of the same tree; the ratio
+stays within a few percent). That relative cost is compared against
+benchmarks/baseline.json, and the run exits with status 1 when any case is
+costlier than the baseline by more than the threshold (BENCH_THRESHOLD,
+default 0.25 = 25%).
+
+The ratio still depends on the CPU and Python version, so baseline.json is only
+valid on the machine it was recorded on: regenerate it with --update-baseline
+(on the commit you compare against) before comparing on a new machine.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+# The OpenAI client refuses to start without a key
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+# The fake completions are called far more often than any real upstream budget allows
+os.environ.setdefault("RATE_LIMIT_OPENAI_CHAT_RPM", "1000000000")
+# Files the benchmark writes; the cache goes here too unless CACHE_PATH is set, so a
+# run neither reads nor pollutes the app's cache in the shared temp directory
+BENCH_DIR = tempfile.mkdtemp(prefix="rizz-bench-")
+os.environ.setdefault("CACHE_PATH", os.path.join(BENCH_DIR, "cache.sqlite3"))
+
+from api import index
+from api.utils import tools
+from api.utils.clients import set_openai_client
+from api.utils.line_index import LineIndex, build_index
+from api.utils.partial_json import PartialJSONParser
+from api.utils.prompt import convert_to_openai_messages
+
+from . import inputs
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+DEFAULT_THRESHOLD = float(os.environ.get("BENCH_THRESHOLD", "0.25"))
+
+
+class FakeCompletions:
+    """Stands in for client.chat.completions and replays prepared chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def create(self, **kwargs):
+        return iter(self.chunks)
+
+
+class FakeClient:
+    def __init__(self, chunks):
+        self.chat = type("FakeChat", (), {})()
+        self.chat.completions = FakeCompletions(chunks)
+
+
+def bench_convert(**kwargs):
+    messages = inputs.history(**kwargs)
+    return lambda: convert_to_openai_messages(messages)
+
+
+def bench_stream_text(**kwargs):
+    fake_client = FakeClient(inputs.completion_chunks(**kwargs))
+
+    def run():
+        set_openai_client(fake_client)
+        try:
+            for _ in index.stream_text([]):
+                pass
+        finally:
+            set_openai_client(None)
+
+    return run
+
+
+def bench_evaluate_rizz(words):
+    message = inputs.pickup_message(words)
+
+    def run():
+        random.seed(0)
+        tools.evaluate_rizz(message, context="bar")
+
+    return run
+
+
+def bench_date_lines(exchanges):
+    text = inputs.simulation_text(exchanges)
+    return lambda: tools.extract_date_responses(text)
+
+
+def bench_partial_json(characters, delta_size=4):
+    text = json.dumps({"message": inputs.pickup_message(characters // 6), "context": "bar"})
+    deltas = [text[start:start + delta_size] for start in range(0, len(text), delta_size)]
+
+    def run():
+        parser = PartialJSONParser()
+        for delta in deltas:
+            parser.feed(delta)
+
+    return run
+
+
+def bench_line_index(lines):
+    path = os.path.join(BENCH_DIR, "lines.idx")
+    build_index(inputs.corpus_lines(lines), path)
+    index = LineIndex(path)
+    message = inputs.pickup_message(8)
+    return lambda: index.best_match(message)
+
+
+CASES = {
+    "convert.long_history": lambda: bench_convert(messages=500),
+    "convert.many_tool_invocations": lambda: bench_convert(messages=40, tool_calls_per_message=25),
+    "convert.large_attachments": lambda: bench_convert(messages=20, attachment_bytes=512 * 1024),
+    "convert.long_messages": lambda: bench_convert(messages=20, words_per_message=5000),
+    "stream_text.text_only": lambda: bench_stream_text(text_deltas=2000),
+    "stream_text.many_tool_calls": lambda: bench_stream_text(text_deltas=50, tool_calls=20, argument_deltas=50),
+    "partial_json.short_arguments": lambda: bench_partial_json(characters=200),
+    "partial_json.long_arguments": lambda: bench_partial_json(characters=20000),
+    "evaluate_rizz.short": lambda: bench_evaluate_rizz(words=8),
+    "evaluate_rizz.long_message": lambda: bench_evaluate_rizz(words=5000),
+    "line_index.large_corpus": lambda: bench_line_index(lines=20000),
+    "date_lines.typical": lambda: bench_date_lines(exchanges=4),
+    "date_lines.long_dialogue": lambda: bench_date_lines(exchanges=2000),
+}
+
+
+def calibration():
+    """A fixed mix of the work the cases do (JSON, string formatting, dict lookups)"""
+    data = {"id": "call_0", "args": {"message": "hey " * 20, "score": 7.5}, "done": False}
+    for i in range(200):
+        text = json.dumps(data)
+        frame = f"0:{text}\n".encode()
+        json.loads(text)["args"].get("message", frame)
+
+
+def measure(fn, repeat, min_time):
+    """Returns per-call timings, calibrating the loop count so each sample lasts at least min_time"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+        loops = 1
+        while True:
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time or loops >= 1 << 20:
+                break
+            loops *= 2
+
+        samples = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - start) / loops)
+    return samples
+
+
+def measure_relative(cases, rounds, repeat, min_time):
+    """
+    Times each case against the calibration workload, measured right before it so
+    both see the same machine conditions. Every round goes through all the cases,
+    so a burst of load on the machine spoils one round of several cases rather
+    than every round of one.
+
+    Returns:
+        dict: name -> median over the rounds of the fastest sample ("min"), of the sample
+            medians ("median") and of the fastest sample relative to the calibration's ("relative")
+    """
+    timings = {name: {"min": [], "median": [], "relative": []} for name in cases}
+    for _ in range(rounds):
+        for name, fn in cases.items():
+            reference = min(measure(calibration, repeat, min_time))
+            samples = measure(fn, repeat, min_time)
+            timings[name]["min"].append(min(samples))
+            timings[name]["median"].append(statistics.median(samples))
+            timings[name]["relative"].append(min(samples) / reference)
+    return {
+        name: {statistic: statistics.median(values) for statistic, values in timing.items()}
+        for name, timing in timings.items()
+    }
+
+
+def machine():
+    """The CPU model, which relative costs depend on"""
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        data = json.load(f)
+    if data.get("python") != platform.python_version() or data.get("host", machine()) != machine():
+        print(
+            f"Warning: {path} was recorded with Python {data.get('python')} on {data.get('host', data.get('machine'))}; "
+            "regenerate it with --update-baseline on this machine before trusting the comparison"
+        )
+    return data.get("results", {})
+
+
+def save_baseline(path, results):
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "host": machine(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--only", action="append", default=[], help="Run only cases starting with this prefix")
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline(args.baseline)
+    cases = {
+        name: factory()
+        for name, factory in CASES.items()
+        if not args.only or any(name.startswith(prefix) for prefix in args.only)
+    }
+    results = measure_relative(cases, args.rounds, args.repeat, args.min_time)
+    regressions = []
+
+    for name, result in results.items():
+        line = f"{name:40s} {result['min'] * 1e6:12.1f} us {result['relative']:9.3f}x calibration"
+        previous = baseline.get(name)
+        if previous and "relative" in previous:
+            change = result["relative"] / previous["relative"] - 1
+            line += f"  {change:+7.1%} vs baseline"
+            if change > args.threshold:
+                regressions.append(name)
+                line += "  REGRESSION"
+        print(line)
+
+    if args.update_baseline:
+        merged = dict(baseline)
+        merged.update(results)
+        save_baseline(args.baseline, merged)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"{len(regressions)} case(s) regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
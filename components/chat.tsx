@@ -22,7 +22,9 @@ export function Chat() {
     isLoading,
     stop,
   } = useChat({
-    maxSteps: 4,
+    // The server runs the tool steps itself and streams the follow-up on the same response
+    api: "/api/chat?max_steps=4",
+    maxSteps: 1,
     onError: (error) => {
       if (error.message.includes("Too many requests")) {
         toast.error(
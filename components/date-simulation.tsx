@@ -48,6 +48,8 @@ interface DateSimulationProps {
 interface DateSimulationResult {
   scenario: string;
   image_url: string;
+  // Chat-sized copy of image_url, when the server cached the generated image
+  optimized_image_url?: string;
   context: string;
   analysis: {
     overall_score: number;
@@ -66,11 +68,13 @@ interface DateSimulationResult {
 // Add image error boundary component
 interface ImageWithFallbackProps {
   src: string;
+  // Tried before the placeholder, e.g. the full-size image when src is a resized copy
+  fallbackSrc?: string;
   alt: string;
   className?: string;
 }
 
-const ImageWithFallback = ({ src, alt, className }: ImageWithFallbackProps) => {
+const ImageWithFallback = ({ src, fallbackSrc, alt, className }: ImageWithFallbackProps) => {
   const [imgSrc, setImgSrc] = useState(src);
   const [hasError, setHasError] = useState(false);
 
@@ -80,7 +84,9 @@ const ImageWithFallback = ({ src, alt, className }: ImageWithFallbackProps) => {
   }, [src]);
 
   const handleError = () => {
-    if (!hasError) {
+    if (fallbackSrc && imgSrc !== fallbackSrc) {
+      setImgSrc(fallbackSrc);
+    } else if (!hasError) {
       setHasError(true);
       setImgSrc(
         "https://placehold.co/600x400/9333ea/ffffff?text=Image+Unavailable"
@@ -311,6 +317,11 @@ export const DateSimulation: FC<DateSimulationProps> = ({
       setIsImageLoading(true);
 
       const img = new Image();
+      // The resized copy first; it is cached per server instance, so fall back to the original
+      const sources = [simulationResult.optimized_image_url, simulationResult.image_url].filter(
+        (source): source is string => Boolean(source)
+      );
+      let sourceIndex = 0;
 
       // Set a 15-second timeout for image loading
       const loadingTimeout = setTimeout(() => {
@@ -326,6 +337,11 @@ export const DateSimulation: FC<DateSimulationProps> = ({
       };
 
       img.onerror = () => {
+        sourceIndex += 1;
+        if (sourceIndex < sources.length) {
+          img.src = sources[sourceIndex];
+          return;
+        }
         clearTimeout(loadingTimeout);
         setIsImageLoading(false);
         toast.error("Failed to load image. Using fallback image.", {
@@ -333,7 +349,7 @@ export const DateSimulation: FC<DateSimulationProps> = ({
         });
       };
 
-      img.src = simulationResult.image_url;
+      img.src = sources[0];
 
       return () => {
         clearTimeout(loadingTimeout);
@@ -343,7 +359,7 @@ export const DateSimulation: FC<DateSimulationProps> = ({
     } else {
       setIsImageLoading(false);
     }
-  }, [simulationResult?.image_url]);
+  }, [simulationResult?.image_url, simulationResult?.optimized_image_url]);
 
   // Add to the existing useEffect at the top of the component
   useEffect(() => {
@@ -1274,7 +1290,12 @@ export const DateSimulation: FC<DateSimulationProps> = ({
                 ) : (
                   // Actual image when loaded
                   <ImageWithFallback
-                    src={simulationResult.image_url || FALLBACK_IMAGE_URL}
+                    src={
+                      simulationResult.optimized_image_url ||
+                      simulationResult.image_url ||
+                      FALLBACK_IMAGE_URL
+                    }
+                    fallbackSrc={simulationResult.image_url}
                     alt="Date scenario visualization"
                     className="w-full h-auto object-cover transition-all duration-300"
                   />
@@ -63,7 +63,8 @@ export const PreviewMessage = ({
                         />
                       ) : toolName === "generate_rizz_image" ? (
                         <RizzImage
-                          imageUrl={result.url}
+                          imageUrl={result.optimized_url || result.url}
+                          fallbackUrl={result.url}
                           prompt={result.prompt}
                           context={result.context}
                         />
@@ -112,7 +113,7 @@ export const PreviewMessage = ({
                           category: "",
                           emojis: [],
                         }}
-                        userInput=""
+                        userInput={toolInvocation.args?.message ?? ""}
                       />
                     ) : toolName === "generate_rizz_image" ? (
                       <RizzImage isLoading={true} imageUrl="" prompt="" />
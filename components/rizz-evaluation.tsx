@@ -221,7 +221,11 @@ export const RizzEvaluation: FC<RizzEvaluationProps> = ({
             <div className="h-6 bg-muted rounded-md w-1/3"></div>
             <div className="h-8 w-8 rounded-full bg-muted"></div>
           </div>
-          <div className="h-12 bg-muted rounded-md"></div>
+          {userInput ? (
+            <p className="text-white italic">&quot;{userInput}&quot;</p>
+          ) : (
+            <div className="h-12 bg-muted rounded-md"></div>
+          )}
           <div className="grid grid-cols-3 gap-4">
             <div className="h-24 bg-muted rounded-md"></div>
             <div className="h-24 bg-muted rounded-md"></div>
@@ -1,12 +1,14 @@
 "use client";
 
-import { FC } from "react";
+import { FC, useEffect, useState } from "react";
 import { motion } from "framer-motion";
 import { Download, ImageIcon, Sparkles } from "lucide-react";
 import { Button } from "./ui/button";
 
 interface RizzImageProps {
   imageUrl: string;
+  // Full-size image, shown if imageUrl (a resized copy) fails to load and used for downloads
+  fallbackUrl?: string;
   prompt: string;
   context?: string;
   isLoading?: boolean;
@@ -14,10 +16,24 @@ interface RizzImageProps {
 
 export const RizzImage: FC<RizzImageProps> = ({
   imageUrl,
+  fallbackUrl,
   prompt,
   context,
   isLoading = false,
 }) => {
+  const [src, setSrc] = useState(imageUrl);
+
+  useEffect(() => {
+    setSrc(imageUrl);
+  }, [imageUrl]);
+
+  // Resized copies are cached per server instance, so another one may not have it
+  const handleError = () => {
+    if (fallbackUrl && src !== fallbackUrl) {
+      setSrc(fallbackUrl);
+    }
+  };
+
   if (isLoading) {
     return (
       <div className="bg-background/50 backdrop-blur-lg rounded-xl p-4 shadow-md border border-pink-500/20 animate-pulse">
@@ -36,7 +52,7 @@ export const RizzImage: FC<RizzImageProps> = ({
   // Handle image download
   const handleDownload = () => {
     const link = document.createElement("a");
-    link.href = imageUrl;
+    link.href = fallbackUrl || imageUrl;
     link.download = `rizz-image-${Date.now()}.png`;
     document.body.appendChild(link);
     link.click();
@@ -70,8 +86,9 @@ export const RizzImage: FC<RizzImageProps> = ({
 
       <div className="relative overflow-hidden">
         <img
-          src={imageUrl}
+          src={src}
           alt={`AI generated visualization of: ${prompt}`}
+          onError={handleError}
           className="w-full object-cover"
         />
         <div className="absolute bottom-0 left-0 right-0 bg-gradient-to-t from-black/70 to-transparent p-3">
@@ -0,0 +1,183 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.utils import admission
+from api.utils.admission import AdmissionRejected, ConcurrencyLimiter, TokenBucket, get_bucket, get_limiter
+from api.utils.deadline import Deadline, use_deadline
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(admission.time, "monotonic", clock)
+    return clock
+
+
+def wait_until(condition, timeout=2):
+    give_up = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < give_up
+        time.sleep(0.005)
+
+
+def test_limiter_admits_up_to_its_concurrency():
+    limiter = ConcurrencyLimiter("test", 2, 0)
+    limiter.acquire()
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire()
+    assert rejected.value.reason == "over capacity"
+    assert rejected.value.retry_after >= 1
+    limiter.release()
+    limiter.acquire()
+    assert limiter.snapshot()["active"] == 2
+    assert limiter.snapshot()["rejected"] == 1
+
+
+def test_release_hands_the_slot_to_the_oldest_waiter():
+    limiter = ConcurrencyLimiter("test", 1, 2)
+    limiter.acquire()
+    order = []
+
+    def wait(name):
+        limiter.acquire(timeout=2)
+        order.append(name)
+
+    threads = [threading.Thread(target=wait, args=(name,)) for name in ("first", "second")]
+    threads[0].start()
+    wait_until(lambda: limiter.snapshot()["queued"] == 1)
+    threads[1].start()
+    wait_until(lambda: limiter.snapshot()["queued"] == 2)
+
+    limiter.release()
+    wait_until(lambda: order == ["first"])
+    limiter.release()
+    for thread in threads:
+        thread.join(2)
+    assert order == ["first", "second"]
+    # The last waiter still holds its slot
+    assert limiter.snapshot()["active"] == 1
+    assert limiter.snapshot()["queued"] == 0
+
+
+def test_waiter_gives_up_after_its_timeout():
+    limiter = ConcurrencyLimiter("test", 1, 1)
+    limiter.acquire()
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire(timeout=0.01)
+    assert rejected.value.reason == "saturated"
+    assert limiter.snapshot()["queued"] == 0
+    assert limiter.snapshot()["rejected"] == 1
+
+
+def test_wait_never_outlasts_the_request_deadline():
+    limiter = ConcurrencyLimiter("test", 1, 1, queue_timeout=10)
+    limiter.acquire()
+    started = time.monotonic()
+    with use_deadline(Deadline(0.05)):
+        with pytest.raises(AdmissionRejected):
+            limiter.acquire()
+    assert time.monotonic() - started < 1
+
+
+def test_slot_is_released_on_error():
+    limiter = ConcurrencyLimiter("test", 1, 0)
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            raise RuntimeError("tool failed")
+    assert limiter.snapshot()["active"] == 0
+
+
+def test_async_waiter_gets_the_released_slot():
+    async def main():
+        limiter = ConcurrencyLimiter("test", 1, 1)
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async(timeout=2))
+        await asyncio.sleep(0.01)
+        assert not waiter.done()
+        limiter.release()
+        await waiter
+        return limiter.snapshot()
+
+    snapshot = asyncio.run(main())
+    assert snapshot["active"] == 1
+    assert snapshot["admitted"] == 2
+
+
+def test_cancelled_async_waiter_leaves_the_queue():
+    async def main():
+        limiter = ConcurrencyLimiter("test", 1, 1)
+        await limiter.acquire_async()
+        waiter = asyncio.ensure_future(limiter.acquire_async(timeout=2))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release()
+        return limiter.snapshot()
+
+    snapshot = asyncio.run(main())
+    assert snapshot["active"] == 0
+    assert snapshot["queued"] == 0
+
+
+def test_limits_come_from_the_environment(monkeypatch):
+    monkeypatch.setattr(admission, "_limiters", {})
+    monkeypatch.setenv("ADMISSION_TOOL_SIMULATE_DATE_CONCURRENCY", "7")
+    monkeypatch.setenv("ADMISSION_TOOL_SIMULATE_DATE_QUEUE", "not a number")
+    limiter = get_limiter("tool:simulate_date")
+    assert (limiter.max_concurrent, limiter.max_queue) == (7, admission.DEFAULT_LIMITS["tool:simulate_date"][1])
+    assert get_limiter("tool:simulate_date") is limiter
+
+
+def test_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket("test", 60, burst=3)
+    assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    # One token a second
+    assert bucket.reserve() == pytest.approx(1.0)
+    assert bucket.reserve() == pytest.approx(2.0)
+    assert bucket.snapshot()["throttled"] == 2
+
+
+def test_bucket_refills_over_time(clock):
+    bucket = TokenBucket("test", 60, burst=2)
+    bucket.reserve()
+    bucket.reserve()
+    clock.now += 1.5
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.5)
+    clock.now += 100
+    # Never more than the burst
+    assert bucket.snapshot()["capacity"] == 2
+    assert [bucket.reserve() for _ in range(2)] == [0.0, 0.0]
+    assert bucket.reserve() > 0
+
+
+def test_bucket_rejects_waits_longer_than_allowed(clock):
+    bucket = TokenBucket("test", 6, burst=1)
+    bucket.reserve()
+    with pytest.raises(AdmissionRejected) as rejected:
+        bucket.reserve(max_wait=5)
+    assert rejected.value.reason == "rate limited"
+    assert rejected.value.retry_after == 10
+    # A rejected caller doesn't use up a token
+    assert bucket.reserve(max_wait=10) == pytest.approx(10.0)
+
+
+def test_bucket_rate_comes_from_the_environment(monkeypatch):
+    monkeypatch.setattr(admission, "_buckets", {})
+    monkeypatch.setenv("RATE_LIMIT_OPENAI_IMAGES_RPM", "120")
+    bucket = get_bucket("openai-images")
+    assert bucket.rate == 2
+    assert bucket.capacity == 12
@@ -0,0 +1,165 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from api.utils import cache as cache_module
+from api.utils import tools
+from api.utils.cache import MISSING, Cache, LocalTier, SQLiteTier, cache_key, cached, cached_async
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return SQLiteTier(str(tmp_path / "cache.sqlite3"))
+
+
+@pytest.fixture
+def cache(shared, monkeypatch):
+    cache = Cache(LocalTier(), shared)
+    monkeypatch.setattr(cache_module, "_cache", cache)
+    return cache
+
+
+def counter(*values):
+    """A compute function returning values in turn, counting its calls"""
+    values = list(values)
+    calls = []
+
+    def compute():
+        calls.append(None)
+        return values.pop(0)
+
+    compute.calls = calls
+    return compute
+
+
+def test_key_is_stable_across_argument_order():
+    assert cache_key({"a": 1, "b": 2}) == cache_key({"b": 2, "a": 1})
+    assert cache_key("a", 1) != cache_key("a", 2)
+
+
+def test_miss_computes_and_hit_reuses(cache):
+    compute = counter({"text": "hi"}, {"text": "other"})
+    assert cached("speech", "k", compute) == {"text": "hi"}
+    assert cached("speech", "k", compute) == {"text": "hi"}
+    assert len(compute.calls) == 1
+    stats = cache.snapshot()["namespaces"]["speech"]
+    assert (stats["misses"], stats["local_hits"], stats["writes"]) == (1, 1, 1)
+
+
+def test_none_is_not_cached_by_default(cache):
+    compute = counter(None, "ok")
+    assert cached("weather", "k", compute) is None
+    assert cached("weather", "k", compute) == "ok"
+    assert len(compute.calls) == 2
+
+
+def test_should_cache_decides_what_is_kept(cache):
+    compute = counter({"audio": None}, {"audio": "abc"}, {"audio": "def"})
+    should_cache = lambda speech: speech["audio"] is not None
+    assert cached("speech", "k", compute, should_cache=should_cache) == {"audio": None}
+    assert cached("speech", "k", compute, should_cache=should_cache) == {"audio": "abc"}
+    assert cached("speech", "k", compute, should_cache=should_cache) == {"audio": "abc"}
+    assert len(compute.calls) == 2
+
+
+def test_invalid_hit_is_recomputed_and_replaced(cache):
+    cache.set("image", "k", {"image_id": "gone"})
+    compute = counter({"image_id": "new"})
+    is_valid = lambda image: image["image_id"] != "gone"
+    assert cached("image", "k", compute, is_valid=is_valid) == {"image_id": "new"}
+    assert cache.get("image", "k") == {"image_id": "new"}
+    assert cached("image", "k", compute, is_valid=is_valid) == {"image_id": "new"}
+    assert len(compute.calls) == 1
+
+
+def test_callers_get_their_own_copy(cache):
+    cached("weather", "k", lambda: {"temperature": 20})
+    cache.get("weather", "k")["temperature"] = 30
+    assert cache.get("weather", "k") == {"temperature": 20}
+
+
+def test_expired_entries_are_misses(cache):
+    cache.set("weather", "k", "old", ttl=0)
+    assert cache.get("weather", "k") is MISSING
+
+
+def test_other_processes_share_the_sqlite_tier(cache, shared):
+    cache.set("transcription", "k", "hello")
+    other = Cache(LocalTier(), SQLiteTier(shared.path))
+    assert other.get("transcription", "k") == "hello"
+    assert other.get("transcription", "k") == "hello"
+    stats = other.snapshot()["namespaces"]["transcription"]
+    # The shared hit is copied into the local tier
+    assert (stats["shared_hits"], stats["local_hits"]) == (1, 1)
+
+
+def test_shared_tier_errors_are_misses():
+    class BrokenTier:
+        def get(self, namespace, key):
+            raise sqlite3.OperationalError("database is locked")
+
+        def set(self, namespace, key, encoded, expires_at):
+            raise sqlite3.OperationalError("database is locked")
+
+        def usage(self):
+            raise sqlite3.OperationalError("database is locked")
+
+    cache = Cache(LocalTier(), BrokenTier())
+    assert cache.get("weather", "k") is MISSING
+    cache.set("weather", "k", "sunny")
+    # Still cached in the process
+    assert cache.get("weather", "k") == "sunny"
+    assert cache.snapshot()["namespaces"]["weather"]["errors"] == 2
+
+
+def test_local_tier_evicts_least_recently_used():
+    local = LocalTier(max_bytes=10)
+    local.set("a", "1", "xxxx", float("inf"))
+    local.set("a", "2", "xxxx", float("inf"))
+    local.get("a", "1")
+    assert local.set("b", "3", "xxxx", float("inf")) == ["a"]
+    assert local.get("a", "1") is not None
+    assert local.get("a", "2") is None
+    # Too big to keep at all
+    assert local.set("a", "4", "x" * 11, float("inf")) == []
+    assert local.get("a", "4") is None
+
+
+def test_sqlite_tier_prunes_to_its_size_limit(shared):
+    shared.max_bytes = 100
+    for number in range(5):
+        shared.set("speech", str(number), "x" * 30, float("inf"))
+    shared.set("speech", "expired", "x", 0)
+    pruned = shared.prune()
+    assert pruned["expired"] == {"speech": 1}
+    # Down to 90% of the limit, so the next writes don't prune again
+    assert pruned["evicted"] == {"speech": 2}
+    assert shared.usage()["speech"]["bytes"] <= 90
+
+
+def test_cached_async_paths(cache):
+    calls = []
+
+    async def compute():
+        calls.append(None)
+        return None if len(calls) == 1 else {"text": "hi"}
+
+    async def main():
+        first = await cached_async("transcription", "k", compute)
+        second = await cached_async("transcription", "k", compute)
+        third = await cached_async("transcription", "k", compute)
+        invalid = await cached_async("transcription", "k", compute, is_valid=lambda value: False)
+        return first, second, third, invalid
+
+    assert asyncio.run(main()) == (None, {"text": "hi"}, {"text": "hi"}, {"text": "hi"})
+    assert len(calls) == 3
+
+
+def test_sampled_completions_are_not_cacheable(monkeypatch):
+    assert tools.completion_cacheable({"temperature": 0})
+    assert not tools.completion_cacheable({"temperature": 0.7})
+    # The API samples at temperature 1 by default
+    assert not tools.completion_cacheable({})
+    monkeypatch.setattr(tools, "CACHE_SAMPLED_COMPLETIONS", True)
+    assert tools.completion_cacheable({"temperature": 0.7})
@@ -0,0 +1,87 @@
+import pytest
+
+from api.utils import line_index
+from api.utils.line_index import LineIndex, build_index, find_known_line
+
+CORPUS = [
+    "Did it hurt when you fell from heaven?",
+    "Are you a parking ticket? Because you've got fine written all over you.",
+    "Did we have class together? I could have sworn we had chemistry.",
+    "Do you believe in love at first sight, or should I walk by again?",
+    "Is your name Google? Because you have everything I've been searching for.",
+    "Are you wifi? Because I'm feeling a connection.",
+    "If you were a vegetable, you'd be a cute-cumber.",
+    "Are you from Tennessee? Because you're the only ten I see.",
+    "Are you a magician? Because whenever I look at you, everyone else disappears.",
+    "Is your dad a baker? Because you're a cutie pie.",
+    "Do you have a map? I keep getting lost in your eyes.",
+    "Are you a camera? Because every time I look at you, I smile.",
+]
+
+# Known setups with their own punchline, another punchline, none at all, or inside a longer sentence
+GENERIC_EXAMPLES = [
+    "Did it hurt when you fell from heaven?",
+    "Are you a parking ticket? Because you look like trouble.",
+    "Is your name Google? Cause you're the answer to my questions",
+    "Are you wifi? I'd like to connect",
+    "are you a magician",
+    "Is your dad a baker? You're sweet.",
+    "Did we have class together?",
+    "Hey, do you believe in love at first sight, or nah",
+    "If you were a vegetable, you'd be a carrot",
+    "so are you from tennessee or what",
+    "ok so are you a magician?",
+]
+
+ORIGINAL_EXAMPLES = [
+    "Hey, I saw you reading Dune at the cafe. Who's your favorite character?",
+    "Your dog is adorable, what's his name?",
+    "Are you going to the concert on Friday?",
+    "Are you a cat person?",
+    "Do you have a map of the campus?",
+    "I'm a big fan of the magician at the fair",
+]
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    path = str(tmp_path / "lines.idx")
+    build_index(CORPUS, path)
+    index = LineIndex(path)
+    monkeypatch.setattr(line_index, "get_line_index", lambda: index)
+    return index
+
+
+@pytest.mark.parametrize("message", GENERIC_EXAMPLES)
+def test_known_lines_and_setups_are_found(index, message):
+    assert find_known_line(message) is not None
+
+
+@pytest.mark.parametrize("message", ORIGINAL_EXAMPLES)
+def test_original_messages_are_not_flagged(index, message):
+    assert find_known_line(message) is None
+
+
+def test_match_returns_the_whole_line(index):
+    similarity, line = find_known_line("Are you a parking ticket? Because you look like trouble.")
+    assert line == CORPUS[1]
+    assert similarity >= line_index.GENERIC_LINE_SIMILARITY
+
+
+def test_exact_line_is_a_full_match(index):
+    assert index.best_match(CORPUS[0]) == (1.0, CORPUS[0])
+
+
+def test_phrase_has_to_end_a_clause(index):
+    assert index.find_phrase("well, are you a magician? asking for a friend") == CORPUS[8]
+    assert index.find_phrase("are you a magician fan") is None
+
+
+def test_index_of_another_version_is_rejected(tmp_path):
+    path = tmp_path / "lines.idx"
+    build_index(CORPUS, str(path))
+    content = bytearray(path.read_bytes())
+    content[4] = line_index.VERSION + 1
+    path.write_bytes(bytes(content))
+    with pytest.raises(ValueError):
+        LineIndex(str(path))
@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from api.utils.partial_json import PartialJSONParser
+
+DOCUMENT = json.dumps({
+    "message": 'Say "hi"\\ to\nthe café ☕ and \U0001F600',
+    "context": "coffee shop",
+    "scores": [1, -2.5, 3e2, True, False, None],
+    "nested": {"empty": {}, "list": [], "deep": [{"a": "b"}]},
+})
+
+
+def parse(*pieces):
+    parser = PartialJSONParser()
+    for piece in pieces:
+        parser.feed(piece)
+    return parser
+
+
+def test_whole_document():
+    parser = parse(DOCUMENT)
+    assert parser.complete
+    assert parser.error is None
+    assert parser.value() == json.loads(DOCUMENT)
+
+
+@pytest.mark.parametrize("split", range(1, len(DOCUMENT)))
+def test_any_chunk_boundary(split):
+    parser = parse(DOCUMENT[:split], DOCUMENT[split:])
+    assert parser.complete
+    assert parser.value() == json.loads(DOCUMENT)
+
+
+def test_one_character_at_a_time():
+    assert parse(*DOCUMENT).value() == json.loads(DOCUMENT)
+
+
+@pytest.mark.parametrize("pieces, expected", [
+    (['{"message": "a\\', 'nb"}'], "a\nb"),
+    (['{"message": "caf\\u00', 'e9"}'], "café"),
+    (['{"message": "\\ud83d', '\\ude00"}'], "\U0001F600"),
+    (['{"message": "say \\"', 'hi\\""}'], 'say "hi"'),
+    (['{"message": "back\\\\', '"}'], "back\\"),
+])
+def test_escapes_split_between_pieces(pieces, expected):
+    parser = parse(*pieces)
+    assert parser.complete
+    assert parser.value() == {"message": expected}
+
+
+def test_open_string_is_closed_in_the_value():
+    parser = parse('{"message": "Hey th')
+    assert not parser.complete
+    assert parser.value() == {"message": "Hey th"}
+    parser.feed('ere", "context": "b')
+    assert parser.value() == {"message": "Hey there", "context": "b"}
+
+
+def test_unfinished_keys_numbers_and_literals_are_left_out():
+    assert parse('{"score": 4').value() == {}
+    assert parse('{"score": 4, "mess').value() == {"score": 4}
+    assert parse('[1, tru').value() == [1]
+    assert parse('[1, true').value() == [1]
+    assert parse('[1, true]').value() == [1, True]
+
+
+def test_nothing_parsed_yet():
+    assert parse("").value() is None
+    assert parse("  ").value() is None
+
+
+def test_changes_count_growth_of_the_value():
+    parser = parse('{"mess')
+    before = parser.changes
+    # Growing a key or whitespace doesn't change what the client can show
+    parser.feed('age"  :  ')
+    assert parser.changes == before
+    parser.feed('"H')
+    assert parser.changes > before
+    before = parser.changes
+    parser.feed("ey")
+    assert parser.changes > before
+
+
+def test_complete_once_the_top_level_value_is_closed():
+    parser = parse('{"a": [1, {"b": "c"}]')
+    assert not parser.complete
+    parser.feed("}")
+    assert parser.complete
+    # Anything after the end is ignored
+    parser.feed(', "extra": 1}')
+    assert parser.value() == {"a": [1, {"b": "c"}]}
+    assert parser.error is None
+
+
+@pytest.mark.parametrize("document", ['{"a" 1}', '{"a": tru}', '{"a": 1 "b"}', '{1: 2}', '[1,]', '{"a": "\\x"}'])
+def test_invalid_documents_set_error(document):
+    parser = parse(document)
+    assert parser.error is not None
+    assert not parser.complete
@@ -0,0 +1,168 @@
+import asyncio
+import time
+
+import pytest
+import requests
+
+from api.utils import resilience
+from api.utils.admission import AdmissionRejected
+from api.utils.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_upstream,
+    call_upstream_async,
+    find_breaker,
+    get_breaker,
+)
+
+
+@pytest.fixture(autouse=True)
+def fresh_breakers(monkeypatch):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0)
+
+
+def http_error(status):
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(f"{status}", response=response)
+
+
+def failing(*errors):
+    """A call that raises the given errors in turn, then returns "ok" """
+    errors = list(errors)
+    calls = []
+
+    def call():
+        calls.append(None)
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    call.calls = calls
+    return call
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.snapshot()["short_circuited"] == 1
+    assert breaker.snapshot()["opened"] == 1
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=5, reset_timeout=0.05)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_aborted_probe_frees_the_half_open_slot():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.abort_call()
+    breaker.before_call()
+
+
+def test_transient_errors_are_retried():
+    call = failing(requests.ConnectionError(), http_error(503))
+    assert call_upstream("test", call, retries=2) == "ok"
+    assert len(call.calls) == 3
+    assert get_breaker("test").snapshot()["consecutive_failures"] == 0
+
+
+def test_retries_run_out():
+    call = failing(*[requests.Timeout()] * 3)
+    with pytest.raises(requests.Timeout):
+        call_upstream("test", call, retries=1)
+    assert len(call.calls) == 2
+    assert get_breaker("test").snapshot()["consecutive_failures"] == 2
+
+
+def test_client_errors_count_as_the_upstream_answering():
+    breaker = get_breaker("test")
+    breaker.record_failure()
+    call = failing(http_error(400))
+    with pytest.raises(requests.HTTPError):
+        call_upstream("test", call)
+    assert len(call.calls) == 1
+    assert breaker.snapshot()["consecutive_failures"] == 0
+
+
+def test_local_errors_leave_the_breaker_alone():
+    breaker = get_breaker("test")
+    breaker.record_failure()
+    with pytest.raises(KeyError):
+        call_upstream("test", failing(KeyError("bug")))
+    assert breaker.snapshot()["consecutive_failures"] == 1
+
+
+def test_own_limits_dont_count_against_the_upstream():
+    with pytest.raises(AdmissionRejected):
+        call_upstream("test", failing(AdmissionRejected("bucket", 1)))
+    assert get_breaker("test").snapshot()["failures"] == 0
+
+
+def test_open_breaker_stops_retrying(monkeypatch):
+    monkeypatch.setitem(resilience._breakers, "test", CircuitBreaker("test", failure_threshold=1))
+    call = failing(requests.ConnectionError(), requests.ConnectionError())
+    with pytest.raises(requests.ConnectionError):
+        call_upstream("test", call, retries=3)
+    assert len(call.calls) == 1
+    with pytest.raises(CircuitOpenError):
+        call_upstream("test", call)
+    assert len(call.calls) == 1
+
+
+def test_async_calls_share_the_breaker():
+    async def flaky():
+        calls.append(None)
+        if len(calls) == 1:
+            raise requests.ConnectionError()
+        return "ok"
+
+    calls = []
+    assert asyncio.run(call_upstream_async("test", flaky)) == "ok"
+    assert len(calls) == 2
+    assert get_breaker("test").snapshot()["failures"] == 1
+
+
+def test_find_breaker_doesnt_create_one():
+    assert find_breaker("never-called") is None
+    assert "never-called" not in resilience.breaker_snapshot()
+    breaker = get_breaker("called")
+    assert find_breaker("called") is breaker
@@ -0,0 +1,45 @@
+from api.utils.sentences import SentenceBuffer
+
+
+def feed_all(buffer, deltas):
+    return [sentence for delta in deltas for sentence in buffer.feed(delta)] + buffer.flush()
+
+
+def test_empty_deltas_complete_nothing():
+    buffer = SentenceBuffer()
+    assert buffer.feed(None) == []
+    assert buffer.feed("") == []
+    assert buffer.flush() == []
+
+
+def test_stream_with_empty_deltas():
+    deltas = [None, "Hey there, stranger! ", "", "Is it hot in here, or is it", None, " just you? ", "Bye", None]
+    assert feed_all(SentenceBuffer(), deltas) == [
+        "Hey there, stranger!",
+        "Is it hot in here, or is it just you?",
+        "Bye",
+    ]
+
+
+def test_sentence_is_returned_once_complete():
+    buffer = SentenceBuffer()
+    assert buffer.feed("I was going to tell you a joke") == []
+    assert buffer.feed(" about time travel. But you") == ["I was going to tell you a joke about time travel."]
+    assert buffer.flush() == ["But you"]
+
+
+def test_punctuation_split_across_deltas():
+    buffer = SentenceBuffer()
+    assert buffer.feed("Wait, are you serious right now?") == []
+    assert buffer.feed("!\" Then") == ['Wait, are you serious right now?!"']
+    assert buffer.flush() == ["Then"]
+
+
+def test_short_sentences_are_joined():
+    assert feed_all(SentenceBuffer(), ["Hi! ", "Ok. ", "Let me tell you about my day. "]) == [
+        "Hi! Ok. Let me tell you about my day.",
+    ]
+
+
+def test_line_break_ends_a_sentence():
+    assert feed_all(SentenceBuffer(min_chars=1), ["First line\nSecond", " line"]) == ["First line", "Second line"]